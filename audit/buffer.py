@@ -0,0 +1,126 @@
+"""
+Buffer de escritura para registros de auditoría.
+
+Los receptores de señales no escriben un ``AuditLog`` por cada ``save()``:
+encolan la instancia sin guardar y el buffer la persiste con ``bulk_create``.
+
+- Dentro de una transacción, las entradas se acumulan y se escriben en un
+  solo INSERT cuando la transacción hace commit (``transaction.on_commit``).
+  Si la transacción (o un savepoint anidado) se revierte, sus entradas se
+  descartan, igual que ocurría con los INSERT individuales.
+- Dentro de ``audit_buffer()`` (o del middleware ``AuditBufferMiddleware``)
+  las entradas de toda la petición se escriben al salir del bloque.
+- Si el buffer supera ``AUDIT_BUFFER_SIZE`` entradas se vacía de inmediato,
+  lo que mantiene acotada la memoria en comandos de gestión largos.
+- Fuera de cualquier transacción o bloque de buffer se escribe de inmediato.
+
+Con ``AUDIT_ASYNC = True`` la escritura final va al spool local en lugar de
+la base de datos (ver ``audit.spool``). Los lotes que se vacían por tamaño
+dentro de una transacción van siempre a la base de datos, en la misma
+transacción: el spool no se revierte con ella.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import router, transaction
+
+from . import spool
+from naturalmede.batching import CommitBatch
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+DEFAULT_BUFFER_SIZE = 500
+
+
+def get_buffer_size():
+    """Número máximo de entradas en memoria antes de forzar la escritura"""
+    return getattr(settings, 'AUDIT_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)
+
+
+def _get_state():
+    if not hasattr(_state, 'entries'):
+        _state.entries = []      # Entradas listas para escribir
+        _state.depth = 0         # Anidamiento de audit_buffer()
+    return _state
+
+
+def _write(entries, using, use_spool=True):
+    if not entries:
+        return
+    if use_spool and spool.is_enabled() and spool.append(entries):
+        # Modo asíncrono: audit_worker los insertará después
+        return
+    try:
+        AuditLog.objects.using(using).bulk_create(entries, batch_size=get_buffer_size())
+    except Exception:
+        # La auditoría nunca debe romper la operación principal
+        logger.exception("Error escribiendo %s registros de auditoría", len(entries))
+
+
+def flush():
+    """Escribe todas las entradas confirmadas que estén en el buffer"""
+    state = _get_state()
+    entries, state.entries = state.entries, []
+    _write(entries, router.db_for_write(AuditLog))
+
+
+def _commit(pending):
+    """Pasa las entradas de una transacción confirmada al buffer"""
+    state = _get_state()
+    state.entries.extend(pending)
+    if state.depth == 0 or len(state.entries) >= get_buffer_size():
+        flush()
+
+
+# Entradas de la transacción en curso
+_transaction_entries = CommitBatch(_commit)
+
+
+def enqueue(entry):
+    """
+    Encola un ``AuditLog`` sin guardar para escribirlo en lote
+    """
+    state = _get_state()
+    using = router.db_for_write(AuditLog)
+    connection = transaction.get_connection(using)
+
+    if connection.in_atomic_block:
+        pending = _transaction_entries.pending(using)
+        pending.append(entry)
+        if len(pending) >= get_buffer_size():
+            # Transacción larga: escribir dentro de la misma transacción
+            # (sin spool, también en modo asíncrono) para que un rollback
+            # también descarte estos registros
+            batch = pending[:]
+            del pending[:]
+            _write(batch, using, use_spool=False)
+        return
+
+    state.entries.append(entry)
+    if state.depth == 0 or len(state.entries) >= get_buffer_size():
+        flush()
+
+
+@contextmanager
+def audit_buffer():
+    """
+    Agrupa los registros de auditoría generados dentro del bloque y los
+    escribe con un único ``bulk_create`` al salir.
+
+        with audit_buffer():
+            for item in items:
+                item.save()
+    """
+    state = _get_state()
+    state.depth += 1
+    try:
+        yield
+    finally:
+        state.depth -= 1
+        if state.depth == 0:
+            flush()
@@ -1,10 +1,8 @@
 from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from django.utils import timezone
-from django.contrib.contenttypes.models import ContentType
 
-from .models import AuditLog, InventoryTrace
 from .utils import create_inventory_trace
+from .tracker import get_snapshot
 
 
 @receiver(post_save, sender='purchases.PurchaseItem')
@@ -34,7 +32,8 @@ def trace_purchase_receipt(sender, instance, created, **kwargs):
     """
     Rastrea la recepción de productos de compra
     """
-    if created:
+    # purchases.services.receive_purchase registra la trazabilidad en lote
+    if created and not getattr(instance, '_inventory_traced', False):
         # Los items están en la compra relacionada, no en el recibo
         for item in instance.purchase.items.all():
             create_inventory_trace(
@@ -90,20 +89,23 @@ def trace_stock_transfer(sender, instance, created, **kwargs):
 @receiver(post_save, sender='pos.POSSaleItem')
 def trace_pos_sale(sender, instance, created, **kwargs):
     """
-    Rastrea las ventas POS
+    Rastrea las ventas POS guardadas de a una línea (las ventas de
+    ``pos.services.create_sale`` registran su trazabilidad en lote)
     """
-    if created and instance.sale.status == 'completed':
+    if created:
+        sale = instance.sale
+        cost = instance.product.cost_price
         create_inventory_trace(
             movement_type='SALE',
             product=instance.product,
-            warehouse=instance.sale.session.warehouse,
+            warehouse=sale.session.warehouse,
             quantity=-instance.quantity,  # Negativo para salida
-            unit_cost=instance.unit_cost,
-            total_cost=instance.quantity * instance.unit_cost,
-            pos_sale=instance.sale,
+            unit_cost=cost,
+            total_cost=instance.quantity * cost,
+            pos_sale=sale,
             pos_sale_item=instance,
-            user=instance.sale.session.user,
-            notes=f"Venta POS #{instance.sale.id} - Cliente: {instance.sale.customer.name if instance.sale.customer else 'Sin cliente'}"
+            user=sale.session.user,
+            notes=f"Venta POS #{sale.id} - Cliente: {sale.customer.name if sale.customer else 'Sin cliente'}"
         )
 
 
@@ -152,7 +154,9 @@ def trace_stock_adjustments(sender, instance, created, **kwargs):
                 unit_cost=instance.product.price,
                 total_cost=abs(difference) * instance.product.price,
                 user=getattr(instance, '_updated_by', None),
-                notes=f"Ajuste manual de stock: {old_stock} → {instance.quantity}"
+                notes=f"Ajuste manual de stock: {old_stock} → {instance.quantity}",
+                # El stock ya está guardado: el valor previo es el capturado en pre_save
+                stock_before=old_stock,
             )
 
 
@@ -162,100 +166,13 @@ def capture_old_stock(sender, instance, **kwargs):
     Captura el valor anterior del stock antes de la actualización
     """
     if instance.pk:
+        # Usar el snapshot tomado al cargar la instancia si está disponible
+        snapshot = get_snapshot(instance)
+        if snapshot is not None and 'quantity' in snapshot:
+            instance._old_stock = snapshot['quantity']
+            return
         try:
             old_instance = sender.objects.get(pk=instance.pk)
             instance._old_stock = old_instance.quantity
         except sender.DoesNotExist:
             pass
-
-
-def create_inventory_trace(movement_type, product, warehouse, quantity, 
-                          unit_cost=None, total_cost=None, user=None,
-                          purchase=None, purchase_item=None,
-                          stock_transfer=None, stock_transfer_item=None,
-                          pos_sale=None, pos_sale_item=None,
-                          order=None, order_item=None,
-                          supplier=None, batch_number=None, 
-                          expiration_date=None, notes=None, **kwargs):
-    """
-    Función helper para crear trazabilidad de inventario
-    """
-    try:
-        # Si no se especifica warehouse, usar la bodega principal
-        if warehouse is None:
-            from inventory.models import Warehouse
-            warehouse = Warehouse.objects.filter(is_main=True, is_active=True).first()
-            if not warehouse:
-                # Si no hay bodega principal, crear una
-                warehouse = Warehouse.objects.create(
-                    name='Bodega Principal', 
-                    code='PRINCIPAL', 
-                    address='Ubicación Central',
-                    city='Ciudad Principal', 
-                    is_main=True, 
-                    is_active=True
-                )
-        
-        # Obtener stock actual
-        from inventory.models import Stock
-        stock_obj = Stock.objects.filter(
-            product=product, 
-            warehouse=warehouse
-        ).first()
-        
-        stock_before = stock_obj.quantity if stock_obj else 0
-        stock_after = stock_before + quantity
-        
-        # Crear el registro de trazabilidad
-        trace = InventoryTrace.objects.create(
-            movement_type=movement_type,
-            product=product,
-            warehouse=warehouse,
-            quantity=quantity,
-            unit_cost=unit_cost,
-            total_cost=total_cost,
-            stock_before=stock_before,
-            stock_after=stock_after,
-            purchase=purchase,
-            purchase_item=purchase_item,
-            stock_transfer=stock_transfer,
-            stock_transfer_item=stock_transfer_item,
-            pos_sale=pos_sale,
-            pos_sale_item=pos_sale_item,
-            order=order,
-            order_item=order_item,
-            supplier=supplier,
-            batch_number=batch_number,
-            expiration_date=expiration_date,
-            user=user,
-            notes=notes,
-            extra_data=kwargs.get('extra_data')
-        )
-        
-        # Crear también un log de auditoría
-        AuditLog.objects.create(
-            user=user,
-            action='STOCK_MOVEMENT',
-            content_type=ContentType.objects.get_for_model(InventoryTrace),
-            object_id=str(trace.pk),
-            object_repr=str(trace),
-            severity='MEDIUM',
-            app_label='audit',
-            model_name='inventorytrace',
-            message=trace.movement_description,
-            extra_data={
-                'movement_type': movement_type,
-                'product_id': product.id,
-                'warehouse_id': warehouse.id,
-                'quantity': float(quantity),
-                'stock_before': float(stock_before),
-                'stock_after': float(stock_after),
-            }
-        )
-        
-        return trace
-        
-    except Exception as e:
-        # Log del error pero no fallar la operación principal
-        print(f"Error creando trazabilidad de inventario: {str(e)}")
-        return None
@@ -3,19 +3,19 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.core.paginator import Paginator
 from django.db.models import Q, Sum, Count, Avg
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.views.generic import ListView, DetailView
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.core.serializers.json import DjangoJSONEncoder
 from datetime import datetime, timedelta
-import csv
 import json
 from decimal import Decimal
 
 from .models import InventoryTrace, AuditLog
 from catalog.models import Product
 from inventory.models import Warehouse
+from reports.exports import ExportFormatError, choice_labels, export_response, queryset_rows
 
 
 def safe_json_dumps(data):
@@ -191,42 +191,49 @@ def inventory_trace_export(request):
             pass
     
     # Obtener registros
-    traces = InventoryTrace.objects.filter(**filters).select_related(
-        'product', 'warehouse', 'user', 'supplier'
-    ).order_by('-created_at')
-    
-    # Crear respuesta CSV
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="inventory_trace.csv"'
+    traces = InventoryTrace.objects.filter(**filters).order_by('-created_at')
     
-    writer = csv.writer(response)
-    writer.writerow([
+    headers = [
         'Fecha', 'Tipo', 'Producto', 'SKU', 'Bodega', 'Cantidad', 
         'Costo Unit.', 'Costo Total', 'Stock Antes', 'Stock Después',
         'Proveedor', 'Lote', 'Vencimiento', 'Usuario', 'Documento Origen', 'Notas'
-    ])
+    ]
     
-    for trace in traces:
-        writer.writerow([
-            trace.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            trace.get_movement_type_display(),
-            trace.product.name,
-            trace.product.sku,
-            trace.warehouse.name,
-            trace.quantity,
-            trace.unit_cost or '',
-            trace.total_cost or '',
-            trace.stock_before,
-            trace.stock_after,
-            trace.supplier.name if trace.supplier else '',
-            trace.batch_number or '',
-            trace.expiration_date.strftime('%Y-%m-%d') if trace.expiration_date else '',
-            trace.user.username if trace.user else '',
-            trace.get_source_document(),
-            trace.notes or '',
-        ])
+    movement_types = choice_labels(InventoryTrace, 'movement_type')
+    rows = (
+        [
+            created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            movement_types.get(movement_type, movement_type),
+            product_name,
+            product_sku,
+            warehouse_name,
+            quantity,
+            unit_cost or '',
+            total_cost or '',
+            stock_before,
+            stock_after,
+            supplier_name or '',
+            batch_number or '',
+            expiration_date.strftime('%Y-%m-%d') if expiration_date else '',
+            username or '',
+            InventoryTrace.source_document_label(purchase_id, stock_transfer_id, pos_sale_id, order_id),
+            notes or '',
+        ]
+        for (created_at, movement_type, product_name, product_sku, warehouse_name, quantity,
+             unit_cost, total_cost, stock_before, stock_after, supplier_name, batch_number,
+             expiration_date, username, purchase_id, stock_transfer_id, pos_sale_id, order_id,
+             notes) in queryset_rows(traces, (
+            'created_at', 'movement_type', 'product__name', 'product__sku', 'warehouse__name',
+            'quantity', 'unit_cost', 'total_cost', 'stock_before', 'stock_after',
+            'supplier__name', 'batch_number', 'expiration_date', 'user__username',
+            'purchase_id', 'stock_transfer_id', 'pos_sale_id', 'order_id', 'notes',
+        ))
+    )
     
-    return response
+    try:
+        return export_response('inventory_trace', headers, rows, request.GET.get('format', 'csv'))
+    except ExportFormatError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
 
 @login_required
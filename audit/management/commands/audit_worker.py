@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from audit import spool
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola local de auditoría (modo AUDIT_ASYNC) e inserta los registros en lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Registros a insertar por lote (por defecto 500)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Segundos de espera cuando la cola está vacía (por defecto 1)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Vaciar la cola una vez y terminar',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Mostrar métricas de la cola y terminar',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        interval = options['interval']
+
+        if options['stats']:
+            self.show_stats()
+            return
+
+        self.stdout.write(f'Procesando cola de auditoría: {spool.get_spool_path()}')
+
+        total = 0
+        started = time.monotonic()
+        last_report = started
+        try:
+            while True:
+                processed = spool.drain(batch_size)
+                total += processed
+
+                now = time.monotonic()
+                if processed and now - last_report >= 60:
+                    self.report_progress(total, started)
+                    last_report = now
+
+                if processed < batch_size:
+                    if options['once']:
+                        break
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write('\nDetenido por el usuario')
+
+        self.report_progress(total, started)
+
+    def report_progress(self, total, started):
+        elapsed = max(time.monotonic() - started, 0.001)
+        stats = spool.get_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ {total} registros insertados ({total / elapsed:.1f}/s) - '
+                f'pendientes: {stats["pending"]}, '
+                f'inválidos: {stats["dead_letters"]}, '
+                f'más antiguo: {stats["oldest_age_seconds"]}s'
+            )
+        )
+
+    def show_stats(self):
+        stats = spool.get_stats()
+        self.stdout.write('--- Cola de Auditoría ---')
+        self.stdout.write(f'Archivo: {stats["path"]}')
+        self.stdout.write(f'Pendientes: {stats["pending"]} (máximo {stats["max_pending"]})')
+        self.stdout.write(f'Antigüedad del más antiguo: {stats["oldest_age_seconds"]}s')
+        if stats['dead_letters']:
+            self.stdout.write(
+                self.style.WARNING(f'Eventos inválidos en audit_dead_letters: {stats["dead_letters"]}')
+            )
+        if stats['pending'] >= stats['max_pending']:
+            self.stdout.write(
+                self.style.WARNING('La cola está saturada: los registros se escriben directamente en la base de datos')
+            )
@@ -0,0 +1,15 @@
+from .buffer import audit_buffer
+
+
+class AuditBufferMiddleware:
+    """
+    Agrupa todos los registros de auditoría de una petición en un único
+    INSERT que se ejecuta al terminar la respuesta.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with audit_buffer():
+            return self.get_response(request)
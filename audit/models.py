@@ -541,14 +541,21 @@ class InventoryTrace(models.Model):
     
     def get_source_document(self):
         """Obtiene el documento origen del movimiento"""
-        if self.purchase:
-            return f"Compra #{self.purchase.id}"
-        elif self.stock_transfer:
-            return f"Transferencia #{self.stock_transfer.id}"
-        elif self.pos_sale:
-            return f"Venta POS #{self.pos_sale.id}"
-        elif self.order:
-            return f"Orden #{self.order.id}"
+        return self.source_document_label(
+            self.purchase_id, self.stock_transfer_id, self.pos_sale_id, self.order_id
+        )
+
+    @staticmethod
+    def source_document_label(purchase_id, stock_transfer_id, pos_sale_id, order_id):
+        """Documento origen a partir de los ids, sin cargar las relaciones"""
+        if purchase_id:
+            return f"Compra #{purchase_id}"
+        elif stock_transfer_id:
+            return f"Transferencia #{stock_transfer_id}"
+        elif pos_sale_id:
+            return f"Venta POS #{pos_sale_id}"
+        elif order_id:
+            return f"Orden #{order_id}"
         return "Manual"
     
     def get_cost_per_unit(self):
@@ -0,0 +1,63 @@
+"""
+Registro en memoria de las configuraciones de auditoría.
+
+Las filas de ``AuditConfiguration`` se cargan una sola vez por proceso en un
+diccionario indexado por clase de modelo, de modo que los receptores de
+señales consultan la configuración sin ir a la base de datos. El registro se
+invalida cuando se guarda o elimina una configuración (ver ``audit.signals``)
+y, para otros procesos, caduca tras ``AUDIT_CONFIG_CACHE_TTL`` segundos.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .models import AuditConfiguration
+
+DEFAULT_CACHE_TTL = 300
+
+
+class AuditConfigRegistry:
+    """
+    Configuraciones de auditoría indexadas por modelo concreto
+    """
+
+    def __init__(self):
+        self._configs = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _is_stale(self):
+        ttl = getattr(settings, 'AUDIT_CONFIG_CACHE_TTL', DEFAULT_CACHE_TTL)
+        return ttl is not None and time.monotonic() - self._loaded_at > ttl
+
+    def _load(self):
+        with self._lock:
+            if self._configs is not None and not self._is_stale():
+                return self._configs
+
+            configs = {}
+            for config in AuditConfiguration.objects.select_related('content_type'):
+                model = config.content_type.model_class()
+                if model is not None:
+                    configs[model] = config
+
+            self._configs = configs
+            self._loaded_at = time.monotonic()
+            return configs
+
+    def get(self, model):
+        """
+        Retorna la ``AuditConfiguration`` del modelo o ``None`` si no tiene
+        """
+        configs = self._configs
+        if configs is None or self._is_stale():
+            configs = self._load()
+        return configs.get(model._meta.concrete_model)
+
+    def clear(self):
+        """Descarta las configuraciones cargadas; se recargan en el próximo uso"""
+        self._configs = None
+
+
+registry = AuditConfigRegistry()
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import post_save, post_delete, pre_save, post_init
 from django.dispatch import receiver
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.contrib.contenttypes.models import ContentType
@@ -7,6 +7,9 @@ from django.conf import settings
 import json
 
 from .models import AuditLog, AuditConfiguration
+from .buffer import enqueue
+from .registry import registry
+from .tracker import take_snapshot, get_snapshot, get_changes, serialize_instance
 
 
 @receiver(post_save)
@@ -28,10 +31,9 @@ def audit_post_save(sender, instance, created, **kwargs):
         return
     
     # Verificar si la auditoría está habilitada para este modelo
-    try:
-        content_type = ContentType.objects.get_for_model(sender)
-        config = AuditConfiguration.objects.get(content_type=content_type)
-        
+    # (sin configuración específica se usa la configuración por defecto)
+    config = registry.get(sender)
+    if config is not None:
         if not config.is_enabled:
             return
             
@@ -40,47 +42,54 @@ def audit_post_save(sender, instance, created, **kwargs):
             return
         if not created and not config.track_updates:
             return
-            
-    except AuditConfiguration.DoesNotExist:
-        # Si no hay configuración específica, usar configuración por defecto
-        pass
     
     # Determinar la acción
     action = 'CREATE' if created else 'UPDATE'
     
-    # Obtener valores actuales
-    new_values = {}
-    if hasattr(instance, '_audit_fields'):
+    # Obtener valores: en actualizaciones solo los campos que cambiaron
+    old_values = {}
+    if not created and hasattr(instance, '_audit_old_values'):
+        old_values = instance._audit_old_values
+        new_values = instance._audit_new_values
+    elif hasattr(instance, '_audit_fields'):
         # Si el modelo especifica campos a auditar
+        new_values = {}
         for field in instance._audit_fields:
             if hasattr(instance, field):
                 value = getattr(instance, field)
                 new_values[field] = str(value) if value is not None else None
     else:
         # Auditar todos los campos del modelo
-        for field in instance._meta.fields:
-            if field.name not in ['id', 'created_at', 'updated_at']:
-                value = getattr(instance, field.name)
-                new_values[field.name] = str(value) if value is not None else None
-    
-    # Obtener valores anteriores si es una actualización
-    old_values = {}
-    if not created and hasattr(instance, '_audit_old_values'):
-        old_values = instance._audit_old_values
+        new_values = serialize_instance(instance)
     
-    # Crear el registro de auditoría
-    AuditLog.objects.create(
+    # Encolar el registro de auditoría (se escribe en lote)
+    enqueue(AuditLog(
         action=action,
         content_type=ContentType.objects.get_for_model(sender),
         object_id=str(instance.pk),
         object_repr=str(instance),
         old_values=old_values if old_values else None,
         new_values=new_values if new_values else None,
-        severity=getattr(config, 'severity_level', 'MEDIUM') if 'config' in locals() else 'MEDIUM',
+        severity=config.severity_level if config is not None else 'MEDIUM',
         app_label=sender._meta.app_label,
         model_name=sender._meta.model_name,
         message=f"{action} de {sender._meta.verbose_name}: {str(instance)}"
-    )
+    ))
+
+
+@receiver(post_save)
+def audit_refresh_snapshot(sender, instance, **kwargs):
+    """
+    Toma un nuevo snapshot después de guardar para que el siguiente
+    guardado se compare contra el estado persistido
+    """
+    if getattr(settings, 'AUDIT_DISABLE_SIGNALS', False):
+        return
+
+    instance.__dict__.pop('_audit_old_values', None)
+    instance.__dict__.pop('_audit_new_values', None)
+    if get_snapshot(instance) is not None:
+        take_snapshot(instance)
 
 
 @receiver(pre_save)
@@ -101,23 +110,37 @@ def audit_pre_save(sender, instance, **kwargs):
     if sender.__name__ in ['AuditLog', 'AuditConfiguration', 'AuditReport']:
         return
     
+    config = registry.get(sender)
+    if config is not None and (not config.is_enabled or not config.track_updates):
+        return
+
     # Solo para actualizaciones (no creaciones)
-    if instance.pk:
-        try:
-            old_instance = sender.objects.get(pk=instance.pk)
-            old_values = {}
-            
-            # Capturar valores anteriores
-            for field in instance._meta.fields:
-                if field.name not in ['id', 'created_at', 'updated_at']:
-                    value = getattr(old_instance, field.name)
-                    old_values[field.name] = str(value) if value is not None else None
-            
-            # Almacenar valores anteriores en la instancia
+    if instance.pk and not instance._state.adding:
+        # Comparar contra el snapshot tomado al cargar la instancia
+        old_values, new_values = get_changes(instance)
+        if old_values is not None:
             instance._audit_old_values = old_values
-            
-        except sender.DoesNotExist:
-            pass
+            instance._audit_new_values = new_values
+
+
+@receiver(post_init)
+def audit_post_init(sender, instance, **kwargs):
+    """
+    Guarda los valores originales de la instancia al cargarla
+    """
+    if getattr(settings, 'AUDIT_DISABLE_SIGNALS', False):
+        return
+
+    sender_meta = getattr(sender, '_meta', None)
+    if sender_meta and getattr(sender_meta, 'app_label', None) in {'contenttypes', 'admin', 'auth', 'sessions'}:
+        return
+    if sender_meta and getattr(sender_meta, 'model_name', None) in {'migration', 'contenttype'}:
+        return
+
+    if sender.__name__ in ['AuditLog', 'AuditConfiguration', 'AuditReport']:
+        return
+
+    take_snapshot(instance)
 
 
 @receiver(post_delete)
@@ -140,41 +163,40 @@ def audit_post_delete(sender, instance, **kwargs):
             return
         
         # Verificar si la auditoría está habilitada para este modelo
-        try:
-            content_type = ContentType.objects.get_for_model(sender)
-            config = AuditConfiguration.objects.get(content_type=content_type)
-            
-            if not config.is_enabled or not config.track_deletes:
-                return
-                
-        except AuditConfiguration.DoesNotExist:
-            pass
+        config = registry.get(sender)
+        if config is not None and (not config.is_enabled or not config.track_deletes):
+            return
         
         # Obtener valores del objeto eliminado
-        old_values = {}
-        for field in instance._meta.fields:
-            if field.name not in ['id', 'created_at', 'updated_at']:
-                value = getattr(instance, field.name)
-                old_values[field.name] = str(value) if value is not None else None
+        old_values = serialize_instance(instance)
         
-        # Crear el registro de auditoría
-        AuditLog.objects.create(
+        # Encolar el registro de auditoría (se escribe en lote)
+        enqueue(AuditLog(
             action='DELETE',
             content_type=ContentType.objects.get_for_model(sender),
             object_id=str(instance.pk),
             object_repr=str(instance),
             old_values=old_values,
             new_values=None,
-            severity=getattr(config, 'severity_level', 'MEDIUM') if 'config' in locals() else 'MEDIUM',
+            severity=config.severity_level if config is not None else 'MEDIUM',
             app_label=sender._meta.app_label,
             model_name=sender._meta.model_name,
             message=f"DELETE de {sender._meta.verbose_name}: {str(instance)}"
-        )
+        ))
     except Exception:
         # Silenciar errores durante eliminaciones en cascada
         pass
 
 
+@receiver(post_save, sender=AuditConfiguration)
+@receiver(post_delete, sender=AuditConfiguration)
+def invalidate_audit_config_registry(sender, **kwargs):
+    """
+    Recarga las configuraciones en memoria cuando una de ellas cambia
+    """
+    registry.clear()
+
+
 @receiver(user_logged_in)
 def audit_user_login(sender, request, user, **kwargs):
     """
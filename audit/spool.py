@@ -0,0 +1,200 @@
+"""
+Cola local y durable para el modo asíncrono de auditoría.
+
+Con ``AUDIT_ASYNC = True`` los registros de auditoría no se insertan en la
+base de datos principal durante la petición: se serializan en un archivo
+SQLite local (``AUDIT_SPOOL_PATH``) y el comando ``manage.py audit_worker``
+los drena en lotes con ``bulk_create``.
+
+Garantía: al menos una vez. El worker borra los eventos del spool solo
+después de insertarlos, así que si se interrumpe entre ambos pasos los
+eventos se vuelven a procesar. Se asume un único worker por archivo de spool.
+
+Eventos inválidos: si un lote no se puede insertar, se reintenta evento por
+evento y los que vuelven a fallar pasan a la tabla ``audit_dead_letters``
+del mismo archivo, con el error, para no bloquear la cola. Los errores de
+conexión con la base de datos no cuentan: el lote se queda en el spool.
+
+Contrapresión: si el spool acumula más de ``AUDIT_SPOOL_MAX_PENDING``
+eventos (el worker no da abasto o está detenido), los registros vuelven a
+escribirse directamente en la base de datos hasta que la cola baje.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import InterfaceError, OperationalError, transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditLog
+
+DEFAULT_MAX_PENDING = 100000
+
+_local = threading.local()
+
+
+def is_enabled():
+    return getattr(settings, 'AUDIT_ASYNC', False)
+
+
+def get_spool_path():
+    path = getattr(settings, 'AUDIT_SPOOL_PATH', None)
+    if path is None:
+        path = os.path.join(settings.BASE_DIR, 'audit_spool.sqlite3')
+    return str(path)
+
+
+def get_max_pending():
+    return getattr(settings, 'AUDIT_SPOOL_MAX_PENDING', DEFAULT_MAX_PENDING)
+
+
+def _get_connection():
+    path = get_spool_path()
+    conn = getattr(_local, 'connection', None)
+    if conn is None or getattr(_local, 'path', None) != path:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS audit_events ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' payload TEXT NOT NULL,'
+            ' enqueued_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS audit_dead_letters ('
+            ' id INTEGER PRIMARY KEY,'
+            ' payload TEXT NOT NULL,'
+            ' enqueued_at REAL NOT NULL,'
+            ' failed_at REAL NOT NULL,'
+            ' error TEXT NOT NULL)'
+        )
+        _local.connection, _local.path = conn, path
+    return conn
+
+
+def serialize(entry):
+    """Convierte un ``AuditLog`` sin guardar en JSON"""
+    data = {
+        f.attname: getattr(entry, f.attname)
+        for f in AuditLog._meta.concrete_fields
+        if not f.primary_key
+    }
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def deserialize(payload):
+    """Reconstruye un ``AuditLog`` sin guardar a partir del JSON del spool"""
+    data = json.loads(payload)
+    if data.get('created_at'):
+        data['created_at'] = parse_datetime(data['created_at'])
+    return AuditLog(**data)
+
+
+def pending_count():
+    """Número aproximado de eventos pendientes (O(1) sobre el rowid)"""
+    row = _get_connection().execute(
+        'SELECT MAX(id) - MIN(id) + 1 FROM audit_events'
+    ).fetchone()
+    return row[0] or 0
+
+
+def append(entries):
+    """
+    Agrega registros al spool. Retorna ``False`` si el spool está saturado
+    o no se pudo escribir, para que el llamador los inserte directamente.
+    """
+    try:
+        if pending_count() >= get_max_pending():
+            return False
+        now = time.time()
+        conn = _get_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO audit_events (payload, enqueued_at) VALUES (?, ?)',
+                [(serialize(entry), now) for entry in entries],
+            )
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _insert(payloads):
+    with transaction.atomic():
+        AuditLog.objects.bulk_create([deserialize(payload) for payload in payloads])
+
+
+def _is_transient(exc):
+    """Errores de conexión: el evento no tiene la culpa y se reintenta después"""
+    return isinstance(exc, (InterfaceError, OperationalError))
+
+
+def drain(batch_size=500):
+    """
+    Inserta en la base de datos el siguiente lote del spool y lo elimina.
+    Los eventos que no se pueden insertar pasan a ``audit_dead_letters``.
+    Retorna el número de eventos procesados.
+    """
+    conn = _get_connection()
+    rows = conn.execute(
+        'SELECT id, payload, enqueued_at FROM audit_events ORDER BY id LIMIT ?', (batch_size,)
+    ).fetchall()
+    if not rows:
+        return 0
+
+    dead = []
+    try:
+        _insert([payload for _, payload, _ in rows])
+    except Exception as exc:
+        if _is_transient(exc):
+            raise
+        # Algún evento es inválido: se reintenta de a uno para aislarlo
+        for event_id, payload, enqueued_at in rows:
+            try:
+                _insert([payload])
+            except Exception as error:
+                if _is_transient(error):
+                    raise
+                dead.append((event_id, payload, enqueued_at, time.time(), repr(error)))
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.executemany(
+            'INSERT OR REPLACE INTO audit_dead_letters (id, payload, enqueued_at, failed_at, error)'
+            ' VALUES (?, ?, ?, ?, ?)',
+            dead,
+        )
+        conn.execute('DELETE FROM audit_events WHERE id <= ?', (rows[-1][0],))
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+    return len(rows)
+
+
+def get_stats():
+    """Métricas de la cola: eventos pendientes y antigüedad del más viejo"""
+    conn = _get_connection()
+    pending, oldest = conn.execute(
+        'SELECT COUNT(*), MIN(enqueued_at) FROM audit_events'
+    ).fetchone()
+    dead_letters, = conn.execute('SELECT COUNT(*) FROM audit_dead_letters').fetchone()
+    return {
+        'pending': pending,
+        'dead_letters': dead_letters,
+        'max_pending': get_max_pending(),
+        'oldest_age_seconds': round(time.time() - oldest, 1) if oldest else 0,
+        'path': get_spool_path(),
+    }
@@ -0,0 +1,79 @@
+"""
+Seguimiento en memoria de los valores originales de cada instancia.
+
+Al cargar una instancia (``post_init``) se guarda una copia de los valores de
+sus campos concretos. Al guardarla se comparan con los valores actuales, de
+modo que el diff de auditoría no necesita volver a consultar la base de datos.
+"""
+import copy
+
+# Campos que nunca se registran en los valores de auditoría
+IGNORED_FIELDS = ('id', 'created_at', 'updated_at')
+
+SNAPSHOT_ATTR = '_audit_snapshot'
+
+
+def _tracked_fields(instance):
+    return [f for f in instance._meta.concrete_fields if f.name not in IGNORED_FIELDS]
+
+
+def _copy_value(value):
+    if isinstance(value, (dict, list)):
+        # JSONField: evitar que una mutación in situ altere la copia
+        return copy.deepcopy(value)
+    return value
+
+
+def take_snapshot(instance):
+    """
+    Guarda los valores actuales de la instancia como estado original.
+    Los campos diferidos (``only()``/``defer()``) se omiten.
+    """
+    data = instance.__dict__
+    instance.__dict__[SNAPSHOT_ATTR] = {
+        f.attname: _copy_value(data[f.attname])
+        for f in _tracked_fields(instance)
+        if f.attname in data
+    }
+
+
+def get_snapshot(instance):
+    return instance.__dict__.get(SNAPSHOT_ATTR)
+
+
+def display_value(value):
+    return str(value) if value is not None else None
+
+
+def serialize_instance(instance):
+    """
+    Valores de todos los campos rastreados, sin consultas adicionales:
+    las relaciones se registran por su ID.
+    """
+    data = instance.__dict__
+    return {
+        f.name: display_value(data.get(f.attname))
+        for f in _tracked_fields(instance)
+        if f.attname in data
+    }
+
+
+def get_changes(instance):
+    """
+    Retorna ``(old_values, new_values)`` con solo los campos que cambiaron
+    desde el último snapshot. ``(None, None)`` si no hay snapshot.
+    """
+    snapshot = get_snapshot(instance)
+    if snapshot is None:
+        return None, None
+
+    data = instance.__dict__
+    old_values, new_values = {}, {}
+    for f in _tracked_fields(instance):
+        if f.attname not in snapshot or f.attname not in data:
+            continue
+        old, new = snapshot[f.attname], data[f.attname]
+        if old != new and display_value(old) != display_value(new):
+            old_values[f.name] = display_value(old)
+            new_values[f.name] = display_value(new)
+    return old_values, new_values
@@ -1,18 +1,86 @@
 import os
 import csv
 import json
+import logging
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.utils import timezone
+from django.db import connections, router, transaction
 from django.db.models import Count, Q
 from django.contrib.contenttypes.models import ContentType
 
-from .models import AuditLog, AuditReport, InventoryTrace
+from .models import AuditLog, AuditConfiguration, AuditReport, InventoryTrace
+from .buffer import enqueue
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+def audit_report_rows(params):
+    """
+    Encabezado y filas (generador) de un reporte de auditoría con los
+    parámetros dados
+    """
+    filters = {}
+    
+    if params.get('date_from'):
+        try:
+            date_from = datetime.strptime(params['date_from'], '%Y-%m-%d').date()
+            filters['created_at__date__gte'] = date_from
+        except ValueError:
+            pass
+    
+    if params.get('date_to'):
+        try:
+            date_to = datetime.strptime(params['date_to'], '%Y-%m-%d').date()
+            filters['created_at__date__lte'] = date_to
+        except ValueError:
+            pass
+    
+    if params.get('user'):
+        filters['user__username__icontains'] = params['user']
+    
+    if params.get('action'):
+        filters['action'] = params['action']
+    
+    if params.get('severity'):
+        filters['severity'] = params['severity']
+    
+    # Obtener datos
+    logs = AuditLog.objects.filter(**filters).select_related('user').order_by('-created_at')
+    
+    headers = [
+        'ID', 'Fecha', 'Usuario', 'Acción', 'Objeto', 'Severidad',
+        'Estado', 'IP', 'User Agent', 'Mensaje', 'Cambios'
+    ]
+    
+    def rows():
+        for log in logs.iterator(chunk_size=2000):
+            changes = ""
+            if log.has_changes:
+                changes = log.changes_summary
+            
+            yield [
+                log.id,
+                log.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                log.user.username if log.user else '',
+                log.get_action_display(),
+                log.object_repr or '',
+                log.get_severity_display(),
+                log.get_status_display(),
+                log.ip_address or '',
+                log.user_agent or '',
+                log.message or '',
+                changes
+            ]
+    
+    return headers, rows()
 
 
 def generate_audit_report(report):
     """
-    Genera un reporte de auditoría
+    Genera un reporte de auditoría en la petición actual. Para generarlo en
+    segundo plano, usar ``reports.jobs.submit('audit', ...)``.
     """
     try:
         report.status = 'GENERATING'
@@ -27,65 +95,13 @@ def generate_audit_report(report):
         filename = f"audit_report_{report.report_type}_{timestamp}.csv"
         filepath = os.path.join(reports_dir, filename)
         
-        # Aplicar filtros
-        filters = {}
-        params = report.parameters
-        
-        if params.get('date_from'):
-            try:
-                date_from = datetime.strptime(params['date_from'], '%Y-%m-%d').date()
-                filters['created_at__date__gte'] = date_from
-            except ValueError:
-                pass
-        
-        if params.get('date_to'):
-            try:
-                date_to = datetime.strptime(params['date_to'], '%Y-%m-%d').date()
-                filters['created_at__date__lte'] = date_to
-            except ValueError:
-                pass
-        
-        if params.get('user'):
-            filters['user__username__icontains'] = params['user']
-        
-        if params.get('action'):
-            filters['action'] = params['action']
-        
-        if params.get('severity'):
-            filters['severity'] = params['severity']
-        
-        # Obtener datos
-        logs = AuditLog.objects.filter(**filters).order_by('-created_at')
+        headers, rows = audit_report_rows(report.parameters)
         
         # Generar CSV
         with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
-            
-            # Escribir encabezados
-            writer.writerow([
-                'ID', 'Fecha', 'Usuario', 'Acción', 'Objeto', 'Severidad',
-                'Estado', 'IP', 'User Agent', 'Mensaje', 'Cambios'
-            ])
-            
-            # Escribir datos
-            for log in logs:
-                changes = ""
-                if log.has_changes:
-                    changes = log.changes_summary
-                
-                writer.writerow([
-                    log.id,
-                    log.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    log.user.username if log.user else '',
-                    log.get_action_display(),
-                    log.object_repr or '',
-                    log.get_severity_display(),
-                    log.get_status_display(),
-                    log.ip_address or '',
-                    log.user_agent or '',
-                    log.message or '',
-                    changes
-                ])
+            writer.writerow(headers)
+            writer.writerows(rows)
         
         # Actualizar reporte
         report.status = 'COMPLETED'
@@ -189,11 +205,7 @@ def get_model_audit_config(model_class):
     """
     Obtiene la configuración de auditoría para un modelo específico
     """
-    try:
-        content_type = ContentType.objects.get_for_model(model_class)
-        return AuditConfiguration.objects.get(content_type=content_type)
-    except AuditConfiguration.DoesNotExist:
-        return None
+    return registry.get(model_class)
 
 
 def is_audit_enabled_for_model(model_class):
@@ -234,19 +246,38 @@ def create_inventory_trace(movement_type, product, warehouse, quantity,
                           pos_sale=None, pos_sale_item=None,
                           order=None, order_item=None,
                           supplier=None, batch_number=None, 
-                          expiration_date=None, notes=None, **kwargs):
+                          expiration_date=None, notes=None, stock_before=None, **kwargs):
     """
     Función helper para crear trazabilidad de inventario
+
+    ``stock_before`` es el stock previo al movimiento. Si no se indica se lee
+    el stock actual, así que quien llame después de aplicar el movimiento
+    (como el ajuste de ``Stock``) debe pasarlo.
     """
     try:
-        # Obtener stock actual
-        from inventory.models import Stock
-        stock_obj = Stock.objects.filter(
-            product=product, 
-            warehouse=warehouse
-        ).first()
+        # Si no se especifica warehouse, usar la bodega principal
+        if warehouse is None:
+            from inventory.models import Warehouse
+            warehouse = Warehouse.objects.filter(is_main=True, is_active=True).first()
+            if not warehouse:
+                # Si no hay bodega principal, crear una
+                warehouse = Warehouse.objects.create(
+                    name='Bodega Principal', 
+                    code='PRINCIPAL', 
+                    address='Ubicación Central',
+                    city='Ciudad Principal', 
+                    is_main=True, 
+                    is_active=True
+                )
         
-        stock_before = stock_obj.quantity if stock_obj else 0
+        if stock_before is None:
+            # Obtener stock actual
+            from inventory.models import Stock
+            stock_obj = Stock.objects.filter(
+                product=product, 
+                warehouse=warehouse
+            ).first()
+            stock_before = stock_obj.quantity if stock_obj else 0
         stock_after = stock_before + quantity
         
         # Crear el registro de trazabilidad
@@ -275,8 +306,8 @@ def create_inventory_trace(movement_type, product, warehouse, quantity,
             extra_data=kwargs.get('extra_data')
         )
         
-        # Crear también un log de auditoría
-        AuditLog.objects.create(
+        # Encolar también un log de auditoría (se escribe en lote)
+        enqueue(AuditLog(
             user=user,
             action='STOCK_MOVEMENT',
             content_type=ContentType.objects.get_for_model(InventoryTrace),
@@ -294,11 +325,59 @@ def create_inventory_trace(movement_type, product, warehouse, quantity,
                 'stock_before': float(stock_before),
                 'stock_after': float(stock_after),
             }
-        )
+        ))
         
         return trace
         
-    except Exception as e:
-        # Log del error pero no fallar la operación principal
-        print(f"Error creando trazabilidad de inventario: {str(e)}")
+    except Exception:
+        # Registrar el error sin fallar la operación principal
+        logger.exception("Error creando trazabilidad de inventario")
         return None
+
+
+def create_inventory_traces(traces):
+    """
+    Guarda en lote trazabilidades de inventario ya armadas (con
+    ``stock_before`` y ``stock_after``) y encola su log de auditoría.
+    ``product`` y ``warehouse`` deben venir cargados para no consultarlos
+    por cada registro.
+    """
+    if not traces:
+        return []
+    try:
+        # En un savepoint para que un error no invalide la transacción del documento
+        using = router.db_for_write(InventoryTrace)
+        with transaction.atomic(using=using):
+            if connections[using].features.can_return_rows_from_bulk_insert:
+                traces = InventoryTrace.objects.using(using).bulk_create(traces)
+            else:
+                # Sin RETURNING bulk_create no asigna pk y el log necesita object_id
+                for trace in traces:
+                    trace.save(using=using)
+        content_type = ContentType.objects.get_for_model(InventoryTrace)
+        for trace in traces:
+            enqueue(AuditLog(
+                user=trace.user,
+                action='STOCK_MOVEMENT',
+                content_type=content_type,
+                object_id=str(trace.pk),
+                object_repr=str(trace),
+                severity='MEDIUM',
+                app_label='audit',
+                model_name='inventorytrace',
+                message=trace.movement_description,
+                extra_data={
+                    'movement_type': trace.movement_type,
+                    'product_id': trace.product_id,
+                    'warehouse_id': trace.warehouse_id,
+                    'quantity': float(trace.quantity),
+                    'stock_before': float(trace.stock_before),
+                    'stock_after': float(trace.stock_after),
+                }
+            ))
+        return traces
+
+    except Exception:
+        # Registrar el error sin fallar la operación principal
+        logger.exception("Error creando %s trazabilidades de inventario", len(traces))
+        return []
@@ -3,7 +3,7 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.core.paginator import Paginator
 from django.db.models import Q, Count
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.views.generic import ListView, DetailView
 from django.utils import timezone
 from django.utils.safestring import mark_safe
@@ -11,10 +11,10 @@ from django.contrib.contenttypes.models import ContentType
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
-import csv
 
 from .models import AuditLog, AuditConfiguration, AuditReport
-from .utils import generate_audit_report
+from reports import jobs
+from reports.exports import ExportFormatError, choice_labels, export_response, queryset_rows
 
 
 def safe_json_dumps(data):
@@ -184,30 +184,42 @@ def audit_export(request):
     # Obtener registros
     logs = AuditLog.objects.filter(**filters).order_by("-created_at")
 
-    # Crear respuesta CSV
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="audit_logs.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(
-        ["Fecha", "Usuario", "Acción", "Objeto", "Severidad", "Estado", "IP", "Mensaje"]
-    )
-
-    for log in logs:
-        writer.writerow(
-            [
-                log.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                log.user.username if log.user else "",
-                log.get_action_display(),
-                log.object_repr or "",
-                log.get_severity_display(),
-                log.get_status_display(),
-                log.ip_address or "",
-                log.message or "",
-            ]
+    headers = ["Fecha", "Usuario", "Acción", "Objeto", "Severidad", "Estado", "IP", "Mensaje"]
+
+    actions = choice_labels(AuditLog, "action")
+    severities = choice_labels(AuditLog, "severity")
+    statuses = choice_labels(AuditLog, "status")
+    rows = (
+        [
+            created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            username or "",
+            actions.get(action, action),
+            object_repr or "",
+            severities.get(severity, severity),
+            statuses.get(status, status),
+            ip_address or "",
+            message or "",
+        ]
+        for (created_at, username, action, object_repr, severity, status, ip_address,
+             message) in queryset_rows(
+            logs,
+            (
+                "created_at",
+                "user__username",
+                "action",
+                "object_repr",
+                "severity",
+                "status",
+                "ip_address",
+                "message",
+            ),
         )
+    )
 
-    return response
+    try:
+        return export_response("audit_logs", headers, rows, request.GET.get("format", "csv"))
+    except ExportFormatError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
 
 @login_required
@@ -235,15 +247,14 @@ def generate_report(request):
             status="PENDING",
         )
 
-        # Generar reporte en background (aquí podrías usar Celery)
-        try:
-            generate_audit_report(report)
-            return JsonResponse({"success": True, "report_id": report.id})
-        except Exception as e:
-            report.status = "FAILED"
-            report.error_message = str(e)
-            report.save()
-            return JsonResponse({"success": False, "error": str(e)})
+        # El reporte se genera con ``manage.py report_worker``; si hay uno
+        # reciente con los mismos parámetros se reutiliza su archivo
+        jobs.submit(
+            "audit", report_type, parameters, requested_by=request.user, audit_report=report
+        )
+        return JsonResponse(
+            {"success": True, "report_id": report.id, "status": report.status}
+        )
 
     return render(request, "audit/generate_report.html")
 
@@ -3,21 +3,24 @@ from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
 from .models import Product, Category, Brand, Cart, CartItem
+from .cart import CartService
+from .images import image_sets
+from .search import search_products
 from .serializers import ProductSerializer, CategorySerializer, BrandSerializer
 from customers.models import City, Country, Department
 
 
 class ProductListAPIView(generics.ListAPIView):
-    queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('images')
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('images').with_stock_totals()
     serializer_class = ProductSerializer
 
 
 @api_view(['GET'])
 def product_list_api(request):
     """API simple para obtener productos para el POS"""
-    products = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('images')
+    # Stock total e imagen principal se anotan en la misma consulta
+    products = Product.objects.filter(is_active=True).select_related('category', 'brand').with_stock_totals()
     
     # Filtros opcionales
     search = request.GET.get('search')
@@ -25,13 +28,7 @@ def product_list_api(request):
     featured = request.GET.get('featured')
     
     if search:
-        products = products.filter(
-            name__icontains=search
-        ) | products.filter(
-            sku__icontains=search
-        ) | products.filter(
-            barcode__icontains=search
-        )
+        products = search_products(products, search).order_by('-search_rank', 'name')
     
     if category:
         products = products.filter(category_id=category)
@@ -39,25 +36,12 @@ def product_list_api(request):
     if featured:
         products = products.filter(is_featured=True)
     
-    # Serializar datos
+    # Serializar datos (miniaturas de todas las imágenes en una sola lectura)
+    products = list(products)
+    thumbnails = image_sets(product.primary_image_path for product in products)
     data = []
     for product in products:
-        # Obtener imagen principal
-        main_image = None
-        if product.images.exists():
-            main_image_obj = product.images.filter(is_primary=True).first()
-            if not main_image_obj:
-                main_image_obj = product.images.first()
-            if main_image_obj:
-                main_image = main_image_obj.image.url
-        
-        # Obtener stock total
-        from inventory.models import Stock
-        from django.db.models import Sum
-        total_stock = Stock.objects.filter(product=product).aggregate(
-            total=Sum('quantity')
-        )['total'] or 0
-        
+        variants = thumbnails.get(product.primary_image_path or '', {})
         data.append({
             'id': product.id,
             'name': product.name,
@@ -66,8 +50,10 @@ def product_list_api(request):
             'barcode': product.barcode,
             'is_active': product.is_active,
             'is_featured': product.is_featured,
-            'stock': total_stock,
-            'image': main_image,
+            'stock': product.total_stock,
+            'image': product.main_image_url,
+            'thumbnail': variants.get('thumbnail'),
+            'srcset': variants.get('srcset_webp', ''),
             'category': {
                 'id': product.category.id,
                 'name': product.category.name
@@ -118,7 +104,7 @@ def location_cities_api(request):
 
 # ViewSets
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('images')
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('images').with_stock_totals()
     serializer_class = ProductSerializer
     
     def get_queryset(self):
@@ -128,11 +114,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         featured = self.request.query_params.get('featured', None)
         
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(sku__icontains=search) |
-                Q(barcode__icontains=search)
-            )
+            queryset = search_products(queryset, search).order_by('-search_rank', 'name')
         
         if category:
             queryset = queryset.filter(category_id=category)
@@ -157,15 +139,7 @@ class CartViewSet(viewsets.ModelViewSet):
     serializer_class = None  # We'll handle serialization manually
     
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=self.request.user)
-        else:
-            session_key = self.request.session.session_key
-            if not session_key:
-                self.request.session.create()
-                session_key = self.request.session.session_key
-            cart, created = Cart.objects.get_or_create(session_key=session_key)
-        return Cart.objects.filter(id=cart.id)
+        return Cart.objects.filter(id=CartService(self.request).cart_id())
     
     def list(self, request, *args, **kwargs):
         cart = self.get_queryset().first()
@@ -173,7 +147,7 @@ class CartViewSet(viewsets.ModelViewSet):
             return Response({'items': [], 'total_items': 0, 'total_amount': 0})
         
         items = []
-        for item in cart.items.all():
+        for item in cart.items.select_related('product'):
             items.append({
                 'id': item.id,
                 'product': {
@@ -209,26 +183,9 @@ class CartAddAPIView(generics.CreateAPIView):
         
         product = get_object_or_404(Product, id=product_id, is_active=True)
         
-        # Get or create cart
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-        else:
-            session_key = request.session.session_key
-            if not session_key:
-                request.session.create()
-                session_key = request.session.session_key
-            cart, created = Cart.objects.get_or_create(session_key=session_key)
-        
-        # Add or update cart item
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        service = CartService(request)
+        service.add(product, quantity)
+        cart_item = CartItem.objects.get(cart_id=service.cart_id(), product=product)
         
         return Response({
             'message': 'Product added to cart',
@@ -244,18 +201,14 @@ class CartRemoveAPIView(generics.DestroyAPIView):
         if not product_id:
             return Response({'error': 'product_id is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get cart
-        if request.user.is_authenticated:
-            cart = get_object_or_404(Cart, user=request.user)
-        else:
-            session_key = request.session.session_key
-            if not session_key:
-                return Response({'error': 'No cart found'}, status=status.HTTP_404_NOT_FOUND)
-            cart = get_object_or_404(Cart, session_key=session_key)
+        service = CartService(request)
+        cart_id = service.cart_id()
+        if cart_id is None:
+            return Response({'error': 'No cart found'}, status=status.HTTP_404_NOT_FOUND)
         
         # Remove cart item
-        cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
-        cart_item.delete()
+        cart_item = get_object_or_404(CartItem, cart_id=cart_id, product_id=product_id)
+        service.remove(cart_item)
         
         return Response({'message': 'Product removed from cart'})
 
@@ -271,19 +224,14 @@ class CartUpdateAPIView(generics.UpdateAPIView):
         if quantity <= 0:
             return Response({'error': 'quantity must be greater than 0'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get cart
-        if request.user.is_authenticated:
-            cart = get_object_or_404(Cart, user=request.user)
-        else:
-            session_key = request.session.session_key
-            if not session_key:
-                return Response({'error': 'No cart found'}, status=status.HTTP_404_NOT_FOUND)
-            cart = get_object_or_404(Cart, session_key=session_key)
+        service = CartService(request)
+        cart_id = service.cart_id()
+        if cart_id is None:
+            return Response({'error': 'No cart found'}, status=status.HTTP_404_NOT_FOUND)
         
         # Update cart item
-        cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
-        cart_item.quantity = quantity
-        cart_item.save()
+        cart_item = get_object_or_404(CartItem, cart_id=cart_id, product_id=product_id)
+        service.update(cart_item, quantity)
         
         return Response({
             'message': 'Cart item updated',
@@ -295,19 +243,14 @@ class ProductSearchAPIView(generics.ListAPIView):
     serializer_class = ProductSerializer
     
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('images')
+        queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('images').with_stock_totals()
         
         search = self.request.query_params.get('search', None)
         category = self.request.query_params.get('category', None)
         featured = self.request.query_params.get('featured', None)
         
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(sku__icontains=search) |
-                Q(barcode__icontains=search) |
-                Q(description__icontains=search)
-            )
+            queryset = search_products(queryset, search).order_by('-search_rank', 'name')
         
         if category:
             queryset = queryset.filter(category_id=category)
@@ -5,5 +5,6 @@ class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
 
-
-
+    def ready(self):
+        # Importar señales cuando la app esté lista
+        import catalog.signals
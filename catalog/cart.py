@@ -0,0 +1,189 @@
+"""
+Acceso al carrito de compras de la tienda.
+
+``CartService`` es el único punto de entrada de las vistas al carrito. El id
+del carrito del visitante se recuerda en la sesión, de modo que mostrar una
+página no consulta ni crea carritos: el carrito de un visitante anónimo se
+crea en la base de datos con el primer producto que agrega.
+
+La cantidad de productos y el total del carrito (el contador del encabezado)
+se guardan en la caché compartida por carrito. Se recalculan con una sola
+consulta agregada al modificar el carrito y se invalidan cuando cambia un
+item o el precio de un producto (``catalog.signals``), también si el cambio
+ocurre fuera del servicio (pagos, administración, API).
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from .models import Cart, CartItem
+
+SESSION_KEY = 'cart'
+SUMMARY_KEY = 'catalog:cart:summary:{}'
+
+DEFAULT_SUMMARY_TIMEOUT = 3600
+
+
+def empty_summary():
+    return {'items_count': 0, 'total': Decimal('0.00')}
+
+
+def get_summary_timeout():
+    return getattr(settings, 'CART_SUMMARY_CACHE_SECONDS', DEFAULT_SUMMARY_TIMEOUT)
+
+
+def compute_summary(cart_id):
+    """Cantidad de productos y total del carrito en una consulta"""
+    totals = CartItem.objects.filter(cart_id=cart_id).aggregate(
+        items_count=Sum('quantity'),
+        total=Sum(ExpressionWrapper(
+            F('quantity') * F('product__price'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )),
+    )
+    return {
+        'items_count': totals['items_count'] or 0,
+        'total': totals['total'] or Decimal('0.00'),
+    }
+
+
+def get_summary(cart_id):
+    """Resumen del carrito desde la caché, calculándolo si falta"""
+    if cart_id is None:
+        return empty_summary()
+    key = SUMMARY_KEY.format(cart_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute_summary(cart_id)
+        cache.set(key, summary, get_summary_timeout())
+    return summary
+
+
+def invalidate_summaries(cart_ids):
+    cache.delete_many([SUMMARY_KEY.format(pk) for pk in set(cart_ids)])
+
+
+class CartService:
+    """Carrito del visitante de una petición"""
+
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user if request.user.is_authenticated else None
+
+    def _owner_id(self):
+        return self.user.pk if self.user else None
+
+    def _remember(self, cart_id):
+        self.request.session[SESSION_KEY] = {'id': cart_id, 'user': self._owner_id()}
+
+    def cart_id(self):
+        """
+        Id del carrito del visitante, o ``None`` si no tiene. La búsqueda en
+        la base de datos se hace una sola vez por sesión y usuario.
+        """
+        stored = self.request.session.get(SESSION_KEY)
+        if stored and stored.get('user') == self._owner_id():
+            return stored.get('id')
+
+        if self.user:
+            cart_id = Cart.objects.filter(user=self.user).order_by('pk').values_list('pk', flat=True).first()
+        elif self.request.session.session_key:
+            cart_id = Cart.objects.filter(
+                session_key=self.request.session.session_key, user__isnull=True
+            ).order_by('pk').values_list('pk', flat=True).first()
+        else:
+            # Sin sesión no hay carrito; no se crea una sesión solo para esto
+            return None
+        self._remember(cart_id)
+        return cart_id
+
+    def get_cart(self, create=False):
+        """Carrito del visitante; con ``create`` se crea si no existe"""
+        cart_id = self.cart_id()
+        if cart_id is not None:
+            cart = Cart.objects.filter(pk=cart_id).first()
+            if cart is not None:
+                return cart
+        if not create:
+            if cart_id is not None:
+                self._remember(None)
+            return None
+
+        if self.user:
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+        else:
+            if not self.request.session.session_key:
+                self.request.session.create()
+            cart, _ = Cart.objects.get_or_create(session_key=self.request.session.session_key, user=None)
+        self._remember(cart.pk)
+        return cart
+
+    def summary(self):
+        """``{'items_count', 'total'}`` del carrito, sin consultas si está en caché"""
+        return get_summary(self.cart_id())
+
+    def refresh_summary(self, cart_id=None):
+        cart_id = cart_id if cart_id is not None else self.cart_id()
+        if cart_id is None:
+            return empty_summary()
+        summary = compute_summary(cart_id)
+        # Después de la invalidación que programan las señales de CartItem
+        transaction.on_commit(
+            lambda: cache.set(SUMMARY_KEY.format(cart_id), summary, get_summary_timeout())
+        )
+        return summary
+
+    def add(self, product, quantity=1):
+        """Agrega ``quantity`` unidades del producto y devuelve el resumen"""
+        cart = self.get_cart(create=True)
+        with transaction.atomic():
+            item, created = CartItem.objects.select_for_update().get_or_create(
+                cart=cart, product=product, defaults={'quantity': quantity}
+            )
+            if not created:
+                item.quantity = F('quantity') + quantity
+                item.save(update_fields=['quantity', 'updated_at'])
+        return self.refresh_summary(cart.pk)
+
+    def update(self, item, quantity):
+        """Cambia la cantidad de un item; con cantidad 0 o menor lo elimina"""
+        if quantity <= 0:
+            return self.remove(item)
+        item.quantity = quantity
+        item.save(update_fields=['quantity', 'updated_at'])
+        return self.refresh_summary(item.cart_id)
+
+    def remove(self, item):
+        item.delete()
+        return self.refresh_summary(item.cart_id)
+
+    def merge_into_user(self, user):
+        """
+        Pasa los items del carrito anónimo de la sesión al carrito del
+        usuario (sumando cantidades) y elimina el carrito anónimo.
+        """
+        session_cart_id = self.cart_id() if self.user is None else None
+        user_cart, _ = Cart.objects.get_or_create(user=user)
+
+        if session_cart_id is not None and session_cart_id != user_cart.pk:
+            with transaction.atomic():
+                existing = dict(
+                    CartItem.objects.filter(cart=user_cart).values_list('product_id', 'pk')
+                )
+                for item in CartItem.objects.filter(cart_id=session_cart_id):
+                    if item.product_id in existing:
+                        CartItem.objects.filter(pk=existing[item.product_id]).update(
+                            quantity=F('quantity') + item.quantity
+                        )
+                    else:
+                        item.cart = user_cart
+                        item.save(update_fields=['cart'])
+                Cart.objects.filter(pk=session_cart_id).delete()
+            invalidate_summaries([session_cart_id, user_cart.pk])
+
+        self.user = user
+        self._remember(user_cart.pk)
+        return user_cart
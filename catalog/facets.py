@@ -0,0 +1,153 @@
+"""
+Conteos de los filtros (facetas) del listado de productos.
+
+``ProductFacetCount`` guarda cuántos productos activos hay en cada celda
+categoría × marca × rango de precio. Al guardar o eliminar un producto se
+resta uno a su celda anterior y se suma uno a la nueva (``catalog.signals``),
+así que los conteos no se recalculan sobre la tabla de productos.
+
+``facet_counts`` suma las celdas (cargadas una vez por versión del catálogo
+con ``catalog.fragments``) para la combinación de filtros actual: el conteo
+de cada valor de una faceta aplica los filtros de las otras facetas pero no
+el de la propia, como es habitual en la navegación por filtros.
+
+Los rangos de precio se definen con ``CATALOG_PRICE_BUCKETS`` (límites
+superiores, en pesos); si se cambian hay que ejecutar
+``rebuild_facet_counts``.
+"""
+from bisect import bisect_right
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .fragments import cached_fragment
+from .models import Product, ProductFacetCount
+
+DEFAULT_PRICE_BUCKETS = (20000, 50000, 100000, 200000)
+
+
+def get_price_edges():
+    return tuple(getattr(settings, 'CATALOG_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS))
+
+
+def price_bucket(price):
+    """Índice del rango de precio (0 para el más barato)"""
+    return bisect_right(get_price_edges(), price)
+
+
+def bucket_bounds(bucket):
+    """``(mínimo, máximo)`` del rango; ``None`` si no tiene límite. El máximo es exclusivo"""
+    edges = get_price_edges()
+    lower = edges[bucket - 1] if bucket > 0 else None
+    upper = edges[bucket] if bucket < len(edges) else None
+    return lower, upper
+
+
+def bucket_label(bucket):
+    def money(value):
+        return f"${value:,}".replace(',', '.')
+
+    lower, upper = bucket_bounds(bucket)
+    if lower is None:
+        return f"Menos de {money(upper)}"
+    if upper is None:
+        return f"{money(lower)} o más"
+    return f"{money(lower)} - {money(upper)}"
+
+
+def bucket_count():
+    return len(get_price_edges()) + 1
+
+
+def product_cell(category_id, brand_id, price, is_active):
+    """Celda de un producto, o ``None`` si no se cuenta (inactivo)"""
+    if not is_active:
+        return None
+    return (category_id, brand_id, price_bucket(price))
+
+
+def stored_cell(product_id):
+    """Celda del producto según la base de datos (antes de guardarlo)"""
+    row = Product.objects.filter(pk=product_id).values_list(
+        'category_id', 'brand_id', 'price', 'is_active'
+    ).first()
+    return product_cell(*row) if row else None
+
+
+def apply_change(old_cell, new_cell):
+    """Mueve un producto de ``old_cell`` a ``new_cell`` (cualquiera puede ser ``None``)"""
+    if old_cell == new_cell:
+        return
+    with transaction.atomic():
+        if old_cell is not None:
+            category_id, brand_id, bucket = old_cell
+            ProductFacetCount.objects.filter(
+                category_id=category_id, brand_id=brand_id, price_bucket=bucket
+            ).update(product_count=F('product_count') - 1)
+        if new_cell is not None:
+            category_id, brand_id, bucket = new_cell
+            cell, created = ProductFacetCount.objects.get_or_create(
+                category_id=category_id, brand_id=brand_id, price_bucket=bucket,
+                defaults={'product_count': 1},
+            )
+            if not created:
+                ProductFacetCount.objects.filter(pk=cell.pk).update(product_count=F('product_count') + 1)
+
+
+def rebuild():
+    """Recalcula todas las celdas desde los productos activos"""
+    counts = Counter(
+        product_cell(category_id, brand_id, price, True)
+        for category_id, brand_id, price in Product.objects.filter(is_active=True).values_list(
+            'category_id', 'brand_id', 'price'
+        ).iterator(chunk_size=2000)
+    )
+    with transaction.atomic():
+        ProductFacetCount.objects.all().delete()
+        ProductFacetCount.objects.bulk_create(
+            [
+                ProductFacetCount(category_id=category_id, brand_id=brand_id, price_bucket=bucket, product_count=count)
+                for (category_id, brand_id, bucket), count in counts.items()
+            ],
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+def load_cells():
+    return cached_fragment('facet_cells', lambda: list(
+        ProductFacetCount.objects.filter(product_count__gt=0).values_list(
+            'category_id', 'brand_id', 'price_bucket', 'product_count'
+        )
+    ))
+
+
+def facet_counts(category_id=None, brand_id=None, bucket=None):
+    """
+    Conteos para los filtros seleccionados (``None`` = sin filtro):
+    ``{'categories': {id: n}, 'brands': {id: n}, 'price_buckets': {i: n}, 'total': n}``
+    """
+    categories = Counter()
+    brands = Counter()
+    buckets = Counter()
+    total = 0
+    for cell_category, cell_brand, cell_bucket, count in load_cells():
+        in_category = category_id is None or cell_category == category_id
+        in_brand = brand_id is None or cell_brand == brand_id
+        in_bucket = bucket is None or cell_bucket == bucket
+        if in_brand and in_bucket:
+            categories[cell_category] += count
+        if in_category and in_bucket:
+            brands[cell_brand] += count
+        if in_category and in_brand:
+            buckets[cell_bucket] += count
+            if in_bucket:
+                total += count
+    return {
+        'categories': dict(categories),
+        'brands': dict(brands),
+        'price_buckets': dict(buckets),
+        'total': total,
+    }
@@ -0,0 +1,52 @@
+"""
+Caché de los fragmentos del catálogo de la tienda.
+
+Las secciones del home, los filtros del listado de productos, el detalle de
+un producto y sus relacionados se construyen una vez y se guardan en la
+caché compartida ya evaluados (listas de productos con sus imágenes
+precargadas). Las claves incluyen la versión del catálogo, que se
+incrementa al confirmar cualquier cambio en productos, categorías, marcas,
+imágenes o banners del home (``catalog.signals``): las entradas anteriores
+dejan de usarse y expiran solas.
+
+Las selecciones aleatorias del home se mantienen mientras dura la entrada,
+``CATALOG_FRAGMENT_CACHE_SECONDS`` segundos como máximo.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'catalog:fragments:version'
+FRAGMENT_KEY = 'catalog:fragments:{}:{}:{}'
+
+DEFAULT_TIMEOUT = 600
+
+
+def get_timeout():
+    return getattr(settings, 'CATALOG_FRAGMENT_CACHE_SECONDS', DEFAULT_TIMEOUT)
+
+
+def catalog_version():
+    return cache.get_or_set(VERSION_KEY, 0, None)
+
+
+def invalidate_catalog():
+    """Descarta todos los fragmentos en todos los procesos"""
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def cached_fragment(name, build, *parts):
+    """
+    Devuelve el fragmento ``name`` para ``parts`` desde la caché o lo
+    construye con ``build()``. Un resultado ``None`` no se guarda.
+    """
+    key = FRAGMENT_KEY.format(catalog_version(), name, ':'.join(str(part) for part in parts))
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        if value is not None:
+            cache.set(key, value, get_timeout())
+    return value
@@ -0,0 +1,205 @@
+"""
+Miniaturas de las imágenes de la tienda.
+
+Al subir una imagen de producto, categoría, marca o banner del home se
+encola un ``ImageDerivative`` con su ruta. El comando ``image_worker``
+genera versiones WebP y JPEG de los anchos de ``IMAGE_DERIVATIVE_WIDTHS``
+menores que el original y las guarda junto a él en el mismo storage:
+
+    products/foto.jpg -> products/derivatives/foto/320w.webp, .../320w.jpg
+
+``image_sets`` devuelve para cada imagen la URL original, los ``srcset``
+WebP/JPEG y una miniatura para grillas. Los anchos generados se leen de la
+caché compartida (se guardan al terminar cada trabajo); mientras una imagen
+no tiene derivados se usa el original.
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ImageDerivative
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (160, 320, 640, 1280)
+DEFAULT_QUALITY = 80
+THUMBNAIL_WIDTH = 320
+
+# Extensión -> formato de Pillow
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+DERIVATIVE_DIR = 'derivatives'
+CACHE_KEY = 'catalog:image_derivatives:{}'
+CACHE_TIMEOUT = 24 * 3600
+PENDING_CACHE_TIMEOUT = 60
+
+# Campos de imagen que tienen derivados: (modelo, campo)
+IMAGE_FIELDS = (
+    ('catalog.ProductImage', 'image'),
+    ('catalog.Category', 'image'),
+    ('catalog.Brand', 'logo'),
+    ('custom_admin.HomeBannerConfig', 'image'),
+)
+
+
+def get_widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_WIDTHS)))
+
+
+def derivative_name(source, width, extension):
+    """Ruta del derivado de ``source`` con el ancho y formato indicados"""
+    directory, filename = posixpath.split(posixpath.splitext(source)[0])
+    return posixpath.join(directory, DERIVATIVE_DIR, filename, f'{width}w.{extension}')
+
+
+def enqueue(sources):
+    """Encola las imágenes que todavía no tienen derivados; devuelve cuántas"""
+    sources = {source for source in sources if source}
+    if not sources:
+        return 0
+    existing = set(ImageDerivative.objects.filter(source__in=sources).values_list('source', flat=True))
+    missing = [ImageDerivative(source=source) for source in sorted(sources - existing)]
+    ImageDerivative.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(missing)
+
+
+def field_sources(model_label, field_name):
+    """Rutas de todas las imágenes guardadas en un campo"""
+    model = apps.get_model(model_label)
+    return model.objects.exclude(**{field_name: ''}).exclude(
+        **{f'{field_name}__isnull': True}
+    ).values_list(field_name, flat=True).iterator(chunk_size=2000)
+
+
+def _save_variant(image, name, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', DEFAULT_QUALITY))
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate(source):
+    """Genera los derivados de una imagen; devuelve ``(ancho original, anchos generados)``"""
+    with default_storage.open(source, 'rb') as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info or 'A' in original.getbands() else 'RGB')
+
+    widths = [width for width in get_widths() if width < original.width]
+    for width in widths:
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.LANCZOS)
+        for extension, image_format in FORMATS.items():
+            _save_variant(resized, derivative_name(source, width, extension), image_format)
+    return original.width, widths
+
+
+def run_derivative(record):
+    """
+    Genera los derivados de un registro pendiente. Devuelve ``False`` si
+    otro worker ya lo había tomado.
+    """
+    claimed = ImageDerivative.objects.filter(pk=record.pk, status='pending').update(status='running')
+    if not claimed:
+        return False
+
+    try:
+        record.original_width, record.widths = generate(record.source)
+        record.status = 'completed'
+        record.error_message = ''
+    except Exception as e:
+        logger.exception('Error generando los derivados de %s', record.source)
+        record.widths = []
+        record.status = 'failed'
+        record.error_message = str(e)
+    record.completed_at = timezone.now()
+    record.save()
+    cache.set(CACHE_KEY.format(record.source), (record.original_width, tuple(record.widths)), CACHE_TIMEOUT)
+    return True
+
+
+def run_pending(limit=None):
+    """Procesa las imágenes pendientes en orden de llegada; devuelve cuántas procesó"""
+    processed = 0
+    while limit is None or processed < limit:
+        record = ImageDerivative.objects.filter(status='pending').order_by('created_at', 'pk').first()
+        if record is None:
+            break
+        if run_derivative(record):
+            processed += 1
+    return processed
+
+
+def derivative_widths(sources):
+    """``{ruta: (ancho original, anchos generados)}`` desde la caché, completando con una consulta"""
+    sources = {source for source in sources if source}
+    keys = {CACHE_KEY.format(source): source for source in sources}
+    found = {keys[key]: widths for key, widths in cache.get_many(keys).items()}
+
+    missing = sources - set(found)
+    if missing:
+        completed = {
+            source: (original_width, tuple(widths))
+            for source, original_width, widths in ImageDerivative.objects.filter(
+                source__in=missing, status='completed'
+            ).values_list('source', 'original_width', 'widths')
+        }
+        for source in missing:
+            found[source] = completed.get(source, (None, ()))
+            # Lo que aún no tiene derivados se vuelve a consultar pronto
+            cache.set(
+                CACHE_KEY.format(source), found[source],
+                CACHE_TIMEOUT if source in completed else PENDING_CACHE_TIMEOUT,
+            )
+    return found
+
+
+def build_image_set(source, original_width=None, widths=()):
+    if not source:
+        return {'src': None, 'thumbnail': None, 'srcset_webp': '', 'srcset_jpeg': ''}
+
+    def srcset(extension):
+        candidates = [
+            f'{default_storage.url(derivative_name(source, width, extension))} {width}w' for width in widths
+        ]
+        # Para pantallas más anchas que el mayor derivado queda el original
+        if candidates and original_width:
+            candidates.append(f'{default_storage.url(source)} {original_width}w')
+        return ', '.join(candidates)
+
+    thumbnail_width = next((width for width in widths if width >= THUMBNAIL_WIDTH), None)
+    return {
+        'src': default_storage.url(source),
+        'thumbnail': (
+            default_storage.url(derivative_name(source, thumbnail_width, 'webp'))
+            if thumbnail_width else default_storage.url(source)
+        ),
+        'srcset_webp': srcset('webp'),
+        'srcset_jpeg': srcset('jpg'),
+    }
+
+
+def image_sets(sources):
+    """``{ruta: {'src', 'thumbnail', 'srcset_webp', 'srcset_jpeg'}}`` para varias imágenes"""
+    sources = [str(source) for source in sources if source]
+    widths = derivative_widths(sources)
+    return {source: build_image_set(source, *widths[source]) for source in sources}
+
+
+def image_set(source):
+    source = str(source) if source else ''
+    return image_sets([source]).get(source) or build_image_set('')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from catalog import images
+from catalog.models import ImageDerivative
+
+
+class Command(BaseCommand):
+    help = 'Encola las miniaturas de las imágenes ya subidas (productos, categorías, marcas y banners)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Volver a generar también las imágenes que ya tienen miniaturas',
+        )
+        parser.add_argument(
+            '--run',
+            action='store_true',
+            help='Generar las miniaturas ahora en lugar de dejarlas al worker',
+        )
+
+    def handle(self, *args, **options):
+        queued = 0
+        for model_label, field_name in images.IMAGE_FIELDS:
+            sources = list(images.field_sources(model_label, field_name))
+            if options['force']:
+                ImageDerivative.objects.filter(source__in=sources).exclude(
+                    status='running'
+                ).update(status='pending', error_message='')
+            queued += images.enqueue(sources)
+            self.stdout.write(f'{model_label}.{field_name}: {len(sources)} imágenes')
+
+        pending = ImageDerivative.objects.filter(status='pending').count()
+        self.stdout.write(f'{queued} imágenes nuevas en cola ({pending} pendientes)')
+
+        if options['run']:
+            processed = images.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'✓ {processed} imágenes procesadas'))
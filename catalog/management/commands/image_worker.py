@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from catalog import images
+from catalog.models import ImageDerivative
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas de las imágenes en cola'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Segundos de espera cuando la cola está vacía (por defecto 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Procesar las imágenes pendientes una vez y terminar',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Mostrar las imágenes por estado y terminar',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.show_stats()
+            return
+
+        total = 0
+        try:
+            while True:
+                processed = images.run_pending()
+                total += processed
+                if processed:
+                    self.stdout.write(self.style.SUCCESS(f'✓ {processed} imágenes procesadas'))
+
+                if options['once']:
+                    break
+                if not processed:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('\nDetenido por el usuario')
+
+        self.stdout.write(f'Total: {total} imágenes procesadas')
+
+    def show_stats(self):
+        counts = dict(
+            ImageDerivative.objects.order_by().values_list('status').annotate(count=Count('id'))
+        )
+        self.stdout.write('--- Miniaturas de Imágenes ---')
+        for status, label in ImageDerivative.STATUS_CHOICES:
+            self.stdout.write(f'{label}: {counts.get(status, 0)}')
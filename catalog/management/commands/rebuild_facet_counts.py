@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from catalog import facets
+from catalog.fragments import invalidate_catalog
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los conteos de filtros del catálogo (ProductFacetCount)'
+
+    def handle(self, *args, **options):
+        cells = facets.rebuild()
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f'✓ Conteos reconstruidos ({cells} celdas)'))
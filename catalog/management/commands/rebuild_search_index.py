@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import Product, ProductSearchTerm
+from catalog.search import index_products
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos (ProductSearchTerm)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Productos a indexar por lote (por defecto 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+
+        self.stdout.write(f'Indexando {len(product_ids)} productos...')
+
+        for start in range(0, len(product_ids), batch_size):
+            index_products(product_ids[start:start + batch_size])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ Índice reconstruido ({ProductSearchTerm.objects.count()} términos)')
+        )
@@ -0,0 +1,123 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:03
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Copia del tokenizador de catalog.search al momento de esta migración, para
+# que los cambios posteriores a ese módulo no alteren la migración
+
+MAX_TERM_LENGTH = 100
+
+FIELD_WEIGHTS = {
+    'sku': 10,
+    'barcode': 10,
+    'name': 8,
+    'brand': 4,
+    'category': 3,
+    'short_description': 2,
+    'description': 1,
+}
+
+CODE_FIELDS = ('sku', 'barcode')
+
+STOPWORDS = {
+    'a', 'al', 'con', 'de', 'del', 'e', 'el', 'en', 'es', 'la', 'las', 'lo',
+    'los', 'o', 'para', 'por', 'que', 'se', 'sin', 'su', 'sus', 'u', 'un',
+    'una', 'unas', 'unos', 'y',
+}
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+CODE_PART_RE = re.compile(r'[a-z]+|[0-9]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def stem(word):
+    if word.isdigit():
+        return word
+    if len(word) > 4 and word.endswith('es') and word[-3] in 'dlnrjz':
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [
+        stem(word)[:MAX_TERM_LENGTH]
+        for word in WORD_RE.findall(normalize(text))
+        if word not in STOPWORDS
+    ]
+
+
+def code_terms(code):
+    code = normalize(code)
+    terms = [''.join(WORD_RE.findall(code))] + CODE_PART_RE.findall(code)
+    return [term[:MAX_TERM_LENGTH] for term in terms if term]
+
+
+def product_terms(product):
+    texts = {
+        'sku': product.sku,
+        'barcode': product.barcode,
+        'name': product.name,
+        'brand': product.brand.name,
+        'category': product.category.name,
+        'short_description': product.short_description,
+        'description': product.description,
+    }
+    terms = {}
+    for field, text in texts.items():
+        tokens = code_terms(text) if field in CODE_FIELDS else tokenize(text)
+        for term in tokens:
+            terms[term] = max(terms.get(term, 0), FIELD_WEIGHTS[field])
+    return terms
+
+
+def populate_search_terms(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    ProductSearchTerm = apps.get_model('catalog', 'ProductSearchTerm')
+
+    entries = []
+    for product in Product.objects.select_related('brand', 'category').iterator(chunk_size=500):
+        entries.extend(
+            ProductSearchTerm(product_id=product.pk, term=term, weight=weight)
+            for term, weight in product_terms(product).items()
+        )
+        if len(entries) >= 5000:
+            ProductSearchTerm.objects.bulk_create(entries)
+            entries = []
+    ProductSearchTerm.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100, verbose_name='Término')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='Peso')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='catalog.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Término de búsqueda',
+                'verbose_name_plural': 'Términos de búsqueda',
+                'indexes': [models.Index(fields=['term'], name='catalog_pro_term_77ac60_idx')],
+                'unique_together': {('product', 'term')},
+            },
+        ),
+        migrations.RunPython(populate_search_terms, migrations.RunPython.noop),
+    ]
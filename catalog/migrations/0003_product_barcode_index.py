@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_productsearchterm'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='barcode',
+            field=models.CharField(blank=True, db_index=True, max_length=50, verbose_name='Código de barras'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_facet_counts(apps, schema_editor):
+    from collections import Counter
+
+    from catalog.facets import price_bucket
+
+    Product = apps.get_model('catalog', 'Product')
+    ProductFacetCount = apps.get_model('catalog', 'ProductFacetCount')
+
+    counts = Counter(
+        (category_id, brand_id, price_bucket(price))
+        for category_id, brand_id, price in Product.objects.filter(is_active=True).values_list(
+            'category_id', 'brand_id', 'price'
+        ).iterator(chunk_size=2000)
+    )
+    ProductFacetCount.objects.bulk_create(
+        [
+            ProductFacetCount(category_id=category_id, brand_id=brand_id, price_bucket=bucket, product_count=count)
+            for (category_id, brand_id, bucket), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_product_barcode_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.PositiveSmallIntegerField(verbose_name='Rango de precio')),
+                ('product_count', models.IntegerField(default=0, verbose_name='Productos')),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='catalog.brand', verbose_name='Marca')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='catalog.category', verbose_name='Categoría')),
+            ],
+            options={
+                'verbose_name': 'Conteo de filtros',
+                'verbose_name_plural': 'Conteos de filtros',
+                'unique_together': {('category', 'brand', 'price_bucket')},
+            },
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_productfacetcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Imagen original')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'Procesando'), ('completed', 'Completado'), ('failed', 'Fallido')], default='pending', max_length=20, verbose_name='Estado')),
+                ('original_width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Ancho original')),
+                ('widths', models.JSONField(blank=True, default=list, verbose_name='Anchos generados')),
+                ('error_message', models.TextField(blank=True, verbose_name='Mensaje de error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creado en')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='Completado en')),
+            ],
+            options={
+                'verbose_name': 'Derivados de imagen',
+                'verbose_name_plural': 'Derivados de imágenes',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='catalog_ima_status_a7f025_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_primary_images(apps, schema_editor):
+    from django.db.models import OuterRef, Subquery
+
+    Product = apps.get_model('catalog', 'Product')
+    ProductImage = apps.get_model('catalog', 'ProductImage')
+
+    Product.objects.update(primary_image=Subquery(
+        ProductImage.objects.filter(product=OuterRef('pk')).order_by(
+            '-is_primary', 'order', 'created_at', 'pk'
+        ).values('pk')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_imagederivative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.productimage', verbose_name='Imagen principal'),
+        ),
+        migrations.RunPython(populate_primary_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productsearchterm',
+            name='catalog_pro_term_77ac60_idx',
+        ),
+        migrations.AddIndex(
+            model_name='productsearchterm',
+            index=models.Index(fields=['term'], name='catalog_term_pattern_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
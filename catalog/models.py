@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.core.files.storage import default_storage
 from django.urls import reverse
 from django.core.validators import MinValueValidator
 from django.utils.text import slugify
@@ -64,6 +67,55 @@ class Brand(models.Model):
         super().save(*args, **kwargs)
 
 
+# Orden para elegir la imagen principal: la marcada como principal y luego la primera
+PRIMARY_IMAGE_ORDER = ('-is_primary', 'order', 'created_at', 'pk')
+
+
+class ProductQuerySet(models.QuerySet):
+    def refresh_primary_images(self):
+        """Recalcula ``primary_image`` de los productos en un solo UPDATE"""
+        return self.update(primary_image=Subquery(
+            ProductImage.objects.filter(product=OuterRef('pk')).order_by(*PRIMARY_IMAGE_ORDER).values('pk')[:1]
+        ))
+
+    def with_stock_totals(self, warehouse=None):
+        """
+        Anota ``total_stock`` (suma de todas las bodegas, leída del resumen
+        ``ProductStockSummary``) y ``primary_image_path`` en la misma consulta
+        de productos, y si se indica una bodega, también ``warehouse_stock``.
+        """
+        from inventory.models import Stock
+
+        stock = Stock.objects.filter(product=OuterRef('pk')).order_by()
+
+        queryset = self.annotate(
+            total_stock=Coalesce(F('stock_summary__total_quantity'), 0),
+            primary_image_path=F('primary_image__image'),
+        )
+        if warehouse is not None:
+            queryset = queryset.annotate(
+                warehouse_stock=Coalesce(
+                    Subquery(stock.filter(warehouse=warehouse).values('quantity')[:1]), 0
+                ),
+            )
+        return queryset
+
+    def with_stock_levels(self):
+        """
+        Precarga el stock por bodega en ``stock_levels`` (una sola consulta
+        adicional para todos los productos)
+        """
+        from inventory.models import Stock
+
+        return self.prefetch_related(
+            Prefetch(
+                'stock_set',
+                queryset=Stock.objects.select_related('warehouse').order_by('warehouse__name'),
+                to_attr='stock_levels',
+            )
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200, verbose_name="Nombre")
     slug = models.SlugField(unique=True, verbose_name="Slug")
@@ -81,7 +133,7 @@ class Product(models.Model):
     
     # Características del producto
     sku = models.CharField(max_length=50, unique=True, verbose_name="SKU")
-    barcode = models.CharField(max_length=50, blank=True, verbose_name="Código de barras")
+    barcode = models.CharField(max_length=50, blank=True, db_index=True, verbose_name="Código de barras")
     weight = models.DecimalField(max_digits=8, decimal_places=3, blank=True, null=True, verbose_name="Peso (kg)")
     dimensions = models.CharField(max_length=100, blank=True, verbose_name="Dimensiones")
     
@@ -89,10 +141,18 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True, verbose_name="Activo")
     is_featured = models.BooleanField(default=False, verbose_name="Destacado")
     
+    # Imagen principal desnormalizada; la mantienen las señales de ProductImage
+    primary_image = models.ForeignKey(
+        'ProductImage', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='+', verbose_name="Imagen principal"
+    )
+    
     # Metadatos
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Creado en")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Actualizado en")
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
@@ -112,6 +172,13 @@ class Product(models.Model):
             self.slug = slug
         if self.sku:
             self.sku = self.sku.strip().upper()
+        if kwargs.get('update_fields') is not None:
+            # primary_image solo lo escribe refresh_primary_images (un UPDATE);
+            # un save() completo lo vuelve a calcular después (ver
+            # catalog.signals.refresh_primary_image)
+            kwargs['update_fields'] = [
+                name for name in kwargs['update_fields'] if name not in ('primary_image', 'primary_image_id')
+            ]
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
@@ -128,12 +195,83 @@ class Product(models.Model):
         return self.price * (self.iva_percentage / 100)
     
     def get_main_image(self):
-        """Obtiene la imagen principal del producto"""
-        main_image = self.images.filter(is_primary=True).first()
-        if main_image:
-            return main_image
-        # Si no hay imagen principal, devuelve la primera imagen
-        return self.images.first()
+        """
+        Obtiene la imagen principal del producto. Usa las imágenes precargadas
+        (``prefetch_related('images')``) o el puntero ``primary_image``
+        (``select_related('primary_image')``) sin consultas adicionales.
+        """
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('images')
+        if prefetched is not None:
+            images = list(prefetched)
+            # Si no hay imagen principal, devuelve la primera imagen
+            return next((image for image in images if image.is_primary), images[0] if images else None)
+        return self.primary_image
+
+    @property
+    def main_image_url(self):
+        """
+        URL de la imagen principal; usa la anotación de
+        ``with_stock_totals()`` si está disponible para no consultar imágenes
+        """
+        if hasattr(self, 'primary_image_path'):
+            return default_storage.url(self.primary_image_path) if self.primary_image_path else None
+        main_image = self.get_main_image()
+        return main_image.image.url if main_image else None
+
+    def get_total_stock(self):
+        """Stock total en todas las bodegas"""
+        if hasattr(self, 'total_stock'):
+            return self.total_stock
+        from inventory.models import ProductStockSummary
+        try:
+            return self.stock_summary.total_quantity
+        except ProductStockSummary.DoesNotExist:
+            return 0
+
+
+class ProductSearchTerm(models.Model):
+    """
+    Índice invertido de búsqueda: un término normalizado (sin tildes, en
+    minúsculas y sin plurales) por producto, con el peso del campo más
+    relevante donde aparece. Lo mantiene ``catalog.search`` al guardar
+    productos, categorías y marcas.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms', verbose_name="Producto")
+    term = models.CharField(max_length=100, verbose_name="Término")
+    weight = models.PositiveSmallIntegerField(default=1, verbose_name="Peso")
+
+    class Meta:
+        verbose_name = "Término de búsqueda"
+        verbose_name_plural = "Términos de búsqueda"
+        unique_together = ['product', 'term']
+        indexes = [
+            # La búsqueda filtra por prefijo (LIKE 'term%'); en PostgreSQL un
+            # índice normal solo sirve para LIKE con la colación C
+            models.Index(fields=['term'], name='catalog_term_pattern_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} ({self.weight})"
+
+
+class ProductFacetCount(models.Model):
+    """
+    Cantidad de productos activos por combinación de categoría, marca y
+    rango de precio. Los filtros del listado suman estas celdas en lugar de
+    contar productos; la mantiene ``catalog.facets`` al guardar productos.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facet_counts', verbose_name="Categoría")
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='facet_counts', verbose_name="Marca")
+    price_bucket = models.PositiveSmallIntegerField(verbose_name="Rango de precio")
+    product_count = models.IntegerField(default=0, verbose_name="Productos")
+
+    class Meta:
+        verbose_name = "Conteo de filtros"
+        verbose_name_plural = "Conteos de filtros"
+        unique_together = ['category', 'brand', 'price_bucket']
+
+    def __str__(self):
+        return f"{self.category} / {self.brand} / {self.price_bucket}: {self.product_count}"
 
 
 class ProductImage(models.Model):
@@ -153,6 +291,38 @@ class ProductImage(models.Model):
         return f"{self.product.name} - Imagen {self.order}"
 
 
+class ImageDerivative(models.Model):
+    """
+    Miniaturas WebP/JPEG generadas para una imagen subida (producto,
+    categoría, marca o banner), identificada por su ruta en el storage.
+    Cada registro es también un trabajo en cola para ``image_worker``.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('running', 'Procesando'),
+        ('completed', 'Completado'),
+        ('failed', 'Fallido'),
+    ]
+
+    source = models.CharField(max_length=255, unique=True, verbose_name="Imagen original")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Estado")
+    original_width = models.PositiveIntegerField(null=True, blank=True, verbose_name="Ancho original")
+    widths = models.JSONField(default=list, blank=True, verbose_name="Anchos generados")
+    error_message = models.TextField(blank=True, verbose_name="Mensaje de error")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Creado en")
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="Completado en")
+
+    class Meta:
+        verbose_name = "Derivados de imagen"
+        verbose_name_plural = "Derivados de imágenes"
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.source} ({self.get_status_display()})"
+
+
 class Cart(models.Model):
     session_key = models.CharField(max_length=40, blank=True, null=True, verbose_name="Clave de sesión")
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE, blank=True, null=True, verbose_name="Usuario")
@@ -170,11 +340,13 @@ class Cart(models.Model):
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        from .cart import get_summary
+        return get_summary(self.pk)['items_count']
 
     @property
     def total_amount(self):
-        return sum(item.total for item in self.items.all())
+        from .cart import get_summary
+        return get_summary(self.pk)['total']
 
     @property
     def total_iva(self):
@@ -0,0 +1,154 @@
+"""
+Búsqueda de productos sobre el índice invertido ``ProductSearchTerm``.
+
+El texto de cada producto (nombre, SKU, código de barras, marca, categoría
+y descripciones) se normaliza a términos sin tildes, en minúsculas, sin
+palabras vacías del español y sin plurales, y se guarda con el peso del
+campo donde aparece. Una búsqueda exige que cada término de la consulta
+coincida como prefijo de algún término del producto (``term__startswith``
+sobre el índice de ``term`` con ``varchar_pattern_ops``, en lugar de
+``icontains`` sobre cada columna) y ordena
+los resultados por la suma de pesos, con el doble de peso para las
+coincidencias exactas.
+
+``search_products`` es el punto de entrada de todas las vistas de
+búsqueda; ``index_products`` reconstruye el índice de los productos dados.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+
+from .models import Product, ProductSearchTerm
+
+MAX_TERM_LENGTH = 100
+
+FIELD_WEIGHTS = {
+    'sku': 10,
+    'barcode': 10,
+    'name': 8,
+    'brand': 4,
+    'category': 3,
+    'short_description': 2,
+    'description': 1,
+}
+
+CODE_FIELDS = ('sku', 'barcode')
+
+STOPWORDS = {
+    'a', 'al', 'con', 'de', 'del', 'e', 'el', 'en', 'es', 'la', 'las', 'lo',
+    'los', 'o', 'para', 'por', 'que', 'se', 'sin', 'su', 'sus', 'u', 'un',
+    'una', 'unas', 'unos', 'y',
+}
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+CODE_PART_RE = re.compile(r'[a-z]+|[0-9]+')
+
+
+def normalize(text):
+    """Minúsculas y sin tildes ("Proteína" -> "proteina")"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def stem(word):
+    """Quita el plural de una palabra ("vitaminas" -> "vitamina", "colores" -> "color")"""
+    if word.isdigit():
+        return word
+    if len(word) > 4 and word.endswith('es') and word[-3] in 'dlnrjz':
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Términos de búsqueda de un texto libre"""
+    return [
+        stem(word)[:MAX_TERM_LENGTH]
+        for word in WORD_RE.findall(normalize(text))
+        if word not in STOPWORDS
+    ]
+
+
+def code_terms(code):
+    """Términos de un código: completo y por partes ("SKU-001" -> sku001, sku, 001)"""
+    code = normalize(code)
+    terms = [''.join(WORD_RE.findall(code))] + CODE_PART_RE.findall(code)
+    return [term[:MAX_TERM_LENGTH] for term in terms if term]
+
+
+def product_terms(product):
+    """Diccionario ``término -> peso`` de un producto (el peso mayor gana)"""
+    texts = {
+        'sku': product.sku,
+        'barcode': product.barcode,
+        'name': product.name,
+        'brand': product.brand.name,
+        'category': product.category.name,
+        'short_description': product.short_description,
+        'description': product.description,
+    }
+    terms = {}
+    for field, text in texts.items():
+        tokens = code_terms(text) if field in CODE_FIELDS else tokenize(text)
+        for term in tokens:
+            terms[term] = max(terms.get(term, 0), FIELD_WEIGHTS[field])
+    return terms
+
+
+def index_products(product_ids):
+    """Reconstruye los términos de búsqueda de los productos indicados"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+
+    products = Product.objects.filter(pk__in=product_ids).select_related('brand', 'category')
+    entries = [
+        ProductSearchTerm(product=product, term=term, weight=weight)
+        for product in products
+        for term, weight in product_terms(product).items()
+    ]
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id__in=product_ids).delete()
+        ProductSearchTerm.objects.bulk_create(entries, batch_size=1000)
+
+
+def search_products(queryset, query):
+    """
+    Filtra ``queryset`` a los productos que coinciden con todos los términos
+    de ``query`` y anota ``search_rank``. El orden por relevancia queda a
+    cargo de quien llama (``order_by('-search_rank')``), para que las vistas
+    con orden explícito lo conserven.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return queryset.annotate(search_rank=Value(0, output_field=IntegerField())).none()
+
+    prefixes = [Q(term__startswith=term) for term in terms]
+    any_prefix = Q()
+    for prefix in prefixes:
+        any_prefix |= prefix
+
+    # Candidatos: productos con el término más largo (el más selectivo)
+    longest = max(range(len(terms)), key=lambda i: len(terms[i]))
+    candidates = ProductSearchTerm.objects.filter(prefixes[longest]).values('product_id')
+
+    # Cada término de la consulta se cuenta por separado: un mismo término
+    # del producto puede cumplir varios prefijos ("cre crema")
+    matched = {f'matched_{i}': Count('pk', filter=prefix) for i, prefix in enumerate(prefixes)}
+    rank = ProductSearchTerm.objects.filter(any_prefix, product=OuterRef('pk')).order_by().values(
+        'product'
+    ).annotate(
+        **matched,
+        rank=Sum(Case(
+            When(term__in=terms, then=F('weight') * 2),
+            default=F('weight'),
+            output_field=IntegerField(),
+        )),
+    ).filter(**{f'{name}__gt': 0 for name in matched}).values('rank')
+
+    return queryset.filter(pk__in=candidates).annotate(
+        search_rank=Subquery(rank, output_field=IntegerField())
+    ).filter(search_rank__isnull=False)
@@ -1,11 +1,30 @@
 from rest_framework import serializers
+from .images import image_set
 from .models import Product, Category, Brand, ProductImage
 
 
+class ResponsiveImageField(serializers.Field):
+    """Miniatura y ``srcset`` WebP/JPEG de un campo de imagen (solo lectura)"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        variants = image_set(value.name if value else '')
+        return {
+            'thumbnail': variants['thumbnail'],
+            'srcset': variants['srcset_webp'],
+            'srcset_jpeg': variants['srcset_jpeg'],
+        }
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = ResponsiveImageField(source='image')
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_primary']
+        fields = ['id', 'image', 'variants', 'is_primary']
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -25,22 +44,21 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
     
     def get_stock(self, obj):
-        # Obtener el stock total de todas las bodegas
-        from inventory.models import Stock
-        from django.db.models import Sum
-        total_stock = Stock.objects.filter(product=obj).aggregate(
-            total=Sum('quantity')
-        )['total'] or 0
-        return total_stock
+        # Stock total de todas las bodegas (anotado por with_stock_totals())
+        return obj.get_total_stock()
 
 
 class CategorySerializer(serializers.ModelSerializer):
+    image_variants = ResponsiveImageField(source='image')
+
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description', 'image', 'is_active']
+        fields = ['id', 'name', 'description', 'image', 'image_variants', 'is_active']
 
 
 class BrandSerializer(serializers.ModelSerializer):
+    logo_variants = ResponsiveImageField(source='logo')
+
     class Meta:
         model = Brand
-        fields = ['id', 'name', 'description', 'logo', 'website', 'is_active']
\ No newline at end of file
+        fields = ['id', 'name', 'description', 'logo', 'logo_variants', 'website', 'is_active']
\ No newline at end of file
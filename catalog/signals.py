@@ -0,0 +1,166 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import facets, images
+from .cart import invalidate_summaries
+from .fragments import invalidate_catalog
+from .models import Brand, CartItem, Category, Product, ProductImage
+from .search import index_products
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw=False, **kwargs):
+    """
+    Mantiene actualizados los términos de búsqueda del producto
+    """
+    if raw:
+        return
+    index_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def index_products_on_name_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    El nombre de la categoría y de la marca también se indexa en sus productos
+    """
+    if raw or created or (update_fields is not None and 'name' not in update_fields):
+        return
+    lookup = 'category' if sender is Category else 'brand'
+    index_products(Product.objects.filter(**{lookup: instance}).values_list('pk', flat=True))
+
+
+FACET_FIELDS = {'category', 'category_id', 'brand', 'brand_id', 'price', 'is_active'}
+
+
+# Valores con los que se calcula la celda de conteos, en el orden de product_cell
+FACET_ATTNAMES = ('category_id', 'brand_id', 'price', 'is_active')
+
+
+def facet_fields_changed(update_fields):
+    return update_fields is None or bool(FACET_FIELDS & set(update_fields))
+
+
+def remember_facet_values(instance):
+    data = instance.__dict__
+    if all(attname in data for attname in FACET_ATTNAMES):
+        data['_facet_values'] = tuple(data[attname] for attname in FACET_ATTNAMES)
+
+
+@receiver(post_init, sender=Product)
+def remember_loaded_facet_values(sender, instance, **kwargs):
+    """
+    Guarda los valores de facetas con los que se cargó el producto, para
+    conocer su celda anterior al guardarlo sin volver a leerla
+    """
+    if instance.pk is not None:
+        remember_facet_values(instance)
+
+
+@receiver(pre_save, sender=Product)
+def remember_facet_cell(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or not facet_fields_changed(update_fields):
+        return
+    values = instance.__dict__.get('_facet_values')
+    # Campos diferidos al cargar: leer la celda guardada
+    instance._facet_cell = facets.product_cell(*values) if values else facets.stored_cell(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def update_facet_counts_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Mueve el producto a su nueva celda de conteos (categoría, marca, precio, activo)
+    """
+    if raw or not facet_fields_changed(update_fields):
+        return
+    old_cell = None if created else instance.__dict__.pop('_facet_cell', None)
+    facets.apply_change(old_cell, facets.product_cell(
+        instance.category_id, instance.brand_id, instance.price, instance.is_active
+    ))
+    # El siguiente guardado se compara contra lo que se acaba de guardar
+    remember_facet_values(instance)
+
+
+@receiver(post_delete, sender=Product)
+def update_facet_counts_on_delete(sender, instance, **kwargs):
+    facets.apply_change(facets.product_cell(
+        instance.category_id, instance.brand_id, instance.price, instance.is_active
+    ), None)
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_summary(sender, instance, **kwargs):
+    """
+    El contador y el total en caché se recalculan en la siguiente lectura
+    """
+    cart_id = instance.cart_id
+    transaction.on_commit(lambda: invalidate_summaries([cart_id]))
+
+
+@receiver(post_save, sender=Product)
+def invalidate_cart_summaries_on_product_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    El total de los carritos que tienen el producto depende de su precio
+    """
+    if raw or created or (update_fields is not None and 'price' not in update_fields):
+        return
+    cart_ids = list(CartItem.objects.filter(product=instance).values_list('cart_id', flat=True))
+    if cart_ids:
+        transaction.on_commit(lambda: invalidate_summaries(cart_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender='custom_admin.HomeBannerConfig')
+@receiver(post_delete, sender='custom_admin.HomeBannerConfig')
+def invalidate_catalog_fragments(sender, raw=False, **kwargs):
+    """
+    Cualquier cambio en el catálogo descarta las secciones en caché de la tienda
+    """
+    if raw:
+        return
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender='custom_admin.HomeBannerConfig')
+def enqueue_image_derivatives(sender, instance, raw=False, **kwargs):
+    """
+    Las imágenes nuevas quedan en cola para que ``image_worker`` genere sus miniaturas
+    """
+    if raw:
+        return
+    field_name = 'logo' if sender is Brand else 'image'
+    source = getattr(instance, field_name).name
+    if source:
+        transaction.on_commit(lambda: images.enqueue([source]))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_primary_image(sender, instance, raw=False, created=False, update_fields=None, **kwargs):
+    """
+    Mantiene ``Product.primary_image`` al agregar, cambiar o eliminar imágenes.
+    Tras guardar un producto que escribió el puntero (un ``save()`` completo)
+    lo vuelve a calcular, por si la instancia lo cargó antes de cambiar sus
+    imágenes.
+    """
+    if raw:
+        return
+    if sender is Product:
+        if created or (update_fields is not None and 'primary_image' not in update_fields):
+            return
+        product_id = instance.pk
+    else:
+        product_id = instance.product_id
+    Product.objects.filter(pk=product_id).refresh_primary_images()
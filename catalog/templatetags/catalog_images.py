@@ -0,0 +1,14 @@
+from django import template
+
+from catalog.images import image_set
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image):
+    """
+    URLs de una imagen y sus miniaturas para ``<picture>``/``srcset``
+    Uso: {% responsive_image product.images.first.image as img %}
+    """
+    return image_set(getattr(image, 'name', image))
@@ -2,16 +2,20 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib.auth.models import User
 from django.views.generic import ListView, DetailView, View, TemplateView
-from django.db.models import Q, Count, Sum
+from django.db.models import Count, Sum
 from django.db.utils import OperationalError, ProgrammingError
 from django.core.paginator import Paginator
 from django.conf import settings
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.core.mail import send_mail
 from .models import Product, Category, Brand, Cart, CartItem
+from .search import search_products
+from . import facets
+from .cart import CartService, compute_summary
+from .fragments import cached_fragment
 from .forms import CartAddForm, CheckoutForm
 from orders.models import Order, OrderItem, ShippingRate
 from customers.models import Customer, City
@@ -24,29 +28,7 @@ FIXED_SHIPPING_COST = Decimal('14000.00')
 
 
 def merge_session_cart_into_user_cart(request, user):
-    if not request.session.session_key:
-        request.session.create()
-
-    session_cart = Cart.objects.filter(session_key=request.session.session_key).first()
-    if not session_cart or not session_cart.items.exists():
-        Cart.objects.get_or_create(user=user)
-        return
-
-    user_cart, _ = Cart.objects.get_or_create(user=user)
-    for item in session_cart.items.select_related('product').all():
-        existing = CartItem.objects.filter(cart=user_cart, product=item.product).first()
-        if existing:
-            existing.quantity += item.quantity
-            existing.save()
-        else:
-            item.cart = user_cart
-            item.save()
-
-    CartItem.objects.filter(cart=session_cart).delete()
-    try:
-        session_cart.delete()
-    except Exception:
-        pass
+    CartService(request).merge_into_user(user)
 
 
 class FrontendLoginView(View):
@@ -89,16 +71,20 @@ class HomeView(TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
+        context.update(cached_fragment('home', self.build_sections))
+        return context
+
+    def build_sections(self):
+        """Secciones del home, evaluadas para guardarlas en caché"""
         # Obtener productos recientes para la sección RECENT PRODUCTS
-        recent_products = Product.objects.filter(
+        recent_products = list(Product.objects.filter(
             is_active=True
-        ).select_related('category', 'brand').prefetch_related('images').order_by('-created_at')[:6]  # Últimos 6 productos
+        ).select_related('category', 'brand').prefetch_related('images').order_by('-created_at')[:6])  # Últimos 6 productos
         
         # Obtener productos destacados (si tienes un campo featured)
-        featured_products = Product.objects.filter(
+        featured_products = list(Product.objects.filter(
             is_active=True
-        ).select_related('category', 'brand').prefetch_related('images').order_by('?')[:3]  # 3 productos aleatorios como destacados
+        ).select_related('category', 'brand').prefetch_related('images').order_by('?')[:3])  # 3 productos aleatorios como destacados
         
         # Obtener producto más vendido para la sección supplement
         featured_product = Product.objects.filter(
@@ -109,7 +95,7 @@ class HomeView(TemplateView):
 
         # Si no hay ventas registradas, usar el más reciente
         if (not featured_product or not getattr(featured_product, 'total_sold', None)) and recent_products:
-            featured_product = recent_products.first()
+            featured_product = recent_products[0]
 
         # Productos para slider de la sección supplement
         supplement_products = []
@@ -137,7 +123,7 @@ class HomeView(TemplateView):
         
         # Si no hay productos, usar el primero de recent_products
         if not banner_product and recent_products:
-            banner_product = recent_products.first()
+            banner_product = recent_products[0]
         
         # Obtener producto destacado para la sección shop-details
         shop_featured_product = Product.objects.filter(
@@ -146,7 +132,7 @@ class HomeView(TemplateView):
         
         # Si no hay productos, usar el primero de recent_products
         if not shop_featured_product and recent_products:
-            shop_featured_product = recent_products.first()
+            shop_featured_product = recent_products[0]
         
         # Obtener productos para la sección de planes/precios (solo categoría ID 11)
         pricing_products = list(Product.objects.filter(
@@ -162,7 +148,7 @@ class HomeView(TemplateView):
         except (OperationalError, ProgrammingError):
             home_banners = []
         
-        context.update({
+        return {
             'recent_products': recent_products,
             'featured_products': featured_products,
             'featured_product': featured_product,
@@ -171,9 +157,7 @@ class HomeView(TemplateView):
             'home_banners': home_banners,
             'shop_featured_product': shop_featured_product,
             'pricing_products': pricing_products,
-        })
-        
-        return context
+        }
 
 
 class ProductListView(ListView):
@@ -217,15 +201,19 @@ class ProductListView(ListView):
             except (ValueError, TypeError):
                 pass
         
+        # Filtro por rango de precio (faceta)
+        bucket = self.get_price_bucket()
+        if bucket is not None:
+            lower, upper = facets.bucket_bounds(bucket)
+            if lower is not None:
+                queryset = queryset.filter(price__gte=lower)
+            if upper is not None:
+                queryset = queryset.filter(price__lt=upper)
+        
         # Búsqueda
         search_query = self.request.GET.get('search')
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(sku__icontains=search_query) |
-                Q(barcode__icontains=search_query)
-            )
+            queryset = search_products(queryset, search_query)
         
         # Ordenamiento
         sort_by = self.request.GET.get('sort') or self.request.GET.get('orderby')
@@ -239,6 +227,8 @@ class ProductListView(ListView):
             queryset = queryset.order_by('-created_at')
         elif sort_by == 'popularity':
             queryset = queryset.order_by('-is_featured', '-created_at')
+        elif search_query:
+            queryset = queryset.order_by('-search_rank', 'name')
         else:
             queryset = queryset.order_by('-is_featured', '-created_at')
         
@@ -246,60 +236,115 @@ class ProductListView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Categorías activas con slugs válidos para el sidebar
-        context['categories'] = Category.objects.filter(
-            is_active=True
-        ).exclude(slug='').exclude(slug__isnull=True).order_by('name')
-        
-        # Marcas activas
-        context['brands'] = Brand.objects.filter(is_active=True).order_by('name')
-        
-        # Productos destacados
-        context['featured_products'] = Product.objects.filter(
-            is_active=True, 
-            is_featured=True
-        ).prefetch_related('images')[:6]
-        
-        # Últimos productos para el sidebar
-        context['latest_products'] = Product.objects.filter(
-            is_active=True
-        ).prefetch_related('images').order_by('-created_at')[:3]
-        
-        # Rango de precios para el filtro
-        from django.db.models import Min, Max
-        price_range = Product.objects.filter(is_active=True).aggregate(
-            min_price=Min('price'),
-            max_price=Max('price')
-        )
-        context['min_price'] = int(price_range['min_price'] or 0)
-        context['max_price'] = int(price_range['max_price'] or 100000)
+        context.update(cached_fragment('product_list_sidebar', self.build_sidebar))
         
-        # Filtro por categoría desde GET
+        # Filtro por categoría y marca desde GET (solo activas, como en el sidebar)
         category_slug = self.request.GET.get('category')
-        if category_slug:
-            try:
-                context['selected_category'] = Category.objects.get(slug=category_slug, is_active=True)
-            except Category.DoesNotExist:
-                context['selected_category'] = None
-        else:
-            context['selected_category'] = None
-        
-        # Filtro por marca desde GET
+        context['selected_category'] = next(
+            (category for category in context['categories'] if category_slug and category.slug == category_slug),
+            None,
+        )
         brand_slug = self.request.GET.get('brand')
-        if brand_slug:
-            try:
-                context['selected_brand'] = Brand.objects.get(slug=brand_slug, is_active=True)
-            except Brand.DoesNotExist:
-                context['selected_brand'] = None
-        else:
-            context['selected_brand'] = None
+        context['selected_brand'] = next(
+            (brand for brand in context['brands'] if brand_slug and brand.slug == brand_slug),
+            None,
+        )
         
         # Filtro por precio desde GET
         context['price_min'] = self.request.GET.get('price_min', '')
         context['price_max'] = self.request.GET.get('price_max', '')
         
+        context.update(self.build_facets(context))
         return context
 
+    def get_price_bucket(self):
+        try:
+            bucket = int(self.request.GET.get('price_bucket', ''))
+        except ValueError:
+            return None
+        return bucket if 0 <= bucket < facets.bucket_count() else None
+
+    def facet_query(self, param, value):
+        """Querystring actual con ``param`` cambiado (``None`` lo quita) y sin página"""
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        if value is None:
+            params.pop(param, None)
+        else:
+            params[param] = value
+        return params.urlencode()
+
+    def build_facets(self, context):
+        """
+        Categorías, marcas y rangos de precio con su conteo de productos. Los
+        conteos salen de ``ProductFacetCount`` y solo se muestran cuando los
+        filtros activos son facetas (sin búsqueda ni precio libre).
+        """
+        selected_category = context['selected_category']
+        selected_brand = context['selected_brand']
+        bucket = self.get_price_bucket()
+        show_counts = not (
+            self.request.GET.get('search') or self.request.GET.get('price_min') or self.request.GET.get('price_max')
+        )
+        counts = facets.facet_counts(
+            category_id=selected_category.pk if selected_category else None,
+            brand_id=selected_brand.pk if selected_brand else None,
+            bucket=bucket,
+        ) if show_counts else None
+
+        def count(dimension, key):
+            return counts[dimension].get(key, 0) if counts else None
+
+        return {
+            'show_facet_counts': show_counts,
+            'category_facets': [
+                {'category': category, 'count': count('categories', category.pk),
+                 'query': self.facet_query('category', category.slug)}
+                for category in context['categories']
+            ],
+            'brand_facets': [
+                {'brand': brand, 'count': count('brands', brand.pk),
+                 'query': self.facet_query('brand', brand.slug)}
+                for brand in context['brands']
+            ],
+            'price_facets': [
+                {'bucket': index, 'label': facets.bucket_label(index), 'count': count('price_buckets', index),
+                 'query': self.facet_query('price_bucket', index)}
+                for index in range(facets.bucket_count())
+            ],
+            'selected_price_bucket': bucket,
+            'clear_category_query': self.facet_query('category', None),
+            'clear_price_bucket_query': self.facet_query('price_bucket', None),
+        }
+
+    def build_sidebar(self):
+        """Filtros y productos del sidebar, comunes a todas las páginas del listado"""
+        from django.db.models import Min, Max
+        price_range = Product.objects.filter(is_active=True).aggregate(
+            min_price=Min('price'),
+            max_price=Max('price')
+        )
+        return {
+            # Categorías activas con slugs válidos para el sidebar
+            'categories': list(Category.objects.filter(
+                is_active=True
+            ).exclude(slug='').exclude(slug__isnull=True).order_by('name')),
+            # Marcas activas
+            'brands': list(Brand.objects.filter(is_active=True).order_by('name')),
+            # Productos destacados
+            'featured_products': list(Product.objects.filter(
+                is_active=True,
+                is_featured=True
+            ).prefetch_related('images')[:6]),
+            # Últimos productos para el sidebar
+            'latest_products': list(Product.objects.filter(
+                is_active=True
+            ).prefetch_related('images').order_by('-created_at')[:3]),
+            # Rango de precios para el filtro
+            'min_price': int(price_range['min_price'] or 0),
+            'max_price': int(price_range['max_price'] or 100000),
+        }
+
 
 class CategoryDetailView(DetailView):
     model = Category
@@ -344,14 +389,27 @@ class ProductDetailView(DetailView):
     slug_url_kwarg = 'slug'
 
     def get_queryset(self):
-        return Product.objects.filter(is_active=True).select_related('category', 'brand')
+        return Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('images')
+
+    def get_object(self, queryset=None):
+        if queryset is None:
+            queryset = self.get_queryset()
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        product = cached_fragment('product_detail', lambda: queryset.filter(slug=slug).first(), slug)
+        if product is None:
+            raise Http404('Producto no encontrado')
+        return product
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['related_products'] = Product.objects.filter(
-            category=self.object.category,
-            is_active=True
-        ).exclude(id=self.object.id)[:4]
+        context['related_products'] = cached_fragment(
+            'related_products',
+            lambda: list(Product.objects.filter(
+                category_id=self.object.category_id,
+                is_active=True
+            ).exclude(id=self.object.id).prefetch_related('images')[:4]),
+            self.object.pk,
+        )
         context['cart_form'] = CartAddForm()
         return context
 
@@ -365,13 +423,9 @@ class ProductSearchView(ListView):
     def get_queryset(self):
         query = self.request.GET.get('q', '')
         if query:
-            return Product.objects.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query) |
-                Q(sku__icontains=query) |
-                Q(barcode__icontains=query),
-                is_active=True
-            ).select_related('category', 'brand')
+            return search_products(
+                Product.objects.filter(is_active=True).select_related('category', 'brand'), query
+            ).order_by('-search_rank', 'name')
         return Product.objects.none()
 
     def get_context_data(self, **kwargs):
@@ -384,17 +438,20 @@ class CartView(View):
     template_name = 'catalog/cart.html'
 
     def get(self, request):
-        cart = self.get_cart(request)
+        service = CartService(request)
+        cart = service.get_cart()
         
         # Return JSON if AJAX request
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             cart_items = []
-            for item in cart.items.all().select_related('product').prefetch_related('product__images'):
+            items = cart.items.select_related('product').prefetch_related('product__images') if cart else []
+            for item in items:
                 image_url = ''
                 try:
-                    if item.product.images.exists():
-                        first_image = item.product.images.first()
-                        if first_image and first_image.image:
+                    images = item.product.images.all()
+                    if images:
+                        first_image = images[0]
+                        if first_image.image:
                             # Use simple URL instead of build_absolute_uri to avoid errors
                             image_url = first_image.image.url
                 except Exception as e:
@@ -424,67 +481,21 @@ class CartView(View):
                     print(traceback.format_exc())
                     continue
             
-            try:
-                # Calculate totals safely
-                cart_total = 0.0
-                cart_items_count = 0
-                
-                try:
-                    # Use the property from Cart model
-                    cart_total = float(cart.total_with_iva) if cart.total_with_iva else 0.0
-                except Exception as e:
-                    # Calculate manually if property fails
-                    try:
-                        for item in cart.items.all():
-                            if hasattr(item, 'total_with_iva'):
-                                cart_total += float(item.total_with_iva) if item.total_with_iva else 0.0
-                            elif hasattr(item, 'total'):
-                                cart_total += float(item.total) if item.total else 0.0
-                    except:
-                        cart_total = 0.0
-                
-                try:
-                    # Use the property from Cart model
-                    cart_items_count = cart.total_items if cart.total_items else 0
-                except:
-                    # Calculate manually
-                    cart_items_count = sum(item.quantity for item in cart.items.all())
-                
-                return JsonResponse({
-                    'success': True,
-                    'cart_items': cart_items,
-                    'cart_total': cart_total,
-                    'cart_items_count': cart_items_count
-                })
-            except Exception as e:
-                # Fallback response if there's an error
-                import traceback
-                print(f"Error in CartView JSON response: {e}")
-                print(traceback.format_exc())
-                return JsonResponse({
-                    'success': True,
-                    'cart_items': [],
-                    'cart_total': 0.0,
-                    'cart_items_count': 0
-                })
+            summary = service.summary()
+            return JsonResponse({
+                'success': True,
+                'cart_items': cart_items,
+                'cart_total': float(summary['total']),
+                'cart_items_count': summary['items_count']
+            })
         
         return render(request, self.template_name, {'cart': cart})
 
-    def get_cart(self, request):
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-        else:
-            if not request.session.session_key:
-                request.session.create()
-            cart, created = Cart.objects.get_or_create(session_key=request.session.session_key)
-        return cart
-
 
 class CartAddView(View):
     def post(self, request, product_id):
         import json
         product = get_object_or_404(Product, id=product_id, is_active=True)
-        cart = self.get_cart(request)
         
         # Handle both JSON and form data
         if request.headers.get('Content-Type') == 'application/json':
@@ -496,106 +507,63 @@ class CartAddView(View):
         else:
             quantity = int(request.POST.get('quantity', 1))
         
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-        
-        # Refresh cart to get updated totals
-        cart.refresh_from_db()
+        summary = CartService(request).add(product, quantity)
         
         if request.headers.get('Content-Type') == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
                 'success': True,
                 'message': 'Producto agregado al carrito exitosamente',
-                'cart_total': float(cart.total_with_iva),
-                'cart_items_count': cart.total_items
+                'cart_total': float(summary['total']),
+                'cart_items_count': summary['items_count']
             })
         
         messages.success(request, 'Producto agregado al carrito')
         return redirect('catalog:cart')
 
-    def get_cart(self, request):
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-        else:
-            if not request.session.session_key:
-                request.session.create()
-            cart, created = Cart.objects.get_or_create(session_key=request.session.session_key)
-        return cart
-
 
 class CartRemoveView(View):
     def post(self, request, item_id):
-        cart_item = get_object_or_404(CartItem, id=item_id)
-        cart_item.delete()
+        service = CartService(request)
+        cart_item = get_object_or_404(CartItem, id=item_id, cart_id=service.cart_id())
+        summary = service.remove(cart_item)
         
         if request.headers.get('Content-Type') == 'application/json':
-            cart = self.get_cart(request)
             return JsonResponse({
                 'success': True,
                 'message': 'Producto eliminado del carrito',
-                'cart_total': cart.total_with_iva,
-                'cart_items_count': cart.total_items
+                'cart_total': float(summary['total']),
+                'cart_items_count': summary['items_count']
             })
         
         messages.success(request, 'Producto eliminado del carrito')
         return redirect('catalog:cart')
 
-    def get_cart(self, request):
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-        else:
-            if not request.session.session_key:
-                request.session.create()
-            cart, created = Cart.objects.get_or_create(session_key=request.session.session_key)
-        return cart
-
 
 class CartUpdateView(View):
     def post(self, request, item_id):
-        cart_item = get_object_or_404(CartItem, id=item_id)
+        service = CartService(request)
+        cart_item = get_object_or_404(CartItem, id=item_id, cart_id=service.cart_id())
         quantity = int(request.POST.get('quantity', 1))
-        
-        if quantity <= 0:
-            cart_item.delete()
-        else:
-            cart_item.quantity = quantity
-            cart_item.save()
+        summary = service.update(cart_item, quantity)
         
         if request.headers.get('Content-Type') == 'application/json':
-            cart = self.get_cart(request)
             return JsonResponse({
                 'success': True,
                 'message': 'Carrito actualizado',
-                'cart_total': cart.total_with_iva,
-                'cart_items_count': cart.total_items
+                'cart_total': float(summary['total']),
+                'cart_items_count': summary['items_count']
             })
         
         messages.success(request, 'Carrito actualizado')
         return redirect('catalog:cart')
 
-    def get_cart(self, request):
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-        else:
-            if not request.session.session_key:
-                request.session.create()
-            cart, created = Cart.objects.get_or_create(session_key=request.session.session_key)
-        return cart
-
 
 class CheckoutView(View):
     template_name = 'catalog/checkout.html'
 
     def get(self, request):
-        cart = self.get_cart(request)
-        if not cart.items.exists():
+        cart = CartService(request).get_cart()
+        if cart is None or not cart.items.exists():
             messages.warning(request, 'Tu carrito está vacío')
             return redirect('catalog:product_list')
         
@@ -603,8 +571,8 @@ class CheckoutView(View):
         return render(request, self.template_name, {'cart': cart, 'form': form})
 
     def post(self, request):
-        cart = self.get_cart(request)
-        if not cart.items.exists():
+        cart = CartService(request).get_cart()
+        if cart is None or not cart.items.exists():
             messages.warning(request, 'Tu carrito está vacío')
             return redirect('catalog:product_list')
         
@@ -629,9 +597,8 @@ class CheckoutView(View):
                 )
 
                 self._get_or_create_customer(user, form.cleaned_data)
-                merge_session_cart_into_user_cart(request, user)
+                cart = CartService(request).merge_into_user(user)
                 login(request, user)
-                cart = Cart.objects.get_or_create(user=user)[0]
 
             # Asegurar que el método de pago sea Wompi
             form.cleaned_data['payment_method'] = 'wompi'
@@ -660,15 +627,6 @@ class CheckoutView(View):
         
         return render(request, self.template_name, {'cart': cart, 'form': form})
 
-    def get_cart(self, request):
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-        else:
-            if not request.session.session_key:
-                request.session.create()
-            cart, created = Cart.objects.get_or_create(session_key=request.session.session_key)
-        return cart
-
     def _get_or_create_guest_user(self, form_data):
         email = (form_data.get('email') or '').strip().lower()
         first_name = (form_data.get('first_name') or '').strip()
@@ -744,6 +702,8 @@ class CheckoutView(View):
             cart.save()
 
         customer = self._get_or_create_customer(user, form_data)
+        # El total de la orden se calcula con los precios actuales, no desde la caché
+        subtotal = compute_summary(cart.pk)['total']
         
         city_obj = form_data.get('city')
         department_obj = form_data.get('department')
@@ -761,10 +721,10 @@ class CheckoutView(View):
             customer=customer,
             status='pending',
             payment_method=form_data['payment_method'],
-            subtotal=cart.total_amount,
+            subtotal=subtotal,
             iva_amount=0,
             shipping_cost=FIXED_SHIPPING_COST,
-            total=cart.total_amount + FIXED_SHIPPING_COST,
+            total=subtotal + FIXED_SHIPPING_COST,
             shipping_address=form_data['address'],
             shipping_city=shipping_city,
             shipping_phone=form_data['phone'],
@@ -773,7 +733,7 @@ class CheckoutView(View):
         )
         
         # Crear items de la orden
-        for cart_item in cart.items.all():
+        for cart_item in cart.items.select_related('product'):
             OrderItem.objects.create(
                 order=order,
                 product=cart_item.product,
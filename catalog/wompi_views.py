@@ -10,6 +10,7 @@ from django.views.decorators.http import require_http_methods
 from django.shortcuts import get_object_or_404
 from orders.models import Order, WompiConfig
 from .models import Cart
+from inventory.ledger import post_movements
 from inventory.models import Warehouse, StockMovement
 
 
@@ -47,18 +48,16 @@ def apply_inventory_deduction_for_paid_order(order):
         return
 
     reference = f"Orden {order.order_number}"
-    for item in order.items.select_related('product').all():
-        exists = StockMovement.objects.filter(
-            product=item.product,
-            warehouse=warehouse,
-            movement_type='out',
-            reference=reference,
-        ).exists()
-        if exists:
-            continue
-
-        StockMovement.objects.create(
-            product=item.product,
+    # Los productos ya descontados (por un webhook repetido) se omiten
+    deducted = set(StockMovement.objects.filter(
+        warehouse=warehouse,
+        movement_type='out',
+        reference=reference,
+    ).values_list('product_id', flat=True))
+
+    post_movements([
+        StockMovement(
+            product_id=item.product_id,
             warehouse=warehouse,
             movement_type='out',
             quantity=-int(item.quantity),
@@ -66,6 +65,9 @@ def apply_inventory_deduction_for_paid_order(order):
             notes='Venta web (Wompi)',
             user=inventory_user,
         )
+        for item in order.items.all()
+        if item.product_id not in deducted
+    ])
 
 
 def create_wompi_transaction(order):
@@ -3,14 +3,18 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.db.models import Sum, Count, Q, F
+from django.db.models import Sum, Count, Q, F, Prefetch
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
 
-from catalog.models import Product, Category, Brand, Cart
-from catalog.models import CartItem
+from catalog.models import Product, Category, Brand
+from catalog.cart import CartService
+from catalog.images import image_sets
+from catalog.search import search_products
+from inventory.ledger import InsufficientStockError, post_movements
+from inventory.transfers import TransferError, complete_transfer
 from inventory.models import Stock, Warehouse, StockMovement, StockTransfer, StockTransferItem
 from customers.models import Customer
 from orders.models import Order, OrderItem, WompiConfig
@@ -20,6 +24,8 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from .forms import HomeBannerConfigForm
 from .models import HomeBannerConfig
+from reports.models import DailySalesFact, DailySalesTotal, PAID_STATUSES
+from reports.services import DashboardMetrics, SalesDocumentFeed
 
 
 def admin_login(request):
@@ -60,27 +66,7 @@ def home_login(request):
         
         user = authenticate(request, username=username, password=password)
         if user is not None:
-            if not request.session.session_key:
-                request.session.create()
-
-            session_cart = Cart.objects.filter(session_key=request.session.session_key).first()
-            user_cart, _ = Cart.objects.get_or_create(user=user)
-            if session_cart and session_cart.items.exists():
-                for item in session_cart.items.select_related('product').all():
-                    existing = CartItem.objects.filter(cart=user_cart, product=item.product).first()
-                    if existing:
-                        existing.quantity += item.quantity
-                        existing.save()
-                    else:
-                        item.cart = user_cart
-                        item.save()
-
-                CartItem.objects.filter(cart=session_cart).delete()
-                try:
-                    session_cart.delete()
-                except Exception:
-                    pass
-
+            CartService(request).merge_into_user(user)
             login(request, user)
             messages.success(request, f'¡Bienvenido, {user.get_full_name() or user.username}!')
             
@@ -100,64 +86,22 @@ def admin_dashboard(request):
     """Dashboard principal del admin personalizado"""
     
     # Fecha de hoy
-    today = timezone.now().date()
-    
-    # Estadísticas del día
-    today_web_orders = Order.objects.filter(created_at__date=today).count()
-    today_pos_sales = POSSale.objects.filter(created_at__date=today).count()
-    today_orders = today_web_orders + today_pos_sales
-    
-    today_web_sales = Order.objects.filter(
-        created_at__date=today,
-        status__in=['paid', 'shipped', 'delivered']
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    today_pos_sales_amount = POSSale.objects.filter(
-        created_at__date=today
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    today_sales = today_web_sales + today_pos_sales_amount
-    
-    # Estadísticas de la semana
-    week_ago = today - timedelta(days=7)
-    week_web_orders = Order.objects.filter(created_at__date__gte=week_ago).count()
-    week_pos_sales = POSSale.objects.filter(created_at__date__gte=week_ago).count()
-    week_orders = week_web_orders + week_pos_sales
-    
-    week_web_sales = Order.objects.filter(
-        created_at__date__gte=week_ago,
-        status__in=['paid', 'shipped', 'delivered']
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    week_pos_sales_amount = POSSale.objects.filter(
-        created_at__date__gte=week_ago
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    week_sales = week_web_sales + week_pos_sales_amount
-    
-    # Estadísticas del mes
-    month_ago = today - timedelta(days=30)
-    month_web_orders = Order.objects.filter(created_at__date__gte=month_ago).count()
-    month_pos_sales = POSSale.objects.filter(created_at__date__gte=month_ago).count()
-    month_orders = month_web_orders + month_pos_sales
-    
-    month_web_sales = Order.objects.filter(
-        created_at__date__gte=month_ago,
-        status__in=['paid', 'shipped', 'delivered']
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    month_pos_sales_amount = POSSale.objects.filter(
-        created_at__date__gte=month_ago
-    ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-    
-    month_sales = month_web_sales + month_pos_sales_amount
+    today = timezone.localdate()
+    
+    # Totales por periodo (web + POS) con una consulta por fuente
+    metrics = DashboardMetrics(today)
+    periods = metrics.period_totals
+    today_sales = periods['today']['sales']
+    today_orders = periods['today']['orders']
+    week_sales = periods['week']['sales']
+    week_orders = periods['week']['orders']
+    month_sales = periods['month']['sales']
+    month_orders = periods['month']['orders']
     
     # Estadísticas generales
     total_products = Product.objects.filter(is_active=True).count()
     total_customers = Customer.objects.count()
-    total_web_orders = Order.objects.count()
-    total_pos_sales = POSSale.objects.count()
-    total_orders = total_web_orders + total_pos_sales
+    total_orders = metrics.total_orders
     total_categories = Category.objects.filter(is_active=True).count()
     total_brands = Brand.objects.filter(is_active=True).count()
     low_stock_count = Stock.objects.filter(
@@ -222,51 +166,7 @@ def admin_dashboard(request):
     recent_orders = recent_orders[:10]
     
     # Productos más vendidos (últimos 30 días) - Web + POS
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    
-    # Productos vendidos en web
-    web_top_products = Product.objects.filter(
-        orderitem__order__created_at__gte=thirty_days_ago,
-        orderitem__order__status__in=['paid', 'shipped', 'delivered']
-    ).annotate(
-        web_sold=Sum('orderitem__quantity'),
-        web_revenue=Sum('orderitem__total')
-    )
-    
-    # Productos vendidos en POS
-    pos_top_products = Product.objects.filter(
-        possaleitem__sale__created_at__gte=thirty_days_ago
-    ).annotate(
-        pos_sold=Sum('possaleitem__quantity'),
-        pos_revenue=Sum('possaleitem__total')
-    )
-    
-    # Combinar datos de web y POS
-    all_products = Product.objects.all()
-    top_products = []
-    
-    for product in all_products:
-        web_data = next((p for p in web_top_products if p.id == product.id), None)
-        pos_data = next((p for p in pos_top_products if p.id == product.id), None)
-        
-        web_sold = web_data.web_sold if web_data and web_data.web_sold else 0
-        web_revenue = web_data.web_revenue if web_data and web_data.web_revenue else Decimal('0')
-        pos_sold = pos_data.pos_sold if pos_data and pos_data.pos_sold else 0
-        pos_revenue = pos_data.pos_revenue if pos_data and pos_data.pos_revenue else Decimal('0')
-        
-        total_sold = web_sold + pos_sold
-        total_revenue = web_revenue + pos_revenue
-        
-        if total_sold > 0:  # Solo incluir productos que se han vendido
-            top_products.append({
-                'product': product,
-                'total_sold': total_sold,
-                'total_revenue': total_revenue
-            })
-    
-    # Ordenar por cantidad vendida
-    top_products.sort(key=lambda x: x['total_sold'], reverse=True)
-    top_products = top_products[:10]
+    top_products = metrics.top_products(limit=10)
     
     # Productos con stock bajo
     low_stock_products = Stock.objects.select_related('product', 'warehouse').filter(
@@ -274,26 +174,7 @@ def admin_dashboard(request):
     ).order_by('quantity')[:10]
     
     # Órdenes por estado (Web + POS)
-    web_orders_by_status = Order.objects.values('status').annotate(
-        count=Count('id')
-    ).order_by('status')
-    
-    # Agregar ventas POS como "paid" (pagadas)
-    pos_sales_count = POSSale.objects.count()
-    
-    orders_by_status = list(web_orders_by_status)
-    
-    # Si hay ventas POS, agregar o actualizar el estado "paid"
-    if pos_sales_count > 0:
-        paid_status_exists = False
-        for status_data in orders_by_status:
-            if status_data['status'] == 'paid':
-                status_data['count'] += pos_sales_count
-                paid_status_exists = True
-                break
-        
-        if not paid_status_exists:
-            orders_by_status.append({'status': 'paid', 'count': pos_sales_count})
+    orders_by_status = metrics.orders_by_status()
     
     # Categorías más populares
     popular_categories = Product.objects.values(
@@ -303,43 +184,7 @@ def admin_dashboard(request):
     ).order_by('-product_count')[:5]
     
     # Distribución de ventas por categoría (Web + POS)
-    web_category_sales = Category.objects.filter(
-        product__orderitem__order__created_at__gte=thirty_days_ago,
-        product__orderitem__order__status__in=['paid', 'shipped', 'delivered']
-    ).annotate(
-        web_sales=Sum('product__orderitem__total')
-    )
-    
-    pos_category_sales = Category.objects.filter(
-        product__possaleitem__sale__created_at__gte=thirty_days_ago
-    ).annotate(
-        pos_sales=Sum('product__possaleitem__total')
-    )
-    
-    # Combinar datos de categorías
-    all_categories = Category.objects.all()
-    category_distribution = []
-    
-    for category in all_categories:
-        web_data = next((c for c in web_category_sales if c.id == category.id), None)
-        pos_data = next((c for c in pos_category_sales if c.id == category.id), None)
-        
-        web_sales = web_data.web_sales if web_data and web_data.web_sales else Decimal('0')
-        pos_sales = pos_data.pos_sales if pos_data and pos_data.pos_sales else Decimal('0')
-        
-        total_sales = web_sales + pos_sales
-        
-        if total_sales > 0:  # Solo incluir categorías con ventas
-            category_distribution.append({
-                'category': category,
-                'total_sales': total_sales,
-                'web_sales': web_sales,
-                'pos_sales': pos_sales
-            })
-    
-    # Ordenar por ventas totales
-    category_distribution.sort(key=lambda x: x['total_sales'], reverse=True)
-    category_distribution = category_distribution[:5]  # Top 5 categorías
+    category_distribution = metrics.category_distribution(limit=5)
     
     # Clientes VIP
     vip_customers = Customer.objects.filter(
@@ -347,42 +192,9 @@ def admin_dashboard(request):
     ).select_related('user')[:5]
     
     # Datos para el gráfico de ventas (últimos 7 días) - Web + POS
-    sales_data = []
-    sales_labels = []
-    
-    for i in range(7):
-        date = today - timedelta(days=i)
-        
-        # Ventas web del día
-        daily_web_sales = Order.objects.filter(
-            created_at__date=date,
-            status__in=['paid', 'shipped', 'delivered']
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-        
-        # Ventas POS del día
-        daily_pos_sales = POSSale.objects.filter(
-            created_at__date=date
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-        
-        # Total del día
-        daily_total = daily_web_sales + daily_pos_sales
-        
-        sales_data.append(float(daily_total))
-        sales_labels.append(date.strftime('%d/%m'))
-    
-    sales_data.reverse()
-    sales_labels.reverse()
-    
-    # Si no hay datos, crear datos demo para mostrar el gráfico
-    if all(val == 0 for val in sales_data):
-        sales_data = [0, 0, 0, 0, 0, 0, 0]
-        sales_labels = [(today - timedelta(days=6-i)).strftime('%d/%m') for i in range(7)]
-    
-    # Debug: Imprimir datos de ventas diarias
-    print("=== DEBUG VENTAS DIARIAS ===")
-    print("Sales Labels:", sales_labels)
-    print("Sales Data:", sales_data)
-    print("===========================")
+    daily_sales = metrics.daily_sales(days=7)
+    sales_data = [float(total) for _, total in daily_sales]
+    sales_labels = [day.strftime('%d/%m') for day, _ in daily_sales]
     
     # Datos para el gráfico de órdenes por estado
     status_data = []
@@ -632,7 +444,9 @@ def admin_category_detail(request, pk):
     from catalog.models import Category
     
     try:
-        category = Category.objects.prefetch_related('product_set').get(pk=pk)
+        category = Category.objects.prefetch_related(
+            Prefetch('product_set', queryset=Product.objects.select_related('primary_image'))
+        ).get(pk=pk)
     except Category.DoesNotExist:
         messages.error(request, 'Categoría no encontrada.')
         return redirect('custom_admin:admin_categories')
@@ -990,7 +804,7 @@ def admin_pos(request):
 @login_required
 def admin_products(request):
     """Gestión de productos"""
-    products = Product.objects.select_related('category', 'brand').all()
+    products = Product.objects.select_related('category', 'brand').prefetch_related('stock_set__warehouse')
     
     # Filtros
     search = request.GET.get('search')
@@ -999,13 +813,7 @@ def admin_products(request):
     is_active = request.GET.get('is_active')
     
     if search:
-        products = products.filter(
-            Q(name__icontains=search) | 
-            Q(description__icontains=search) |
-            Q(sku__icontains=search) |
-            Q(short_description__icontains=search) |
-            Q(barcode__icontains=search)
-        )
+        products = search_products(products, search).order_by('-search_rank', 'name')
     
     if category_id:
         products = products.filter(category_id=category_id)
@@ -1043,7 +851,7 @@ def admin_products(request):
 def admin_inventory(request):
     """Gestión de inventario"""
     # Obtener todos los stocks inicialmente
-    stocks = Stock.objects.select_related('product', 'warehouse').all()
+    stocks = Stock.objects.select_related('product', 'product__primary_image', 'warehouse').all()
     
     # Filtros
     search = request.GET.get('search') or None
@@ -1142,57 +950,51 @@ def admin_orders(request):
     if end_date:
         pos_sales = pos_sales.filter(created_at__date__lte=end_date)
     
-    # Crear lista unificada con información del tipo
-    all_orders = []
-    
-    # Agregar órdenes web
-    for order in web_orders:
-        all_orders.append({
-            'id': order.id,
-            'number': order.order_number,
-            'customer': order.customer,
-            'created_at': order.created_at,
-            'total': order.total,
-            'status': order.status,
-            'status_display': order.get_status_display(),
-            'status_color': order.status_color,
-            'payment_method': order.get_payment_method_display(),
-            'order_type': 'web',
-            'order_type_display': 'Web',
-            'order_type_color': 'info',
-            'original_object': order,
-        })
-    
-    # Agregar ventas POS
-    for sale in pos_sales:
-        all_orders.append({
-            'id': sale.id,
-            'number': sale.sale_number,
-            'customer': sale.customer,
-            'created_at': sale.created_at,
-            'total': sale.total,
-            'status': 'completed',  # Las ventas POS siempre están completadas
-            'status_display': 'Completada',
-            'status_color': 'success',
-            'payment_method': sale.get_payment_method_display(),
-            'order_type': 'pos',
-            'order_type_display': 'POS',
-            'order_type_color': 'primary',
-            'original_object': sale,
-        })
-    
-    # Filtrar por tipo de orden si se especifica
-    if order_type:
-        all_orders = [order for order in all_orders if order['order_type'] == order_type]
-    
-    # Ordenar por fecha de creación (más recientes primero)
-    all_orders.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    # Paginación
-    from django.core.paginator import Paginator
-    paginator = Paginator(all_orders, 20)
-    page_number = request.GET.get('page')
-    orders_page = paginator.get_page(page_number)
+    # Las ventas POS siempre están completadas
+    if order_type == 'pos' or status == 'completed':
+        web_orders = None
+    if order_type == 'web' or (status and status != 'completed'):
+        pos_sales = None
+    
+    # Lista unificada paginada por cursor en la base de datos
+    feed = SalesDocumentFeed(web_orders=web_orders, pos_sales=pos_sales)
+    orders_page = feed.page(after=request.GET.get('after'), before=request.GET.get('before'))
+    
+    documents = []
+    for kind, document in orders_page:
+        if kind == 'web':
+            documents.append({
+                'id': document.id,
+                'number': document.order_number,
+                'customer': document.customer,
+                'created_at': document.created_at,
+                'total': document.total,
+                'status': document.status,
+                'status_display': document.get_status_display(),
+                'status_color': document.status_color,
+                'payment_method': document.get_payment_method_display(),
+                'order_type': 'web',
+                'order_type_display': 'Web',
+                'order_type_color': 'info',
+                'original_object': document,
+            })
+        else:
+            documents.append({
+                'id': document.id,
+                'number': document.sale_number,
+                'customer': document.customer,
+                'created_at': document.created_at,
+                'total': document.total,
+                'status': 'completed',
+                'status_display': 'Completada',
+                'status_color': 'success',
+                'payment_method': document.get_payment_method_display(),
+                'order_type': 'pos',
+                'order_type_display': 'POS',
+                'order_type_color': 'primary',
+                'original_object': document,
+            })
+    orders_page.documents = documents
     
     # Opciones de estado para el filtro
     status_choices = [
@@ -1384,10 +1186,10 @@ def admin_customer_orders(request, pk):
     customer = get_object_or_404(Customer, pk=pk)
     
     # Obtener órdenes web
-    web_orders = Order.objects.filter(customer=customer).order_by('-created_at')
+    web_orders = Order.objects.filter(customer=customer)
     
     # Obtener ventas POS
-    pos_sales = POSSale.objects.filter(customer=customer).order_by('-created_at')
+    pos_sales = POSSale.objects.filter(customer=customer)
     
     # Filtros
     search = request.GET.get('search')
@@ -1415,43 +1217,41 @@ def admin_customer_orders(request, pk):
         web_orders = web_orders.filter(created_at__date__lte=end_date)
         pos_sales = pos_sales.filter(created_at__date__lte=end_date)
     
-    # Combinar órdenes
-    all_orders = []
-    
-    for order in web_orders:
-        all_orders.append({
-            'id': order.id,
-            'number': order.order_number,
-            'date': order.created_at,
-            'total': order.total,
-            'status': order.status,
-            'status_display': order.get_status_display(),
-            'type': 'web',
-            'type_display': 'Web',
-            'order': order,
-        })
-    
-    for sale in pos_sales:
-        all_orders.append({
-            'id': sale.id,
-            'number': sale.sale_number,
-            'date': sale.created_at,
-            'total': sale.total,
-            'status': 'paid',
-            'status_display': 'Pagado',
-            'type': 'pos',
-            'type_display': 'POS',
-            'sale': sale,
-        })
-    
-    # Ordenar por fecha
-    all_orders.sort(key=lambda x: x['date'], reverse=True)
-    
-    # Paginación
-    from django.core.paginator import Paginator
-    paginator = Paginator(all_orders, 20)
-    page_number = request.GET.get('page')
-    all_orders = paginator.get_page(page_number)
+    # Las ventas POS siempre están pagadas
+    if status and status != 'paid':
+        pos_sales = None
+    
+    # Combinar órdenes paginadas por cursor en la base de datos
+    feed = SalesDocumentFeed(web_orders=web_orders, pos_sales=pos_sales)
+    all_orders = feed.page(after=request.GET.get('after'), before=request.GET.get('before'))
+    
+    documents = []
+    for kind, document in all_orders:
+        if kind == 'web':
+            documents.append({
+                'id': document.id,
+                'number': document.order_number,
+                'date': document.created_at,
+                'total': document.total,
+                'status': document.status,
+                'status_display': document.get_status_display(),
+                'type': 'web',
+                'type_display': 'Web',
+                'order': document,
+            })
+        else:
+            documents.append({
+                'id': document.id,
+                'number': document.sale_number,
+                'date': document.created_at,
+                'total': document.total,
+                'status': 'paid',
+                'status_display': 'Pagado',
+                'type': 'pos',
+                'type_display': 'POS',
+                'sale': document,
+            })
+    all_orders.documents = documents
     
     context = {
         'customer': customer,
@@ -1536,70 +1336,47 @@ def admin_reports(request):
     start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
     end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
     
-    # Filtro base para órdenes web pagadas
-    paid_web_orders = Order.objects.filter(
-        created_at__date__range=[start_dt, end_dt],
-        status__in=['paid', 'shipped', 'delivered']
-    )
-    
-    # Filtro base para ventas POS
-    pos_sales = POSSale.objects.filter(
-        created_at__date__range=[start_dt, end_dt]
-    )
+    # Los reportes leen los hechos pre-agregados por día (DailySalesTotal y
+    # DailySalesFact), no las órdenes y ventas individuales
+    paid_totals = DailySalesTotal.objects.filter(status__in=PAID_STATUSES).order_by()
+    period_facts = DailySalesFact.objects.filter(date__range=[start_dt, end_dt]).order_by()
     
     # 1. REPORTES DE VENTAS (Web + POS)
-    web_sales_report = paid_web_orders.aggregate(
-        total_orders=Count('id'),
-        total_sales=Sum('total'),
-        avg_order_value=Sum('total') / Count('id')
-    )
-    
-    pos_sales_report = pos_sales.aggregate(
-        total_orders=Count('id'),
-        total_sales=Sum('total'),
-        avg_order_value=Sum('total') / Count('id')
+    prev_start = start_dt - timedelta(days=(end_dt - start_dt).days + 1)
+    prev_end = start_dt - timedelta(days=1)
+    current = Q(date__range=[start_dt, end_dt])
+    previous = Q(date__range=[prev_start, prev_end])
+    totals = paid_totals.aggregate(
+        web_orders=Sum('documents', filter=current & Q(channel='web')),
+        pos_orders=Sum('documents', filter=current & Q(channel='pos')),
+        web_sales=Sum('total', filter=current & Q(channel='web')),
+        pos_sales=Sum('total', filter=current & Q(channel='pos')),
+        prev_orders=Sum('documents', filter=previous),
+        prev_sales=Sum('total', filter=previous),
     )
     
-    # Combinar reportes
-    total_orders = (web_sales_report['total_orders'] or 0) + (pos_sales_report['total_orders'] or 0)
-    total_sales = (web_sales_report['total_sales'] or Decimal('0')) + (pos_sales_report['total_sales'] or Decimal('0'))
+    web_orders = totals['web_orders'] or 0
+    pos_orders = totals['pos_orders'] or 0
+    web_sales = totals['web_sales'] or Decimal('0')
+    pos_sales = totals['pos_sales'] or Decimal('0')
+    total_orders = web_orders + pos_orders
+    total_sales = web_sales + pos_sales
     avg_order_value = total_sales / total_orders if total_orders > 0 else Decimal('0')
     
     sales_report = {
         'total_orders': total_orders,
         'total_sales': total_sales,
         'avg_order_value': avg_order_value,
-        'web_orders': web_sales_report['total_orders'] or 0,
-        'pos_orders': pos_sales_report['total_orders'] or 0,
-        'web_sales': web_sales_report['total_sales'] or Decimal('0'),
-        'pos_sales': pos_sales_report['total_sales'] or Decimal('0')
+        'web_orders': web_orders,
+        'pos_orders': pos_orders,
+        'web_sales': web_sales,
+        'pos_sales': pos_sales
     }
     
     # Comparación con período anterior (Web + POS)
-    prev_start = start_dt - timedelta(days=(end_dt - start_dt).days + 1)
-    prev_end = start_dt - timedelta(days=1)
-    
-    prev_web_sales = Order.objects.filter(
-        created_at__date__range=[prev_start, prev_end],
-        status__in=['paid', 'shipped', 'delivered']
-    ).aggregate(
-        total_orders=Count('id'),
-        total_sales=Sum('total')
-    )
-    
-    prev_pos_sales = POSSale.objects.filter(
-        created_at__date__range=[prev_start, prev_end]
-    ).aggregate(
-        total_orders=Count('id'),
-        total_sales=Sum('total')
-    )
-    
-    prev_total_orders = (prev_web_sales['total_orders'] or 0) + (prev_pos_sales['total_orders'] or 0)
-    prev_total_sales = (prev_web_sales['total_sales'] or Decimal('0')) + (prev_pos_sales['total_sales'] or Decimal('0'))
-    
     prev_sales = {
-        'total_orders': prev_total_orders,
-        'total_sales': prev_total_sales
+        'total_orders': totals['prev_orders'] or 0,
+        'total_sales': totals['prev_sales'] or Decimal('0')
     }
     
     # Calcular crecimiento
@@ -1610,70 +1387,40 @@ def admin_reports(request):
         growth_percentage = ((current_total - prev_total) / prev_total) * 100
     
     # 2. PRODUCTOS MÁS VENDIDOS (Web + POS)
-    web_top_products = Product.objects.filter(
-        orderitem__order__created_at__date__range=[start_dt, end_dt],
-        orderitem__order__status__in=['paid', 'shipped', 'delivered']
-    ).annotate(
-        web_sold=Sum('orderitem__quantity'),
-        web_revenue=Sum('orderitem__total')
-    )
-    
-    pos_top_products = Product.objects.filter(
-        possaleitem__sale__created_at__date__range=[start_dt, end_dt]
-    ).annotate(
-        pos_sold=Sum('possaleitem__quantity'),
-        pos_revenue=Sum('possaleitem__total')
-    )
-    
-    # Combinar datos de web y POS
-    all_products = Product.objects.all()
-    top_products = []
-    
-    for product in all_products:
-        web_data = next((p for p in web_top_products if p.id == product.id), None)
-        pos_data = next((p for p in pos_top_products if p.id == product.id), None)
-        
-        web_sold = web_data.web_sold if web_data and web_data.web_sold else 0
-        web_revenue = web_data.web_revenue if web_data and web_data.web_revenue else Decimal('0')
-        pos_sold = pos_data.pos_sold if pos_data and pos_data.pos_sold else 0
-        pos_revenue = pos_data.pos_revenue if pos_data and pos_data.pos_revenue else Decimal('0')
-        
-        total_sold = web_sold + pos_sold
-        total_revenue = web_revenue + pos_revenue
-        
-        if total_sold > 0:  # Solo incluir productos que se han vendido
-            top_products.append({
-                'product': product,
-                'total_sold': total_sold,
-                'total_revenue': total_revenue,
-                'web_sold': web_sold,
-                'pos_sold': pos_sold
-            })
-    
-    # Ordenar por cantidad vendida
-    top_products.sort(key=lambda x: x['total_sold'], reverse=True)
-    top_products = top_products[:10]
+    product_rows = period_facts.values('product_id').annotate(
+        web_sold=Sum('units', filter=Q(channel='web')),
+        pos_sold=Sum('units', filter=Q(channel='pos')),
+        total_sold=Sum('units'),
+        total_revenue=Sum('revenue'),
+    ).filter(total_sold__gt=0).order_by('-total_sold')[:10]
+    product_rows = list(product_rows)
+    products_by_id = Product.objects.in_bulk([row['product_id'] for row in product_rows])
+    top_products = [
+        {
+            'product': products_by_id[row['product_id']],
+            'total_sold': row['total_sold'],
+            'total_revenue': row['total_revenue'] or Decimal('0'),
+            'web_sold': row['web_sold'] or 0,
+            'pos_sold': row['pos_sold'] or 0
+        }
+        for row in product_rows
+        if row['product_id'] in products_by_id
+    ]
     
     # 3. VENTAS POR DÍA (para gráfico) - Web + POS
+    daily_totals = {}
+    for row in paid_totals.filter(current).values('date', 'channel').annotate(total=Sum('total')):
+        daily_totals[(row['date'], row['channel'])] = row['total'] or Decimal('0')
+    
     daily_sales = []
     current_date = start_dt
     while current_date <= end_dt:
-        # Ventas web del día
-        daily_web_total = paid_web_orders.filter(
-            created_at__date=current_date
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-        
-        # Ventas POS del día
-        daily_pos_total = pos_sales.filter(
-            created_at__date=current_date
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-        
-        # Total del día
-        daily_total = daily_web_total + daily_pos_total
+        daily_web_total = daily_totals.get((current_date, 'web'), Decimal('0'))
+        daily_pos_total = daily_totals.get((current_date, 'pos'), Decimal('0'))
         
         daily_sales.append({
             'date': current_date.strftime('%Y-%m-%d'),
-            'total': float(daily_total),
+            'total': float(daily_web_total + daily_pos_total),
             'web_total': float(daily_web_total),
             'pos_total': float(daily_pos_total)
         })
@@ -1681,49 +1428,24 @@ def admin_reports(request):
         current_date += timedelta(days=1)
     
     # 4. VENTAS POR CATEGORÍA (Web + POS)
-    web_category_sales = Category.objects.filter(
-        product__orderitem__order__created_at__date__range=[start_dt, end_dt],
-        product__orderitem__order__status__in=['paid', 'shipped', 'delivered']
-    ).annotate(
-        web_sales=Sum('product__orderitem__total'),
-        web_quantity=Sum('product__orderitem__quantity')
-    )
-    
-    pos_category_sales = Category.objects.filter(
-        product__possaleitem__sale__created_at__date__range=[start_dt, end_dt]
-    ).annotate(
-        pos_sales=Sum('product__possaleitem__total'),
-        pos_quantity=Sum('product__possaleitem__quantity')
-    )
-    
-    # Combinar datos de categorías
-    all_categories = Category.objects.all()
-    category_sales = []
-    
-    for category in all_categories:
-        web_data = next((c for c in web_category_sales if c.id == category.id), None)
-        pos_data = next((c for c in pos_category_sales if c.id == category.id), None)
-        
-        web_sales = web_data.web_sales if web_data and web_data.web_sales else Decimal('0')
-        web_quantity = web_data.web_quantity if web_data and web_data.web_quantity else 0
-        pos_sales = pos_data.pos_sales if pos_data and pos_data.pos_sales else Decimal('0')
-        pos_quantity = pos_data.pos_quantity if pos_data and pos_data.pos_quantity else 0
-        
-        total_sales = web_sales + pos_sales
-        total_quantity = web_quantity + pos_quantity
-        
-        if total_sales > 0:  # Solo incluir categorías con ventas
-            category_sales.append({
-                'category': category,
-                'total_sales': total_sales,
-                'total_quantity': total_quantity,
-                'web_sales': web_sales,
-                'pos_sales': pos_sales
-            })
-    
-    # Ordenar por ventas totales
-    category_sales.sort(key=lambda x: x['total_sales'], reverse=True)
-    category_sales = category_sales[:5]
+    category_rows = list(period_facts.values('category_id').annotate(
+        web_sales=Sum('revenue', filter=Q(channel='web')),
+        pos_sales=Sum('revenue', filter=Q(channel='pos')),
+        total_sales=Sum('revenue'),
+        total_quantity=Sum('units'),
+    ).filter(total_sales__gt=0).order_by('-total_sales')[:5])
+    categories_by_id = Category.objects.in_bulk([row['category_id'] for row in category_rows])
+    category_sales = [
+        {
+            'category': categories_by_id[row['category_id']],
+            'total_sales': row['total_sales'],
+            'total_quantity': row['total_quantity'] or 0,
+            'web_sales': row['web_sales'] or Decimal('0'),
+            'pos_sales': row['pos_sales'] or Decimal('0')
+        }
+        for row in category_rows
+        if row['category_id'] in categories_by_id
+    ]
     
     # 5. ESTADO DE INVENTARIO
     low_stock_products = Stock.objects.filter(
@@ -1736,65 +1458,63 @@ def admin_reports(request):
     ).select_related('product', 'product__category', 'product__brand')[:10]
     
     # 6. CLIENTES TOP (Web + POS)
-    web_top_customers = Customer.objects.filter(
-        orders__created_at__date__range=[start_dt, end_dt],
-        orders__status__in=['paid', 'shipped', 'delivered']
-    ).annotate(
-        web_spent=Sum('orders__total'),
-        web_orders=Count('orders')
+    customer_totals = {}
+    web_customers = Order.objects.filter(
+        created_at__date__range=[start_dt, end_dt],
+        status__in=PAID_STATUSES
+    ).order_by().values('customer_id').annotate(
+        spent=Sum('total'),
+        orders=Count('id')
+    )
+    pos_customers = POSSale.objects.filter(
+        created_at__date__range=[start_dt, end_dt],
+        customer__isnull=False
+    ).order_by().values('customer_id').annotate(
+        spent=Sum('total'),
+        orders=Count('id')
     )
+    for channel, rows in (('web', web_customers), ('pos', pos_customers)):
+        for row in rows:
+            entry = customer_totals.setdefault(row['customer_id'], {
+                'web_spent': Decimal('0'), 'pos_spent': Decimal('0'),
+                'web_orders': 0, 'pos_orders': 0,
+            })
+            entry[f'{channel}_spent'] += row['spent'] or Decimal('0')
+            entry[f'{channel}_orders'] += row['orders']
     
-    pos_top_customers = Customer.objects.filter(
-        possale__created_at__date__range=[start_dt, end_dt]
-    ).annotate(
-        pos_spent=Sum('possale__total'),
-        pos_orders=Count('possale')
+    ranking = sorted(
+        customer_totals.items(),
+        key=lambda item: item[1]['web_spent'] + item[1]['pos_spent'],
+        reverse=True
     )
+    ranking = [item for item in ranking if item[1]['web_spent'] + item[1]['pos_spent'] > 0][:10]
+    customers_by_id = Customer.objects.select_related('user').in_bulk([item[0] for item in ranking])
     
-    # Combinar datos de clientes
-    all_customers = Customer.objects.all()
     top_customers = []
-    
-    for customer in all_customers:
-        web_data = next((c for c in web_top_customers if c.id == customer.id), None)
-        pos_data = next((c for c in pos_top_customers if c.id == customer.id), None)
-        
-        web_spent = web_data.web_spent if web_data and web_data.web_spent else Decimal('0')
-        web_orders = web_data.web_orders if web_data and web_data.web_orders else 0
-        pos_spent = pos_data.pos_spent if pos_data and pos_data.pos_spent else Decimal('0')
-        pos_orders = pos_data.pos_orders if pos_data and pos_data.pos_orders else 0
-        
-        total_spent = web_spent + pos_spent
-        total_orders = web_orders + pos_orders
-        
-        if total_spent > 0:  # Solo incluir clientes con gastos
-            avg_ticket = total_spent / total_orders if total_orders > 0 else Decimal('0')
-            top_customers.append({
-                'customer': customer,
-                'total_spent': total_spent,
-                'total_orders': total_orders,
-                'avg_ticket': avg_ticket,
-                'web_spent': web_spent,
-                'pos_spent': pos_spent,
-                'web_orders': web_orders,
-                'pos_orders': pos_orders
-            })
-    
-    # Ordenar por gasto total
-    top_customers.sort(key=lambda x: x['total_spent'], reverse=True)
-    top_customers = top_customers[:10]
+    for customer_id, entry in ranking:
+        if customer_id not in customers_by_id:
+            continue
+        total_spent = entry['web_spent'] + entry['pos_spent']
+        total_orders = entry['web_orders'] + entry['pos_orders']
+        top_customers.append({
+            'customer': customers_by_id[customer_id],
+            'total_spent': total_spent,
+            'total_orders': total_orders,
+            'avg_ticket': total_spent / total_orders if total_orders > 0 else Decimal('0'),
+            **entry
+        })
     
     # 7. ESTADÍSTICAS DE ÓRDENES (Web + POS)
-    web_order_stats = {
-        'new': Order.objects.filter(created_at__date__range=[start_dt, end_dt], status='new').count(),
-        'pending': Order.objects.filter(created_at__date__range=[start_dt, end_dt], status='pending').count(),
-        'paid': Order.objects.filter(created_at__date__range=[start_dt, end_dt], status='paid').count(),
-        'shipped': Order.objects.filter(created_at__date__range=[start_dt, end_dt], status='shipped').count(),
-        'delivered': Order.objects.filter(created_at__date__range=[start_dt, end_dt], status='delivered').count(),
-        'cancelled': Order.objects.filter(created_at__date__range=[start_dt, end_dt], status='cancelled').count(),
-    }
-    
-    pos_sales_count = POSSale.objects.filter(created_at__date__range=[start_dt, end_dt]).count()
+    web_order_stats = {status: 0 for status in ['new', 'pending', 'paid', 'shipped', 'delivered', 'cancelled']}
+    pos_sales_count = 0
+    status_rows = DailySalesTotal.objects.filter(
+        date__range=[start_dt, end_dt]
+    ).order_by().values('channel', 'status').annotate(count=Sum('documents'))
+    for row in status_rows:
+        if row['channel'] == 'pos':
+            pos_sales_count += row['count']
+        elif row['status'] in web_order_stats:
+            web_order_stats[row['status']] += row['count']
     
     # Combinar estadísticas
     order_stats = {
@@ -1931,15 +1651,20 @@ def admin_adjust_stock(request, stock_id):
             reference = 'Ajuste negativo'
         
         # Crear movimiento de stock
-        StockMovement.objects.create(
-            product=stock.product,
-            warehouse=stock.warehouse,
-            movement_type=movement_type,
-            quantity=movement_quantity,
-            reference=reference,
-            notes=notes,
-            user=request.user
-        )
+        try:
+            post_movements([StockMovement(
+                product=stock.product,
+                warehouse=stock.warehouse,
+                movement_type=movement_type,
+                quantity=movement_quantity,
+                reference=reference,
+                notes=notes,
+                user=request.user
+            )])
+        except InsufficientStockError as e:
+            messages.error(request, f'No se puede reducir el stock: disponible {e.failed_items[0]["available"]}')
+            return redirect('custom_admin:admin_adjust_stock', stock_id=stock.id)
+        stock.refresh_from_db(fields=['quantity'])
         
         messages.success(request, f'Stock ajustado exitosamente. Nuevo stock: {stock.quantity}')
         return redirect('custom_admin:admin_inventory')
@@ -2112,43 +1837,34 @@ def api_products_with_stock(request):
     except Warehouse.DoesNotExist:
         return JsonResponse({'error': 'Warehouse not found'}, status=404)
     
-    # Obtener productos con stock en la bodega
+    # Obtener productos con stock en la bodega (stock e imagen principal en la misma consulta)
     products_with_stock = Product.objects.filter(
         stock__warehouse=warehouse,
         stock__quantity__gt=0,
         is_active=True
-    ).select_related().prefetch_related('images').distinct().order_by('name')
+    ).select_related('category', 'brand', 'primary_image').with_stock_totals(
+        warehouse=warehouse
+    ).distinct().order_by('name')
     
+    products_with_stock = list(products_with_stock)
+    thumbnails = image_sets(
+        product.primary_image.image.name for product in products_with_stock if product.primary_image
+    )
     products_data = []
     for product in products_with_stock:
-        try:
-            stock = Stock.objects.get(product=product, warehouse=warehouse)
-            # Obtener la imagen principal del producto
-            primary_image = product.images.filter(is_primary=True).first()
-            if not primary_image:
-                primary_image = product.images.first()  # Si no hay principal, tomar la primera
-            
-            image_url = primary_image.image.url if primary_image else None
-            
-            # Debug: Log de imágenes
-            print(f"Producto: {product.name}")
-            print(f"Total imágenes: {product.images.count()}")
-            print(f"Imagen principal: {primary_image}")
-            print(f"URL imagen: {image_url}")
-            
-            products_data.append({
-                'id': product.id,
-                'name': product.name,
-                'sku': product.sku,
-                'stock': stock.quantity,
-                'image': image_url,
-                'price': float(product.price) if product.price else None,
-                'category': product.category.name if product.category else None,
-                'brand': product.brand.name if product.brand else None,
-                'description': product.short_description or product.description[:100] + '...' if product.description else None
-            })
-        except Stock.DoesNotExist:
-            continue
+        primary_image = product.get_main_image()
+        products_data.append({
+            'id': product.id,
+            'name': product.name,
+            'sku': product.sku,
+            'stock': product.warehouse_stock,
+            'image': primary_image.image.url if primary_image else None,
+            'thumbnail': thumbnails[primary_image.image.name]['thumbnail'] if primary_image else None,
+            'price': float(product.price) if product.price else None,
+            'category': product.category.name if product.category else None,
+            'brand': product.brand.name if product.brand else None,
+            'description': product.short_description or product.description[:100] + '...' if product.description else None
+        })
     
     return JsonResponse({
         'products': products_data,
@@ -2220,91 +1936,25 @@ def admin_transfer_detail(request, transfer_id):
 def admin_complete_transfer(request, transfer_id):
     """Completar una transferencia pendiente"""
     try:
-        transfer = StockTransfer.objects.get(id=transfer_id)
+        transfer = StockTransfer.objects.select_related('from_warehouse', 'to_warehouse').get(id=transfer_id)
         
         if transfer.status != 'pending':
             messages.error(request, f'La transferencia {transfer.reference} no está pendiente. Estado actual: {transfer.get_status_display()}')
             return redirect('custom_admin:admin_transfer_detail', transfer_id=transfer_id)
         
-        # Verificar que todos los productos tengan stock suficiente en la bodega origen
-        insufficient_stock = []
-        for item in transfer.items.all():
-            try:
-                stock = Stock.objects.get(
-                    product=item.product,
-                    warehouse=transfer.from_warehouse
-                )
-                if stock.quantity < item.quantity:
-                    insufficient_stock.append({
-                        'product': item.product.name,
-                        'required': item.quantity,
-                        'available': stock.quantity
-                    })
-            except Stock.DoesNotExist:
-                insufficient_stock.append({
-                    'product': item.product.name,
-                    'required': item.quantity,
-                    'available': 0
-                })
-        
-        if insufficient_stock:
-            messages.error(request, 'No se puede completar la transferencia. Stock insuficiente:')
-            for stock_info in insufficient_stock:
+        # Todas las líneas se validan y se mueven juntas; si alguna no tiene
+        # stock suficiente no se aplica ningún movimiento
+        try:
+            complete_transfer(transfer, request.user)
+        except TransferError as e:
+            if e.failed_items:
+                messages.error(request, 'No se puede completar la transferencia. Stock insuficiente:')
+            else:
+                messages.error(request, e.message)
+            for stock_info in e.failed_items:
                 messages.error(request, f'- {stock_info["product"]}: Requerido {stock_info["required"]}, Disponible {stock_info["available"]}')
             return redirect('custom_admin:admin_transfer_detail', transfer_id=transfer_id)
         
-        # Procesar la transferencia usando transacciones atómicas
-        from django.db import transaction
-        from django.utils import timezone
-        
-        with transaction.atomic():
-            # Actualizar stock en bodega origen (reducir)
-            for item in transfer.items.all():
-                stock_from, created = Stock.objects.get_or_create(
-                    product=item.product,
-                    warehouse=transfer.from_warehouse,
-                    defaults={'quantity': 0}
-                )
-                stock_from.quantity -= item.quantity
-                stock_from.save()
-                
-                # Crear movimiento de stock para bodega origen
-                StockMovement.objects.create(
-                    product=item.product,
-                    warehouse=transfer.from_warehouse,
-                    quantity=-item.quantity,  # Negativo porque es salida
-                    movement_type='out',
-                    reference=f'Transferencia {transfer.reference}',
-                    notes=f'Salida por transferencia a {transfer.to_warehouse.name}',
-                    user=request.user
-                )
-            
-            # Actualizar stock en bodega destino (aumentar)
-            for item in transfer.items.all():
-                stock_to, created = Stock.objects.get_or_create(
-                    product=item.product,
-                    warehouse=transfer.to_warehouse,
-                    defaults={'quantity': 0}
-                )
-                stock_to.quantity += item.quantity
-                stock_to.save()
-                
-                # Crear movimiento de stock para bodega destino
-                StockMovement.objects.create(
-                    product=item.product,
-                    warehouse=transfer.to_warehouse,
-                    quantity=item.quantity,  # Positivo porque es entrada
-                    movement_type='in',
-                    reference=f'Transferencia {transfer.reference}',
-                    notes=f'Entrada por transferencia desde {transfer.from_warehouse.name}',
-                    user=request.user
-                )
-            
-            # Marcar transferencia como completada
-            transfer.status = 'completed'
-            transfer.completed_at = timezone.now()
-            transfer.save()
-        
         messages.success(request, f'Transferencia {transfer.reference} completada exitosamente. Stock actualizado en ambas bodegas.')
         return redirect('custom_admin:admin_transfer_detail', transfer_id=transfer_id)
         
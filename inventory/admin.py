@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Warehouse, Stock, StockMovement, StockTransfer, StockTransferItem
+from .models import Warehouse, Stock, ProductStockSummary, StockMovement, StockSnapshot, StockTransfer, StockTransferItem, DocumentSequence
 
 
 @admin.register(Warehouse)
@@ -28,6 +28,21 @@ class StockAdmin(admin.ModelAdmin):
     is_out_of_stock.short_description = 'Sin stock'
 
 
+@admin.register(ProductStockSummary)
+class ProductStockSummaryAdmin(admin.ModelAdmin):
+    list_display = ['product', 'total_quantity', 'warehouses_with_stock', 'is_low_stock', 'updated_at']
+    list_filter = ['is_low_stock']
+    search_fields = ['product__name', 'product__sku']
+    readonly_fields = ['product', 'total_quantity', 'warehouses_with_stock', 'is_low_stock', 'updated_at']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+    
+    def has_add_permission(self, request):
+        # Se mantiene automáticamente desde el stock
+        return False
+
+
 @admin.register(StockMovement)
 class StockMovementAdmin(admin.ModelAdmin):
     list_display = ['product', 'warehouse', 'movement_type', 'quantity', 'reference', 'user', 'created_at']
@@ -39,6 +54,22 @@ class StockMovementAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('product', 'warehouse', 'user')
 
 
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['product', 'warehouse', 'date', 'quantity', 'created_at']
+    list_filter = ['warehouse', 'date']
+    search_fields = ['product__name', 'product__sku', 'warehouse__name']
+    readonly_fields = ['product', 'warehouse', 'date', 'quantity', 'created_at']
+    date_hierarchy = 'date'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'warehouse')
+    
+    def has_add_permission(self, request):
+        # Los genera el comando snapshot_stock
+        return False
+
+
 class StockTransferItemInline(admin.TabularInline):
     model = StockTransferItem
     extra = 1
@@ -56,3 +87,11 @@ class StockTransferAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('from_warehouse', 'to_warehouse', 'created_by')
 
+
+
+@admin.register(DocumentSequence)
+class DocumentSequenceAdmin(admin.ModelAdmin):
+    list_display = ['prefix', 'period', 'last_value', 'updated_at']
+    list_filter = ['prefix']
+    search_fields = ['prefix', 'period']
+    readonly_fields = ['updated_at']
@@ -5,5 +5,6 @@ class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
 
-
-
+    def ready(self):
+        # Importar señales cuando la app esté lista
+        import inventory.signals
@@ -0,0 +1,129 @@
+"""
+Registro de movimientos de inventario.
+
+``post_movements`` es la única forma de modificar el stock a partir de
+movimientos: recibe los ``StockMovement`` de un documento (compra,
+transferencia, venta, ajuste) sin guardar y en una transacción
+
+1. inserta los movimientos con ``bulk_create``,
+2. crea en un solo INSERT las filas de stock que todavía no existen,
+3. suma a cada par producto-bodega el neto de sus movimientos con un único
+   ``UPDATE ... SET quantity = quantity + delta`` condicional, de modo que
+   dos procesos nunca pierdan una actualización ni dejen stock negativo,
+4. recalcula el resumen de stock de los productos afectados.
+
+Si algún par no tiene unidades suficientes no se escribe nada y se lanza
+``InsufficientStockError``. ``apply_movements`` hace los pasos 2 a 4 para
+un movimiento que ya se guardó por su cuenta (``StockMovement.save``).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, When
+from django.utils import timezone
+
+from .models import ProductStockSummary, Stock, StockMovement
+
+
+class InsufficientStockError(Exception):
+    """
+    Los movimientos dejarían stock negativo. ``failed_items`` contiene un
+    diccionario por par producto-bodega con la cantidad pedida y la disponible.
+    """
+
+    def __init__(self, message, failed_items):
+        super().__init__(message)
+        self.message = message
+        self.failed_items = failed_items
+
+
+def net_deltas(movements):
+    """``{(producto, bodega): cantidad neta}`` sin los pares que se anulan"""
+    deltas = defaultdict(int)
+    for movement in movements:
+        deltas[(movement.product_id, movement.warehouse_id)] += movement.quantity
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def _apply_deltas(deltas):
+    """
+    Aplica los netos en un solo UPDATE. Las salidas solo se aplican si hay
+    unidades suficientes; devuelve los pares que no se pudieron aplicar.
+    """
+    rows = Q()
+    condition = Q()
+    whens = []
+    for (product_id, warehouse_id), delta in deltas.items():
+        key = Q(product_id=product_id, warehouse_id=warehouse_id)
+        rows |= key
+        condition |= (key & Q(quantity__gte=-delta)) if delta < 0 else key
+        whens.append(When(key, then=F('quantity') + delta))
+    update = {
+        'quantity': Case(*whens, output_field=IntegerField()),
+        'updated_at': timezone.now(),
+    }
+
+    sid = transaction.savepoint()
+    if Stock.objects.filter(condition).update(**update) == len(deltas):
+        transaction.savepoint_commit(sid)
+        return []
+
+    # Algún par no tenía unidades: se deshace el UPDATE parcial y se comparan
+    # las cantidades, ya bloqueadas, con lo pedido
+    transaction.savepoint_rollback(sid)
+    current = {
+        (product_id, warehouse_id): quantity
+        for product_id, warehouse_id, quantity in Stock.objects.select_for_update().filter(rows).values_list(
+            'product_id', 'warehouse_id', 'quantity'
+        )
+    }
+    failed = [
+        {
+            'product_id': product_id,
+            'warehouse_id': warehouse_id,
+            'requested': -delta,
+            'available': current.get((product_id, warehouse_id), 0),
+        }
+        for (product_id, warehouse_id), delta in deltas.items()
+        if current.get((product_id, warehouse_id), 0) < -delta
+    ]
+    if not failed:
+        # Otro proceso repuso stock entre el UPDATE y la lectura; con las
+        # filas bloqueadas el UPDATE se aplica completo
+        Stock.objects.filter(condition).update(**update)
+    return failed
+
+
+@transaction.atomic
+def apply_movements(movements):
+    """
+    Aplica al stock el efecto de movimientos ya guardados (pasos 2 a 4). Lo
+    usa ``StockMovement.save`` para un movimiento guardado con ``save()``.
+    """
+    deltas = net_deltas(movements)
+    if deltas:
+        Stock.objects.bulk_create(
+            [Stock(product_id=product_id, warehouse_id=warehouse_id, quantity=0) for product_id, warehouse_id in deltas],
+            ignore_conflicts=True,
+        )
+        failed = _apply_deltas(deltas)
+        if failed:
+            raise InsufficientStockError('Stock insuficiente', failed)
+
+    # El UPDATE en lote no dispara las señales de Stock
+    ProductStockSummary.refresh(movement.product_id for movement in movements)
+
+
+@transaction.atomic
+def post_movements(movements):
+    """
+    Registra los movimientos y aplica su efecto en el stock. Devuelve los
+    movimientos guardados (con ``pk`` en las bases que lo devuelven).
+    """
+    movements = list(movements)
+    if not movements:
+        return []
+
+    StockMovement.objects.bulk_create(movements)
+    apply_movements(movements)
+    return movements
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import Product
+from inventory.models import ProductStockSummary
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el resumen de stock por producto (ProductStockSummary) desde la tabla de stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Productos a recalcular por lote (por defecto 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+
+        self.stdout.write(f'Recalculando resumen de stock para {len(product_ids)} productos...')
+
+        with transaction.atomic():
+            for start in range(0, len(product_ids), batch_size):
+                ProductStockSummary.refresh(product_ids[start:start + batch_size])
+
+        low_stock = ProductStockSummary.objects.filter(is_low_stock=True).count()
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ Resumen recalculado ({low_stock} productos con stock bajo)')
+        )
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.snapshots import take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Guarda el saldo de cierre diario (StockSnapshot) de cada producto en cada bodega'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Día a cerrar (YYYY-MM-DD); por defecto ayer',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=1,
+            help='Cantidad de días a cerrar terminando en --date, para completar saldos faltantes (por defecto 1)',
+        )
+
+    def parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {value} (formato YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        end = self.parse_date(options['date']) if options['date'] else timezone.localdate() - timedelta(days=1)
+        if options['days'] < 1:
+            raise CommandError('--days debe ser mayor que cero')
+
+        total = 0
+        for offset in range(options['days'] - 1, -1, -1):
+            day = end - timedelta(days=offset)
+            count = take_snapshot(day)
+            total += count
+            self.stdout.write(f'{day}: {count} saldos')
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Saldos de stock guardados ({total})'))
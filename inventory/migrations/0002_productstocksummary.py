@@ -0,0 +1,53 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Q, Sum
+
+
+def populate_stock_summary(apps, schema_editor):
+    Stock = apps.get_model('inventory', 'Stock')
+    ProductStockSummary = apps.get_model('inventory', 'ProductStockSummary')
+
+    rows = Stock.objects.order_by().values('product_id').annotate(
+        total=Sum('quantity'),
+        warehouses=Count('id', filter=Q(quantity__gt=0)),
+        low=Count('id', filter=Q(quantity__lte=F('min_stock'))),
+    )
+    ProductStockSummary.objects.bulk_create([
+        ProductStockSummary(
+            product_id=row['product_id'],
+            total_quantity=row['total'] or 0,
+            warehouses_with_stock=row['warehouses'],
+            is_low_stock=row['low'] > 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStockSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_quantity', models.IntegerField(default=0, verbose_name='Cantidad total')),
+                ('warehouses_with_stock', models.PositiveIntegerField(default=0, verbose_name='Bodegas con stock')),
+                ('is_low_stock', models.BooleanField(default=False, verbose_name='Stock bajo')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Actualizado en')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stock_summary', to='catalog.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Resumen de stock',
+                'verbose_name_plural': 'Resúmenes de stock',
+                'indexes': [models.Index(fields=['is_low_stock'], name='inventory_p_is_low__031130_idx')],
+            },
+        ),
+        migrations.RunPython(populate_stock_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_productstocksummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=20, verbose_name='Prefijo')),
+                ('period', models.CharField(max_length=8, verbose_name='Periodo')),
+                ('last_value', models.PositiveIntegerField(default=0, verbose_name='Último valor')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Actualizado en')),
+            ],
+            options={
+                'verbose_name': 'Consecutivo de documentos',
+                'verbose_name_plural': 'Consecutivos de documentos',
+                'unique_together': {('prefix', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_product_primary_image'),
+        ('inventory', '0003_documentsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('quantity', models.IntegerField(verbose_name='Cantidad al cierre')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creado en')),
+            ],
+            options={
+                'verbose_name': 'Saldo de stock',
+                'verbose_name_plural': 'Saldos de stock',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'warehouse', 'created_at'], name='inventory_s_product_854de5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['created_at'], name='inventory_s_created_05ebf5_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.product', verbose_name='Producto'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse', verbose_name='Bodega'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['date'], name='inventory_s_date_708e7d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stocksnapshot',
+            unique_together={('product', 'warehouse', 'date')},
+        ),
+    ]
@@ -1,7 +1,13 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Q, Sum
 from django.core.validators import MinValueValidator
+from django.dispatch import Signal
 from decimal import Decimal
 
+# Se envía con ``product_ids`` cada vez que se recalcula el resumen de stock,
+# incluso tras actualizaciones en lote que no disparan las señales de ``Stock``
+stock_changed = Signal()
+
 
 class Warehouse(models.Model):
     name = models.CharField(max_length=100, verbose_name="Nombre")
@@ -58,6 +64,72 @@ class Stock(models.Model):
         return self.quantity == 0
 
 
+class ProductStockSummary(models.Model):
+    """
+    Resumen desnormalizado del stock de cada producto en todas las bodegas.
+    Se mantiene al día desde las señales de ``Stock`` para que las lecturas de
+    la tienda y el POS no tengan que agregar la tabla de stock.
+    """
+    product = models.OneToOneField('catalog.Product', on_delete=models.CASCADE, related_name='stock_summary', verbose_name="Producto")
+    total_quantity = models.IntegerField(default=0, verbose_name="Cantidad total")
+    warehouses_with_stock = models.PositiveIntegerField(default=0, verbose_name="Bodegas con stock")
+    is_low_stock = models.BooleanField(default=False, verbose_name="Stock bajo")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Actualizado en")
+
+    class Meta:
+        verbose_name = "Resumen de stock"
+        verbose_name_plural = "Resúmenes de stock"
+        indexes = [
+            models.Index(fields=['is_low_stock']),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: {self.total_quantity}"
+
+    @classmethod
+    def refresh(cls, product_ids):
+        """
+        Recalcula el resumen de los productos indicados con una consulta de
+        agregación y un único upsert.
+
+        Antes de agregar bloquea las filas de ``Stock`` de esos productos
+        (en orden de pk): dos recálculos concurrentes del mismo producto se
+        serializan y el último en escribir siempre ve el stock ya confirmado
+        del otro, en lugar de pisarlo con una suma vieja.
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return
+
+        with transaction.atomic():
+            list(
+                Stock.objects.select_for_update().filter(product_id__in=product_ids)
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            summaries = {
+                product_id: cls(product_id=product_id)
+                for product_id in product_ids
+            }
+            rows = Stock.objects.filter(product_id__in=product_ids).order_by().values('product_id').annotate(
+                total=Sum('quantity'),
+                warehouses=Count('id', filter=Q(quantity__gt=0)),
+                low=Count('id', filter=Q(quantity__lte=F('min_stock'))),
+            )
+            for row in rows:
+                summary = summaries[row['product_id']]
+                summary.total_quantity = row['total'] or 0
+                summary.warehouses_with_stock = row['warehouses']
+                summary.is_low_stock = row['low'] > 0
+
+            cls.objects.bulk_create(
+                summaries.values(),
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=['total_quantity', 'warehouses_with_stock', 'is_low_stock', 'updated_at'],
+            )
+        stock_changed.send(sender=cls, product_ids=product_ids)
+
+
 class StockMovement(models.Model):
     MOVEMENT_TYPES = [
         ('in', 'Entrada'),
@@ -80,23 +152,50 @@ class StockMovement(models.Model):
         verbose_name = "Movimiento de stock"
         verbose_name_plural = "Movimientos de stock"
         ordering = ['-created_at']
+        indexes = [
+            # Movimientos de un producto en una bodega desde una fecha (stock_as_of)
+            models.Index(fields=['product', 'warehouse', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
 
     def __str__(self):
         return f"{self.get_movement_type_display()} - {self.product.name}: {self.quantity}"
 
     def save(self, *args, **kwargs):
+        if self._state.adding and self.pk is None:
+            # Un movimiento nuevo se guarda (con sus señales) junto con su
+            # efecto en el stock; si no hay stock suficiente no se guarda
+            from .ledger import apply_movements
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                apply_movements([self])
+            return
         super().save(*args, **kwargs)
-        # Actualizar el stock después de crear el movimiento
-        self.update_stock()
 
-    def update_stock(self):
-        stock, created = Stock.objects.get_or_create(
-            product=self.product,
-            warehouse=self.warehouse,
-            defaults={'quantity': 0}
-        )
-        stock.quantity += self.quantity
-        stock.save()
+
+class StockSnapshot(models.Model):
+    """
+    Saldo de cierre de un producto en una bodega al final de un día. Lo
+    genera el comando ``snapshot_stock``; ``inventory.snapshots.stock_as_of``
+    parte del saldo más cercano y solo suma los movimientos posteriores.
+    """
+    product = models.ForeignKey('catalog.Product', on_delete=models.CASCADE, verbose_name="Producto")
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, verbose_name="Bodega")
+    date = models.DateField(verbose_name="Fecha")
+    quantity = models.IntegerField(verbose_name="Cantidad al cierre")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Creado en")
+
+    class Meta:
+        verbose_name = "Saldo de stock"
+        verbose_name_plural = "Saldos de stock"
+        unique_together = ['product', 'warehouse', 'date']
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} - {self.warehouse.name} ({self.date}): {self.quantity}"
 
 
 class StockTransfer(models.Model):
@@ -140,14 +239,50 @@ class StockTransferItem(models.Model):
         return f"{self.product.name} x {self.quantity}"
 
 
+class DocumentSequence(models.Model):
+    """
+    Consecutivo de documentos (órdenes, ventas POS, compras) por prefijo y
+    periodo. Reservar un número es un UPDATE atómico sobre una sola fila, sin
+    recorrer la tabla del documento.
+    """
+    prefix = models.CharField(max_length=20, verbose_name="Prefijo")
+    period = models.CharField(max_length=8, verbose_name="Periodo")
+    last_value = models.PositiveIntegerField(default=0, verbose_name="Último valor")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Actualizado en")
 
+    class Meta:
+        verbose_name = "Consecutivo de documentos"
+        verbose_name_plural = "Consecutivos de documentos"
+        unique_together = ['prefix', 'period']
 
-
-
-
-
-
-
-
-
-
+    def __str__(self):
+        return f"{self.prefix} {self.period}: {self.last_value}"
+
+    @classmethod
+    def allocate(cls, prefix, period, count=1, seed=None):
+        """
+        Reserva ``count`` números consecutivos y devuelve el último.
+
+        El UPDATE bloquea la fila hasta el final de la transacción, así que
+        dos procesos nunca obtienen el mismo número. ``seed`` es una función
+        opcional que devuelve el último número ya usado; solo se llama la
+        primera vez que se usa el periodo, para continuar la numeración de
+        los documentos existentes.
+        """
+        sequence = cls.objects.filter(prefix=prefix, period=period)
+        with transaction.atomic():
+            updated = sequence.update(last_value=F('last_value') + count)
+            if not updated:
+                start = seed() if seed else 0
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefix=prefix, period=period, last_value=start + count)
+                except IntegrityError:
+                    # Otro proceso creó el periodo al mismo tiempo
+                    sequence.update(last_value=F('last_value') + count)
+            return sequence.values_list('last_value', flat=True).get()
+
+    @classmethod
+    def next_value(cls, prefix, period, seed=None):
+        """Reserva y devuelve el siguiente número"""
+        return cls.allocate(prefix, period, seed=seed)
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Stock, ProductStockSummary
+
+
+@receiver(post_save, sender=Stock)
+def update_stock_summary_on_save(sender, instance, **kwargs):
+    """
+    Mantiene actualizado el resumen de stock del producto
+    """
+    ProductStockSummary.refresh([instance.product_id])
+
+
+@receiver(post_delete, sender=Stock)
+def update_stock_summary_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Recalcula el resumen cuando se elimina un stock, salvo que se esté
+    eliminando el propio producto (el resumen se borra en cascada)
+    """
+    from catalog.models import Product
+
+    if isinstance(origin, Product):
+        return
+    ProductStockSummary.refresh([instance.product_id])
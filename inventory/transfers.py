@@ -0,0 +1,120 @@
+"""
+Completar transferencias de stock entre bodegas.
+
+``complete_transfer`` procesa todas las líneas de la transferencia con un
+número fijo de consultas, sin importar cuántas tenga:
+
+1. La transferencia se marca como completada con un UPDATE condicional
+   sobre su estado, de modo que dos peticiones no la completen dos veces.
+2. Las líneas se leen con una consulta y las filas de stock de ambas
+   bodegas se bloquean (``select_for_update``) con otra.
+3. La disponibilidad en la bodega origen se valida en memoria, sumando las
+   líneas del mismo producto. Si algún producto no alcanza no se escribe
+   nada y se lanza ``TransferError`` con todos los que fallaron.
+4. La salida y la entrada de cada línea se registran con
+   ``inventory.ledger.post_movements`` y la trazabilidad con
+   ``audit.utils.create_inventory_traces``, ambas en lote.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from audit.models import InventoryTrace
+from audit.utils import create_inventory_traces
+from .ledger import post_movements
+from .models import Stock, StockMovement, StockTransfer
+
+
+class TransferError(Exception):
+    """
+    La transferencia no se pudo completar. ``failed_items`` contiene un
+    diccionario por línea sin stock suficiente en la bodega origen.
+    """
+
+    def __init__(self, message, failed_items=None):
+        super().__init__(message)
+        self.message = message
+        self.failed_items = failed_items or []
+
+
+@transaction.atomic
+def complete_transfer(transfer, user):
+    """
+    Mueve el stock de todas las líneas de ``transfer`` de la bodega origen a
+    la destino y la marca como completada.
+    """
+    now = timezone.now()
+    claimed = StockTransfer.objects.filter(pk=transfer.pk, status='pending').update(
+        status='completed', completed_at=now,
+    )
+    if not claimed:
+        raise TransferError(f'La transferencia {transfer.reference} no está pendiente')
+
+    items = list(transfer.items.select_related('product'))
+    if not items:
+        raise TransferError(f'La transferencia {transfer.reference} no tiene productos')
+
+    from_warehouse, to_warehouse = transfer.from_warehouse, transfer.to_warehouse
+    stocks = {
+        (stock.product_id, stock.warehouse_id): stock.quantity
+        for stock in Stock.objects.select_for_update().filter(
+            product_id__in=[item.product_id for item in items],
+            warehouse_id__in=[from_warehouse.pk, to_warehouse.pk],
+        ).only('product_id', 'warehouse_id', 'quantity')
+    }
+
+    # Un producto puede venir en varias líneas: se valida el total
+    required = {}
+    for item in items:
+        required[item.product] = required.get(item.product, 0) + item.quantity
+    failed = []
+    for product, quantity in required.items():
+        available = stocks.get((product.pk, from_warehouse.pk), 0)
+        if available < quantity:
+            failed.append({
+                'product_id': product.pk,
+                'product': product.name,
+                'required': quantity,
+                'available': available,
+            })
+    if failed:
+        raise TransferError(f'La transferencia {transfer.reference} no tiene stock suficiente', failed)
+
+    movements = []
+    traces = []
+    # Saldo de cada producto y bodega a medida que se agregan las líneas
+    balances = dict(stocks)
+    reference = f'Transferencia {transfer.reference}'
+    for item in items:
+        legs = (
+            (from_warehouse, -item.quantity, 'out', 'STOCK_TRANSFER',
+             f'Salida por transferencia a {to_warehouse.name}'),
+            (to_warehouse, item.quantity, 'in', 'STOCK_TRANSFER_RECEIVE',
+             f'Entrada por transferencia desde {from_warehouse.name}'),
+        )
+        for warehouse, quantity, movement_type, trace_type, notes in legs:
+            movements.append(StockMovement(
+                product=item.product, warehouse=warehouse, movement_type=movement_type,
+                quantity=quantity, reference=reference, notes=notes, user=user,
+            ))
+            stock_before = balances.get((item.product_id, warehouse.pk), 0)
+            balances[(item.product_id, warehouse.pk)] = stock_before + quantity
+            traces.append(InventoryTrace(
+                movement_type=trace_type,
+                product=item.product,
+                warehouse=warehouse,
+                quantity=quantity,
+                unit_cost=item.product.cost_price,
+                total_cost=item.quantity * item.product.cost_price,
+                stock_before=stock_before,
+                stock_after=stock_before + quantity,
+                stock_transfer=transfer,
+                stock_transfer_item=item,
+                user=user,
+                notes=notes,
+            ))
+    post_movements(movements)
+    create_inventory_traces(traces)
+
+    transfer.status = 'completed'
+    transfer.completed_at = now
+    return transfer
@@ -6,6 +6,7 @@ from django.urls import reverse_lazy
 from django.db.models import Q, Sum, Count, F
 from django.http import JsonResponse
 from django.utils import timezone
+from .transfers import TransferError, complete_transfer
 from .models import Warehouse, Stock, StockMovement, StockTransfer, StockTransferItem
 from .forms import StockMovementForm, StockTransferForm, StockTransferItemForm
 from catalog.models import Product
@@ -241,52 +242,18 @@ class StockTransferCompleteView(UpdateView):
             messages.error(self.request, 'Solo se pueden completar transferencias pendientes')
             return redirect('inventory:transfer_detail', pk=transfer.pk)
         
-        # Procesar items de la transferencia
-        for item in transfer.items.all():
-            # Reducir stock en bodega origen
-            from_stock, created = Stock.objects.get_or_create(
-                product=item.product,
-                warehouse=transfer.from_warehouse,
-                defaults={'quantity': 0}
-            )
-            from_stock.quantity -= item.quantity
-            from_stock.save()
-            
-            # Crear movimiento de salida
-            StockMovement.objects.create(
-                product=item.product,
-                warehouse=transfer.from_warehouse,
-                movement_type='out',
-                quantity=-item.quantity,
-                reference=f'Transferencia {transfer.reference}',
-                notes=f'Transferencia a {transfer.to_warehouse.name}',
-                user=self.request.user
-            )
-            
-            # Aumentar stock en bodega destino
-            to_stock, created = Stock.objects.get_or_create(
-                product=item.product,
-                warehouse=transfer.to_warehouse,
-                defaults={'quantity': 0}
-            )
-            to_stock.quantity += item.quantity
-            to_stock.save()
-            
-            # Crear movimiento de entrada
-            StockMovement.objects.create(
-                product=item.product,
-                warehouse=transfer.to_warehouse,
-                movement_type='in',
-                quantity=item.quantity,
-                reference=f'Transferencia {transfer.reference}',
-                notes=f'Transferencia desde {transfer.from_warehouse.name}',
-                user=self.request.user
-            )
-        
-        # Actualizar estado de la transferencia
-        transfer.status = 'completed'
-        transfer.completed_at = timezone.now()
-        transfer.save()
-        
+        try:
+            complete_transfer(transfer, self.request.user)
+        except TransferError as e:
+            if not e.failed_items:
+                messages.error(self.request, e.message)
+            for failure in e.failed_items:
+                messages.error(
+                    self.request,
+                    f'Stock insuficiente de {failure["product"]}: '
+                    f'requerido {failure["required"]}, disponible {failure["available"]}'
+                )
+            return redirect('inventory:transfer_detail', pk=transfer.pk)
+
         messages.success(self.request, 'Transferencia completada exitosamente')
         return redirect('inventory:transfer_detail', pk=transfer.pk)
@@ -0,0 +1,77 @@
+"""
+Acumulación de trabajo pendiente hasta el commit de la transacción.
+
+``CommitBatch`` mantiene, por hilo, colecciones de lo pendiente de la
+transacción en curso y registra un ``transaction.on_commit`` por colección
+que la procesa al hacer commit.
+
+Hay una colección por cada nivel de savepoint: lo añadido dentro de un
+``atomic()`` anidado va a la colección de ese savepoint, cuyo callback se
+registra desde dentro del savepoint. Si el savepoint se revierte, Django
+descarta ese callback y con él la colección; si se revierte toda la
+transacción, se descartan todas. Para saber si una colección sigue viva se
+guarda una referencia débil a su callback: en cuanto Django lo descarta
+(CPython lo libera al perder la última referencia), la colección se da por
+perdida y el siguiente ``pending()`` en ese nivel crea una nueva.
+
+La usan el buffer de auditoría (``audit.buffer``), el recálculo de totales de
+compras (``purchases.totals``) y los hechos de ventas diarias
+(``reports.signals``).
+"""
+import threading
+import weakref
+
+from django.db import transaction
+
+
+class CommitBatch:
+    """
+    ``callback(pendientes)`` se llama una vez por colección confirmada con la
+    colección creada por ``factory`` (``list``, ``set`` o ``dict``). Una
+    transacción con savepoints puede producir varias llamadas.
+
+        batch = CommitBatch(recalcular, factory=set)
+        batch.pending().add(compra_id)
+    """
+
+    def __init__(self, callback, factory=list):
+        self.callback = callback
+        self.factory = factory
+        self._local = threading.local()
+
+    def _groups(self):
+        """Colecciones vivas del hilo: ``{(alias, savepoints): (callback, colección)}``"""
+        local = self._local
+        if not hasattr(local, 'groups'):
+            local.groups = {}
+        for key, (hook, _) in list(local.groups.items()):
+            if hook() is None:
+                # Savepoint o transacción revertidos: Django descartó el callback
+                del local.groups[key]
+        return local.groups
+
+    def pending(self, using=None):
+        """
+        Colección del savepoint en curso de ``using``. Debe llamarse dentro de
+        un bloque atómico.
+        """
+        connection = transaction.get_connection(using)
+        key = (connection.alias, tuple(sid for sid in connection.savepoint_ids if sid))
+        groups = self._groups()
+        if key not in groups:
+            pending = self.factory()
+
+            def hook():
+                if key in groups and groups[key][1] is pending:
+                    del groups[key]
+                self.callback(pending)
+
+            transaction.on_commit(hook, using=using)
+            groups[key] = (weakref.ref(hook), pending)
+        return groups[key][1]
+
+    def live(self, using=None):
+        """Colecciones pendientes de ``using`` que no se han revertido"""
+        alias = transaction.get_connection(using).alias
+        return [pending for (group_alias, _), (_, pending) in self._groups().items()
+                if group_alias == alias]
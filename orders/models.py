@@ -90,6 +90,7 @@ class Order(models.Model):
         """Genera un número de orden único basado en el tipo"""
         import datetime
         from django.db.models import Max
+        from inventory.models import DocumentSequence
         
         now = datetime.datetime.now()
         date_prefix = now.strftime('%Y%m%d')
@@ -97,18 +98,15 @@ class Order(models.Model):
         # Prefijo según el tipo de orden
         type_prefix = 'PR' if self.order_type == 'principal' else 'AU'
         
-        # Buscar el último consecutivo del día para este tipo
-        last_order = Order.objects.filter(
-            order_number__startswith=f"{type_prefix}{date_prefix}",
-            order_type=self.order_type
-        ).aggregate(max_num=Max('order_number'))
+        def last_number():
+            # Continuar después de las órdenes creadas antes del consecutivo
+            last_order = Order.objects.filter(
+                order_number__startswith=f"{type_prefix}{date_prefix}",
+                order_type=self.order_type
+            ).aggregate(max_num=Max('order_number'))
+            return int(last_order['max_num'][-4:]) if last_order['max_num'] else 0
         
-        if last_order['max_num']:
-            # Extraer el número del último consecutivo
-            last_num = int(last_order['max_num'][-4:])  # Últimos 4 dígitos
-            next_num = last_num + 1
-        else:
-            next_num = 1
+        next_num = DocumentSequence.next_value(f"ORD-{type_prefix}", date_prefix, seed=last_number)
         
         # Formato: PR202509300001 o AU202509300001
         return f"{type_prefix}{date_prefix}{next_num:04d}"
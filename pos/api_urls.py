@@ -9,4 +9,5 @@ urlpatterns = [
     path('session/close/', api_views.POSSessionCloseAPIView.as_view(), name='api_pos_session_close'),
     path('session/status/', api_views.pos_session_status, name='api_pos_session_status'),
     path('warehouses/', api_views.warehouses_list, name='api_pos_warehouses'),
+    path('scan/', api_views.scan_codes, name='api_pos_scan'),
 ]
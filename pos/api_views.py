@@ -6,9 +6,11 @@ from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Prefetch, Sum
 from .models import POSSale, POSSaleItem, POSSession
 from .serializers import POSSaleSerializer, POSSaleItemSerializer
+from .services import create_sale, SaleValidationError
+from .scanner import code_index
 from catalog.models import Product
 from inventory.models import Stock, Warehouse
 from customers.models import Customer
@@ -25,11 +27,11 @@ class POSSaleCreateAPIView(generics.CreateAPIView):
         try:
             data = request.data
             
-            # Obtener sesión activa
-            active_session = POSSession.objects.filter(
+            # Obtener sesión activa (bloqueada para actualizar sus totales)
+            active_session = POSSession.objects.select_for_update().filter(
                 user=request.user,
                 status='open'
-            ).first()
+            ).select_related('warehouse').first()
             
             if not active_session:
                 return Response(
@@ -37,89 +39,31 @@ class POSSaleCreateAPIView(generics.CreateAPIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Crear la venta
-            sale_data = {
-                'session': active_session,
-                'order_type': data.get('order_type', 'principal'),
-                'customer_id': data.get('customer_id'),
-                'payment_method': data.get('payment_method', 'cash'),
-                'notes': data.get('notes', ''),
-                'subtotal': Decimal('0.00'),
-                'iva_amount': Decimal('0.00'),
-                'discount_amount': Decimal(data.get('discount', 0)),
-                'total': Decimal('0.00')
-            }
-            
-            sale = POSSale.objects.create(**sale_data)
-            
-            # Procesar items
-            items = data.get('items', [])
-            subtotal = Decimal('0.00')
-            total_iva = Decimal('0.00')
-            
-            for item_data in items:
-                product_id = item_data.get('product_id')
-                quantity = int(item_data.get('quantity', 1))
-                unit_price = Decimal(str(item_data.get('unit_price', 0)))
-                
-                try:
-                    product = Product.objects.get(id=product_id, is_active=True)
-                except Product.DoesNotExist:
-                    continue
-                
-                # Calcular IVA según el tipo de orden
-                item_subtotal = unit_price * quantity
-                has_iva = sale.order_type == 'principal'
-                item_iva = item_subtotal * Decimal('0.19') if has_iva else Decimal('0.00')
-                item_total = item_subtotal + item_iva
-                
-                # Crear item de venta
-                sale_item = POSSaleItem.objects.create(
-                    sale=sale,
-                    product=product,
-                    quantity=quantity,
-                    unit_price=unit_price,
-                    iva_percentage=Decimal('19.00') if has_iva else Decimal('0.00'),
-                    discount_percentage=Decimal('0.00'),
-                    subtotal=item_subtotal,
-                    iva_amount=item_iva,
-                    discount_amount=Decimal('0.00'),
-                    total=item_total
+            try:
+                sale = create_sale(
+                    active_session,
+                    data.get('items', []),
+                    order_type=data.get('order_type', 'principal'),
+                    customer_id=data.get('customer_id'),
+                    payment_method=data.get('payment_method', 'cash'),
+                    notes=data.get('notes', ''),
+                    discount=Decimal(str(data.get('discount', 0))),
+                )
+            except SaleValidationError as e:
+                return Response(
+                    {'error': e.message, 'failed_items': e.failed_items},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                
-                subtotal += item_subtotal
-                total_iva += item_iva
-                
-                # Actualizar stock
-                try:
-                    stock = Stock.objects.get(product=product, warehouse=active_session.warehouse)
-                    if stock.quantity >= quantity:
-                        stock.quantity -= quantity
-                        stock.save()
-                    else:
-                        return Response(
-                            {'error': f'Stock insuficiente para {product.name}'}, 
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                except Stock.DoesNotExist:
-                    return Response(
-                        {'error': f'Producto {product.name} no disponible en la bodega'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            # Actualizar totales de la venta
-            discount_amount = Decimal(data.get('discount', 0))
-            sale.subtotal = subtotal
-            sale.iva_amount = total_iva
-            sale.discount_amount = discount_amount
-            sale.total = subtotal + total_iva - discount_amount
-            sale.save()
-            
-            # Actualizar estadísticas de la sesión
-            active_session.total_sales += sale.total
-            active_session.total_transactions += 1
-            active_session.save()
             
+            # Releer la venta con sus relaciones para serializarla sin N+1
+            sale = POSSale.objects.select_related('customer__user').prefetch_related(
+                Prefetch(
+                    'items',
+                    queryset=POSSaleItem.objects.select_related(
+                        'product__category', 'product__brand', 'product__stock_summary'
+                    ).prefetch_related('product__images'),
+                )
+            ).get(pk=sale.pk)
             serializer = self.get_serializer(sale)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
@@ -431,3 +375,50 @@ def warehouses_list(request):
         return Response({
             'error': f'Error al obtener bodegas: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+MAX_SCAN_CODES = 200
+
+
+@api_view(['POST'])
+def scan_codes(request):
+    """
+    Resuelve en lote los códigos (barras o SKU) que un escáner acumuló.
+    Recibe ``codes`` y opcionalmente ``warehouse_id``; el stock es el de esa
+    bodega o el de la bodega principal.
+    """
+    codes = request.data.get('codes')
+    if not isinstance(codes, list) or not codes:
+        return Response({'error': 'Se requiere una lista de códigos'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(codes) > MAX_SCAN_CODES:
+        return Response(
+            {'error': f'Máximo {MAX_SCAN_CODES} códigos por solicitud'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    warehouse_id = request.data.get('warehouse_id')
+    try:
+        warehouse_id = int(warehouse_id) if warehouse_id else None
+    except (TypeError, ValueError):
+        return Response({'error': 'Bodega inválida'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = []
+    for code, product in zip(codes, code_index.resolve_many(codes, warehouse_id)):
+        if product is None:
+            results.append({'code': code, 'found': False})
+            continue
+        results.append({
+            'code': code,
+            'found': True,
+            'product': {
+                'id': product['id'],
+                'name': product['name'],
+                'sku': product['sku'],
+                'barcode': product['barcode'],
+                'price': float(product['price']),
+                'iva_percentage': float(product['iva_percentage']),
+                'stock': product['stock'],
+                'available': product['stock'] > 0,
+            },
+        })
+    return Response({'results': results})
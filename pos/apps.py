@@ -5,5 +5,6 @@ class PosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pos'
 
-
-
+    def ready(self):
+        # Importar señales cuando la app esté lista
+        import pos.signals
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0003_possession_notes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='possession',
+            name='number_blocks',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Bloques de numeración'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 import uuid
@@ -21,6 +22,7 @@ class POSSession(models.Model):
     opened_at = models.DateTimeField(auto_now_add=True, verbose_name="Abierta en")
     closed_at = models.DateTimeField(blank=True, null=True, verbose_name="Cerrada en")
     notes = models.TextField(blank=True, null=True, verbose_name="Notas")
+    number_blocks = models.JSONField(default=dict, blank=True, verbose_name="Bloques de numeración")
 
     class Meta:
         verbose_name = "Sesión POS"
@@ -41,6 +43,37 @@ class POSSession(models.Model):
         now = datetime.datetime.now()
         return f"POS{now.strftime('%Y%m%d%H%M%S')}{str(uuid.uuid4())[:6].upper()}"
 
+    def take_number(self, prefix, period, seed=None):
+        """
+        Toma el siguiente número de documento para la sesión.
+
+        Con ``POS_NUMBER_BLOCK_SIZE`` mayor a 1 la sesión reserva un bloque de
+        números del consecutivo y los va entregando, de modo que las cajas no
+        compiten por la fila del consecutivo en cada venta. Los números que
+        queden sin usar al cerrar la sesión se pierden.
+        """
+        from inventory.models import DocumentSequence
+
+        block_size = getattr(settings, 'POS_NUMBER_BLOCK_SIZE', 1)
+        if block_size <= 1 or not self.pk:
+            return DocumentSequence.next_value(prefix, period, seed=seed)
+
+        key = f"{prefix}:{period}"
+        with transaction.atomic():
+            blocks = POSSession.objects.select_for_update().values_list(
+                'number_blocks', flat=True
+            ).get(pk=self.pk)
+            # Los bloques de periodos anteriores ya no sirven
+            blocks = {k: v for k, v in blocks.items() if k.endswith(f":{period}")}
+            next_value, last_value = blocks.get(key, (1, 0))
+            if next_value > last_value:
+                last_value = DocumentSequence.allocate(prefix, period, count=block_size, seed=seed)
+                next_value = last_value - block_size + 1
+            blocks[key] = [next_value + 1, last_value]
+            POSSession.objects.filter(pk=self.pk).update(number_blocks=blocks)
+        self.number_blocks = blocks
+        return next_value
+
     @property
     def cash_difference(self):
         """Diferencia entre el efectivo final y el esperado"""
@@ -145,18 +178,15 @@ class POSSale(models.Model):
         # Prefijo según el tipo de orden
         type_prefix = 'PR' if self.order_type == 'principal' else 'AU'
         
-        # Buscar el último consecutivo del día para este tipo
-        last_sale = POSSale.objects.filter(
-            sale_number__startswith=f"{type_prefix}{date_prefix}",
-            order_type=self.order_type
-        ).aggregate(max_num=Max('sale_number'))
+        def last_number():
+            # Continuar después de las ventas creadas antes del consecutivo
+            last_sale = POSSale.objects.filter(
+                sale_number__startswith=f"{type_prefix}{date_prefix}",
+                order_type=self.order_type
+            ).aggregate(max_num=Max('sale_number'))
+            return int(last_sale['max_num'][-4:]) if last_sale['max_num'] else 0
         
-        if last_sale['max_num']:
-            # Extraer el número del último consecutivo
-            last_num = int(last_sale['max_num'][-4:])  # Últimos 4 dígitos
-            next_num = last_num + 1
-        else:
-            next_num = 1
+        next_num = self.session.take_number(f"POS-{type_prefix}", date_prefix, seed=last_number)
         
         # Formato: PR202509300001 o AU202509300001
         return f"{type_prefix}{date_prefix}{next_num:04d}"
@@ -0,0 +1,189 @@
+"""
+Resolución de códigos de barras y SKU para el POS.
+
+Los datos de los productos activos (código -> id, nombre, precio, IVA) se
+guardan en un diccionario en memoria del proceso, de modo que resolver un
+código no consulta la base de datos. El diccionario se carga completo la
+primera vez que se usa y se vuelve a cargar cuando cambia un producto o una
+bodega: los cambios incrementan una versión en la caché compartida, que cada
+proceso revisa como máximo cada ``POS_CODE_INDEX_CHECK_SECONDS`` segundos.
+
+El stock por bodega cambia con cada venta, así que no se guarda en el
+diccionario sino en la caché compartida, una entrada por producto. La clave
+de la entrada lleva una versión por producto que se cambia al confirmar la
+transacción que modificó el stock (señal ``stock_changed``); los productos
+que falten se vuelven a leer en una sola consulta. Un proceso que leyó el
+stock antes de una invalidación lo guarda con la versión anterior, que ya
+nadie consulta, en lugar de pisar la caché con datos viejos.
+
+Si un código de barras se repite, gana el producto de menor id; un código
+de barras tiene prioridad sobre un SKU igual de otro producto.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'pos:code_index:version'
+STOCK_KEY = 'pos:code_index:stock:{}:{}'
+STOCK_VERSION_KEY = 'pos:code_index:stock_version:{}'
+
+DEFAULT_CHECK_SECONDS = 1.0
+DEFAULT_STOCK_TIMEOUT = 300
+
+
+def normalize_code(code):
+    """Código sin espacios y en mayúsculas, igual que se guarda el SKU"""
+    return ''.join(str(code or '').split()).upper()
+
+
+def get_check_seconds():
+    return getattr(settings, 'POS_CODE_INDEX_CHECK_SECONDS', DEFAULT_CHECK_SECONDS)
+
+
+class ProductCodeIndex:
+    """Índice en memoria ``código -> producto`` con stock en la caché compartida"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = {}
+        self._products = {}
+        self._main_warehouses = ()
+        self._version = None
+        self._checked_at = None
+
+    def _shared_version(self):
+        return cache.get_or_set(VERSION_KEY, 0, None)
+
+    def warm(self):
+        """Carga todos los productos activos (dos consultas)"""
+        from catalog.models import Product
+        from inventory.models import Warehouse
+
+        with self._lock:
+            version = self._shared_version()
+            products = {}
+            codes = {}
+            rows = Product.objects.filter(is_active=True).order_by('-pk').values_list(
+                'pk', 'name', 'sku', 'barcode', 'price', 'iva_percentage'
+            )
+            # Se recorren de mayor a menor id y primero los SKU, para que el
+            # menor id y los códigos de barras sobrescriban
+            barcodes = []
+            for pk, name, sku, barcode, price, iva_percentage in rows:
+                products[pk] = {
+                    'id': pk,
+                    'name': name,
+                    'sku': sku,
+                    'barcode': barcode,
+                    'price': price,
+                    'iva_percentage': iva_percentage,
+                }
+                if sku:
+                    codes[normalize_code(sku)] = pk
+                if barcode:
+                    barcodes.append((normalize_code(barcode), pk))
+            for code, pk in barcodes:
+                codes[code] = pk
+
+            self._main_warehouses = tuple(
+                Warehouse.objects.filter(is_main=True).order_by('pk').values_list('pk', flat=True)
+            )
+            self._products = products
+            self._codes = codes
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < get_check_seconds():
+            return
+        if self._version is None or self._shared_version() != self._version:
+            self.warm()
+        else:
+            self._checked_at = now
+
+    def invalidate(self):
+        """Marca el índice como obsoleto en todos los procesos"""
+        cache.add(VERSION_KEY, 0, None)
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, None)
+        self._checked_at = None
+
+    def invalidate_stock(self, product_ids):
+        # Una versión nueva (no un incremento) para que dos invalidaciones
+        # concurrentes no terminen en la misma versión
+        cache.set_many({STOCK_VERSION_KEY.format(pk): uuid.uuid4().hex for pk in product_ids}, None)
+
+    def _stock_versions(self, product_ids):
+        """``{product_id: versión}``; crea la versión de los productos que no la tienen"""
+        keys = {STOCK_VERSION_KEY.format(pk): pk for pk in product_ids}
+        versions = {keys[key]: value for key, value in cache.get_many(keys).items()}
+        missing = [STOCK_VERSION_KEY.format(pk) for pk in product_ids if pk not in versions]
+        if missing:
+            for key in missing:
+                cache.add(key, uuid.uuid4().hex, None)
+            # Releer: otro proceso pudo crearla primero
+            versions.update({keys[key]: value for key, value in cache.get_many(missing).items()})
+        return versions
+
+    def _stock_levels(self, product_ids):
+        """``{product_id: {warehouse_id: cantidad}}`` desde la caché, completando faltantes"""
+        from inventory.models import Stock
+
+        # La versión se lee antes que el stock: si se invalida mientras tanto,
+        # lo leído se guarda con la versión anterior
+        versions = self._stock_versions(product_ids)
+        keys = {STOCK_KEY.format(pk, version): pk for pk, version in versions.items()}
+        cached = cache.get_many(keys)
+        levels = {keys[key]: value for key, value in cached.items()}
+
+        missing = [pk for pk in product_ids if pk not in levels]
+        if missing:
+            fresh = {pk: {} for pk in missing}
+            rows = Stock.objects.filter(product_id__in=missing).values_list(
+                'product_id', 'warehouse_id', 'quantity'
+            )
+            for product_id, warehouse_id, quantity in rows:
+                fresh[product_id][warehouse_id] = quantity
+            cache.set_many(
+                {STOCK_KEY.format(pk, versions[pk]): value for pk, value in fresh.items() if pk in versions},
+                getattr(settings, 'POS_STOCK_CACHE_SECONDS', DEFAULT_STOCK_TIMEOUT),
+            )
+            levels.update(fresh)
+        return levels
+
+    def resolve_many(self, codes, warehouse_id=None):
+        """
+        Resuelve varios códigos a la vez. Devuelve una entrada por código,
+        en el mismo orden, con ``None`` si el código no existe. ``stock`` es
+        el de ``warehouse_id`` o, si no se indica, el de la bodega principal.
+        """
+        self._ensure_fresh()
+        normalized = [normalize_code(code) for code in codes]
+        product_ids = [self._codes.get(code) for code in normalized]
+        levels = self._stock_levels(list({pk for pk in product_ids if pk is not None}))
+
+        warehouses = (warehouse_id,) if warehouse_id else self._main_warehouses
+        results = []
+        for product_id in product_ids:
+            if product_id is None:
+                results.append(None)
+                continue
+            stock_by_warehouse = levels.get(product_id, {})
+            entry = dict(self._products[product_id])
+            entry['stock'] = sum(stock_by_warehouse.get(pk, 0) for pk in warehouses)
+            entry['stock_by_warehouse'] = stock_by_warehouse
+            results.append(entry)
+        return results
+
+    def resolve(self, code, warehouse_id=None):
+        """Resuelve un código de barras o SKU; ``None`` si no existe"""
+        return self.resolve_many([code], warehouse_id)[0]
+
+
+code_index = ProductCodeIndex()
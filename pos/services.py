@@ -0,0 +1,219 @@
+"""
+Registro de ventas POS en lote.
+
+``create_sale`` procesa la canasta completa con un número fijo de consultas,
+sin importar cuántas líneas tenga:
+
+1. Los productos se leen con una sola consulta.
+2. Las filas de stock de la bodega de la sesión se bloquean
+   (``select_for_update``) con otra consulta, de modo que dos cajas no
+   puedan vender las mismas unidades.
+3. Las líneas se validan en memoria. Si alguna falla no se escribe nada y
+   se lanza ``SaleValidationError`` con las líneas exactas que fallaron.
+4. Los items se insertan con ``bulk_create`` y la salida de stock se
+   registra con ``inventory.ledger.post_movements`` (movimientos en lote y
+   un único ``UPDATE`` condicional).
+5. La trazabilidad de inventario de cada línea se guarda en lote con
+   ``audit.utils.create_inventory_traces``.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from audit.models import InventoryTrace
+from audit.utils import create_inventory_traces
+from catalog.models import Product
+from inventory.ledger import InsufficientStockError, post_movements
+from inventory.models import Stock, StockMovement
+from .models import POSSale, POSSaleItem
+
+IVA_PERCENTAGE = Decimal('19.00')
+
+
+class SaleValidationError(Exception):
+    """
+    La venta no se pudo registrar. ``failed_items`` contiene un diccionario
+    por línea rechazada con su índice en la canasta y el motivo.
+    """
+
+    def __init__(self, message, failed_items):
+        super().__init__(message)
+        self.message = message
+        self.failed_items = failed_items
+
+
+def _failure(index, product_id, reason, requested=None, available=None):
+    return {
+        'index': index,
+        'product_id': product_id,
+        'reason': reason,
+        'requested': requested,
+        'available': available,
+    }
+
+
+def _parse_lines(items):
+    """
+    Normaliza las líneas de la canasta. Las líneas repetidas del mismo
+    producto se agrupan (``POSSaleItem`` es único por venta y producto).
+    """
+    lines = {}
+    failed = []
+    for index, item_data in enumerate(items):
+        product_id = item_data.get('product_id')
+        try:
+            product_id = int(product_id)
+            quantity = int(item_data.get('quantity', 1))
+            unit_price = item_data.get('unit_price')
+            unit_price = Decimal(str(unit_price)) if unit_price is not None else None
+        except (TypeError, ValueError, InvalidOperation):
+            failed.append(_failure(index, product_id, 'Línea inválida'))
+            continue
+
+        if quantity <= 0:
+            failed.append(_failure(index, product_id, 'Cantidad inválida', requested=quantity))
+            continue
+
+        if product_id in lines:
+            lines[product_id]['quantity'] += quantity
+        else:
+            lines[product_id] = {
+                'index': index,
+                'quantity': quantity,
+                'unit_price': unit_price,
+            }
+    return lines, failed
+
+
+@transaction.atomic
+def create_sale(session, items, order_type='principal', customer_id=None,
+                payment_method='cash', notes='', discount=Decimal('0.00')):
+    """
+    Registra una venta POS con todas sus líneas y descuenta el stock de la
+    bodega de la sesión.
+
+    ``items`` es una lista de diccionarios con ``product_id``, ``quantity`` y
+    opcionalmente ``unit_price`` (por defecto el precio del producto).
+    Lanza ``SaleValidationError`` sin escribir nada si alguna línea falla.
+    """
+    lines, failed = _parse_lines(items)
+    if not lines and not failed:
+        raise SaleValidationError('La venta no tiene productos', [])
+
+    products = Product.objects.filter(is_active=True).in_bulk(list(lines))
+    stocks = {
+        stock.product_id: stock
+        for stock in Stock.objects.select_for_update().filter(
+            warehouse=session.warehouse, product_id__in=list(lines)
+        )
+    }
+
+    for product_id, line in lines.items():
+        product = products.get(product_id)
+        if product is None:
+            failed.append(_failure(line['index'], product_id, 'Producto no encontrado o inactivo'))
+            continue
+        stock = stocks.get(product_id)
+        if stock is None:
+            failed.append(_failure(
+                line['index'], product_id, f'Producto {product.name} no disponible en la bodega',
+                requested=line['quantity'], available=0,
+            ))
+        elif stock.quantity < line['quantity']:
+            failed.append(_failure(
+                line['index'], product_id, f'Stock insuficiente para {product.name}',
+                requested=line['quantity'], available=stock.quantity,
+            ))
+
+    if failed:
+        failed.sort(key=lambda failure: failure['index'])
+        raise SaleValidationError(failed[0]['reason'], failed)
+
+    # Calcular IVA según el tipo de orden
+    has_iva = order_type == 'principal'
+    iva_percentage = IVA_PERCENTAGE if has_iva else Decimal('0.00')
+    sale_items = []
+    subtotal = Decimal('0.00')
+    total_iva = Decimal('0.00')
+    for product_id, line in lines.items():
+        product = products[product_id]
+        unit_price = line['unit_price'] if line['unit_price'] is not None else product.price
+        item_subtotal = unit_price * line['quantity']
+        item_iva = item_subtotal * iva_percentage / 100
+        sale_items.append(POSSaleItem(
+            product=product,
+            quantity=line['quantity'],
+            unit_price=unit_price,
+            iva_percentage=iva_percentage,
+            discount_percentage=Decimal('0.00'),
+            subtotal=item_subtotal,
+            iva_amount=item_iva,
+            discount_amount=Decimal('0.00'),
+            total=item_subtotal + item_iva,
+        ))
+        subtotal += item_subtotal
+        total_iva += item_iva
+
+    sale = POSSale.objects.create(
+        session=session,
+        order_type=order_type,
+        customer_id=customer_id,
+        payment_method=payment_method,
+        notes=notes,
+        subtotal=subtotal,
+        iva_amount=total_iva,
+        discount_amount=discount,
+        total=subtotal + total_iva - discount,
+    )
+    for sale_item in sale_items:
+        sale_item.sale = sale
+    POSSaleItem.objects.bulk_create(sale_items)
+
+    try:
+        post_movements([
+            StockMovement(
+                product=products[product_id],
+                warehouse=session.warehouse,
+                movement_type='out',
+                quantity=-line['quantity'],
+                reference=f'Venta POS {sale.sale_number}',
+                user=session.user,
+            )
+            for product_id, line in lines.items()
+        ])
+    except InsufficientStockError as e:
+        # Con las filas bloqueadas no debería ocurrir
+        raise SaleValidationError('No se pudo descontar el stock', [
+            _failure(
+                lines[failure['product_id']]['index'], failure['product_id'], 'Stock modificado durante la venta',
+                requested=failure['requested'], available=failure['available'],
+            )
+            for failure in e.failed_items
+        ])
+
+    # Trazabilidad de la salida con el stock de las filas bloqueadas
+    customer_name = sale.customer.name if sale.customer_id else 'Sin cliente'
+    create_inventory_traces([
+        InventoryTrace(
+            movement_type='SALE',
+            product=sale_item.product,
+            warehouse=session.warehouse,
+            quantity=-sale_item.quantity,
+            unit_cost=sale_item.product.cost_price,
+            total_cost=sale_item.quantity * sale_item.product.cost_price,
+            stock_before=stocks[sale_item.product_id].quantity,
+            stock_after=stocks[sale_item.product_id].quantity - sale_item.quantity,
+            pos_sale=sale,
+            pos_sale_item=sale_item,
+            user=session.user,
+            notes=f"Venta POS #{sale.id} - Cliente: {customer_name}",
+        )
+        for sale_item in sale_items
+    ])
+
+    # Actualizar estadísticas de la sesión
+    session.total_sales += sale.total
+    session.total_transactions += 1
+    session.save()
+
+    return sale
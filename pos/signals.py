@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from catalog.models import Product
+from inventory.models import Warehouse, stock_changed
+from .scanner import code_index
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def invalidate_code_index(sender, **kwargs):
+    """
+    Los cambios de productos y bodegas recargan el índice de códigos del POS
+    """
+    transaction.on_commit(code_index.invalidate)
+
+
+@receiver(stock_changed)
+def invalidate_scanner_stock(sender, product_ids, **kwargs):
+    """
+    El stock cacheado para el escáner se descarta al confirmar el cambio
+    """
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: code_index.invalidate_stock(product_ids))
@@ -5,12 +5,15 @@ from django.contrib import messages
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, View
 from django.urls import reverse_lazy
 from django.http import JsonResponse
+from django.db import transaction
 from django.db.models import Q, Sum, Count
 from django.utils import timezone
 from .models import POSSession, POSSale, POSSaleItem
 from .forms import POSSaleForm, POSSaleItemForm
+from .scanner import code_index
 from catalog.models import Product
-from inventory.models import Warehouse, Stock
+from inventory.ledger import InsufficientStockError, post_movements
+from inventory.models import Warehouse, Stock, StockMovement
 from customers.models import Customer
 import json
 
@@ -240,39 +243,32 @@ class BarcodeScanView(LoginRequiredMixin, View):
         if not barcode:
             return JsonResponse({'error': 'Código de barras requerido'}, status=400)
         
-        try:
-            product = Product.objects.get(barcode=barcode, is_active=True)
-            
-            # Verificar stock
-            stock = Stock.objects.filter(
-                product=product,
-                warehouse__is_main=True
-            ).first()
-            
-            if not stock or stock.quantity <= 0:
-                return JsonResponse({
-                    'error': 'Producto sin stock',
-                    'product': {
-                        'id': product.id,
-                        'name': product.name,
-                        'price': float(product.price),
-                        'available': False
-                    }
-                })
-            
+        # Resolución en memoria, sin consultar productos ni stock por escaneo
+        product = code_index.resolve(barcode)
+        if product is None:
+            return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+        
+        if product['stock'] <= 0:
             return JsonResponse({
-                'success': True,
+                'error': 'Producto sin stock',
                 'product': {
-                    'id': product.id,
-                    'name': product.name,
-                    'price': float(product.price),
-                    'available': True,
-                    'stock': stock.quantity
+                    'id': product['id'],
+                    'name': product['name'],
+                    'price': float(product['price']),
+                    'available': False
                 }
             })
-            
-        except Product.DoesNotExist:
-            return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+        
+        return JsonResponse({
+            'success': True,
+            'product': {
+                'id': product['id'],
+                'name': product['name'],
+                'price': float(product['price']),
+                'available': True,
+                'stock': product['stock']
+            }
+        })
 
 
 class QuickSaleView(LoginRequiredMixin, View):
@@ -332,38 +328,35 @@ class QuickSaleView(LoginRequiredMixin, View):
             if not stock or stock.quantity < quantity:
                 return JsonResponse({'error': 'Stock insuficiente'}, status=400)
             
-            # Crear venta rápida
-            sale = POSSale.objects.create(
-                session=active_session,
-                payment_method='cash',
-                subtotal=product.price * quantity,
-                iva_amount=(product.price * quantity) * (product.iva_percentage / 100),
-                total=(product.price * quantity) * (1 + product.iva_percentage / 100)
-            )
-            
-            # Crear item de venta
-            POSSaleItem.objects.create(
-                sale=sale,
-                product=product,
-                quantity=quantity,
-                unit_price=product.price,
-                iva_percentage=product.iva_percentage
-            )
-            
-            # Actualizar stock
-            stock.quantity -= quantity
-            stock.save()
-            
-            # Crear movimiento de stock
-            from inventory.models import StockMovement
-            StockMovement.objects.create(
-                product=product,
-                warehouse=active_session.warehouse,
-                movement_type='out',
-                quantity=-quantity,
-                reference=f'Venta POS {sale.sale_number}',
-                user=request.user
-            )
+            with transaction.atomic():
+                # Crear venta rápida
+                sale = POSSale.objects.create(
+                    session=active_session,
+                    payment_method='cash',
+                    subtotal=product.price * quantity,
+                    iva_amount=(product.price * quantity) * (product.iva_percentage / 100),
+                    total=(product.price * quantity) * (1 + product.iva_percentage / 100)
+                )
+                
+                # Crear item de venta
+                POSSaleItem.objects.create(
+                    sale=sale,
+                    product=product,
+                    quantity=quantity,
+                    unit_price=product.price,
+                    iva_percentage=product.iva_percentage
+                )
+                
+                # Descontar el stock; si otra caja vendió las unidades se
+                # revierte la venta
+                post_movements([StockMovement(
+                    product=product,
+                    warehouse=active_session.warehouse,
+                    movement_type='out',
+                    quantity=-quantity,
+                    reference=f'Venta POS {sale.sale_number}',
+                    user=request.user
+                )])
             
             return JsonResponse({
                 'success': True,
@@ -376,6 +369,8 @@ class QuickSaleView(LoginRequiredMixin, View):
             
         except Product.DoesNotExist:
             return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+        except InsufficientStockError:
+            return JsonResponse({'error': 'Stock insuficiente'}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
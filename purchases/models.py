@@ -5,6 +5,8 @@ from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from decimal import Decimal
 
+from .totals import schedule_totals
+
 
 class Supplier(models.Model):
     """Proveedor de productos"""
@@ -99,23 +101,32 @@ class Purchase(models.Model):
     def generate_purchase_number(self):
         """Generar número de compra único"""
         from datetime import datetime
+        from django.db.models import Max
+        from inventory.models import DocumentSequence
         today = datetime.now()
-        year = today.year
-        month = today.month
+        period = f"{today.year}{today.month:02d}"
+        
+        def last_number():
+            # Continuar después de las compras creadas antes del consecutivo
+            last = Purchase.objects.filter(
+                purchase_number__startswith=f"COMP-{period}-"
+            ).aggregate(max_num=Max('purchase_number'))['max_num']
+            return int(last.rsplit('-', 1)[-1]) if last else 0
         
-        # Contar compras del mes actual
-        count = Purchase.objects.filter(
-            created_at__year=year,
-            created_at__month=month
-        ).count() + 1
+        count = DocumentSequence.next_value('COMP', period, seed=last_number)
         
-        return f"COMP-{year}{month:02d}-{count:04d}"
+        return f"COMP-{period}-{count:04d}"
 
     def recalculate_totals(self):
-        items = self.items.all()
-        subtotal = sum((item.subtotal for item in items), Decimal('0.00'))
-        tax_amount = sum((item.tax_amount for item in items), Decimal('0.00'))
-        discount_amount = sum((item.discount_amount for item in items), Decimal('0.00'))
+        """Recalcula los totales con una sola agregación sobre los items"""
+        totals = self.items.aggregate(
+            subtotal=models.Sum('subtotal'),
+            tax_amount=models.Sum('tax_amount'),
+            discount_amount=models.Sum('discount_amount'),
+        )
+        subtotal = totals['subtotal'] or Decimal('0.00')
+        tax_amount = totals['tax_amount'] or Decimal('0.00')
+        discount_amount = totals['discount_amount'] or Decimal('0.00')
         total = subtotal - discount_amount + tax_amount + (self.shipping_cost or Decimal('0.00'))
 
         self.subtotal = subtotal
@@ -159,6 +170,13 @@ class PurchaseItem(models.Model):
         return f"{self.product.name} - {self.quantity} unidades"
 
     def save(self, *args, **kwargs):
+        """
+        Guarda el item y programa el recálculo de la compra. Dentro de una
+        transacción ``Purchase.total`` (y subtotal e impuestos) queda
+        desactualizado hasta el commit: quien necesite leerlo en la misma
+        transacción debe guardar los items dentro de ``deferred_totals()``,
+        que recalcula al salir del bloque.
+        """
         # Calcular totales
         self.subtotal = self.unit_cost * self.quantity
         self.discount_amount = self.subtotal * (self.discount_percentage / Decimal('100'))
@@ -172,16 +190,8 @@ class PurchaseItem(models.Model):
             self.update_purchase_totals()
 
     def update_purchase_totals(self):
-        """Actualizar totales de la compra padre"""
-        purchase = self.purchase
-        items = purchase.items.all()
-        
-        purchase.subtotal = sum(item.subtotal for item in items)
-        purchase.tax_amount = sum(item.tax_amount for item in items)
-        purchase.discount_amount = sum(item.discount_amount for item in items)
-        purchase.total = purchase.subtotal - purchase.discount_amount + purchase.tax_amount + purchase.shipping_cost
-        
-        purchase.save(update_fields=['subtotal', 'tax_amount', 'discount_amount', 'total'])
+        """Programa el recálculo de los totales de la compra padre (ver ``purchases.totals``)"""
+        schedule_totals(self.purchase_id)
 
 
 class PurchaseReceipt(models.Model):
@@ -202,10 +212,6 @@ class PurchaseReceipt(models.Model):
 
 @receiver(post_delete, sender=PurchaseItem)
 def _purchaseitem_post_delete_recalculate_totals(sender, instance, **kwargs):
-    try:
-        purchase = getattr(instance, 'purchase', None)
-        if purchase and purchase.pk:
-            purchase.recalculate_totals()
-    except (Purchase.DoesNotExist, AttributeError):
-        # La compra ya fue eliminada en cascada, no hacer nada
-        pass
\ No newline at end of file
+    # Si la compra se eliminó en cascada, el recálculo no encuentra nada
+    if instance.purchase_id:
+        schedule_totals(instance.purchase_id)
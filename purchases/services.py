@@ -0,0 +1,125 @@
+"""
+Recepción de compras en lote.
+
+``receive_purchase`` registra la llegada de una compra con un número fijo de
+consultas, sin importar cuántas líneas tenga:
+
+1. La compra se bloquea (``select_for_update``) y se verifica que siga
+   pendiente, de modo que dos recepciones simultáneas no sumen dos veces.
+2. La bodega principal se resuelve una sola vez.
+3. Las líneas se leen con una consulta y el stock actual de la bodega con
+   otra, bloqueando sus filas.
+4. Las entradas se registran con ``inventory.ledger.post_movements`` y la
+   trazabilidad con ``audit.utils.create_inventory_traces``, ambas en lote.
+5. Los totales de la compra se recalculan con una sola agregación.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from audit.models import InventoryTrace
+from audit.utils import create_inventory_traces
+from inventory.ledger import post_movements
+from inventory.models import Stock, StockMovement, Warehouse
+from .models import Purchase
+
+
+class PurchaseReceiveError(Exception):
+    """La compra no se pudo recibir"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def get_receiving_warehouse():
+    """
+    Bodega principal activa, creándola si no existe. Devuelve
+    ``(bodega, creada)``.
+    """
+    warehouse = Warehouse.objects.filter(is_main=True, is_active=True).first()
+    if warehouse:
+        return warehouse, False
+    warehouse = Warehouse.objects.create(
+        name='Bodega Principal',
+        code='PRINCIPAL',
+        address='Ubicación Central',
+        city='Ciudad Principal',
+        is_main=True,
+        is_active=True
+    )
+    return warehouse, True
+
+
+@transaction.atomic
+def receive_purchase(purchase, receipt, user):
+    """
+    Recibe la compra pendiente ``purchase`` con el recibo ``receipt`` (sin
+    guardar): guarda el recibo, suma las cantidades al stock de la bodega
+    principal y marca la compra como recibida.
+
+    Devuelve ``(bodega, bodega creada, items)``. Lanza
+    ``PurchaseReceiveError`` sin escribir nada si la compra ya no está
+    pendiente.
+    """
+    locked = Purchase.objects.select_for_update().select_related('supplier').get(pk=purchase.pk)
+    if locked.status != 'pending' or hasattr(locked, 'receipt'):
+        raise PurchaseReceiveError('Solo se pueden recibir compras pendientes.')
+
+    warehouse, warehouse_created = get_receiving_warehouse()
+
+    receipt.purchase = locked
+    receipt.received_by = user
+    # La trazabilidad de la recepción se registra abajo, en lote
+    receipt._inventory_traced = True
+    receipt.save()
+
+    locked.status = 'received'
+    locked.received_date = timezone.now().date()
+    locked.save(update_fields=['status', 'received_date', 'updated_at'])
+
+    items = list(locked.items.select_related('product'))
+    stocks = dict(
+        Stock.objects.select_for_update().filter(
+            warehouse=warehouse, product_id__in=[item.product_id for item in items]
+        ).values_list('product_id', 'quantity')
+    )
+
+    reference = f'Compra #{locked.purchase_number}'
+    movements = []
+    traces = []
+    for item in items:
+        movements.append(StockMovement(
+            product=item.product,
+            warehouse=warehouse,
+            movement_type='in',
+            quantity=item.quantity,
+            reference=reference,
+            notes=f'Recepción de compra del proveedor {locked.supplier.name}',
+            user=user
+        ))
+        # Varias líneas del mismo producto se acumulan sobre el mismo stock
+        stock_before = stocks.get(item.product_id, 0)
+        stocks[item.product_id] = stock_before + item.quantity
+        traces.append(InventoryTrace(
+            movement_type='PURCHASE_RECEIPT',
+            product=item.product,
+            warehouse=warehouse,
+            quantity=item.quantity,
+            unit_cost=item.unit_cost,
+            total_cost=item.total,
+            stock_before=stock_before,
+            stock_after=stock_before + item.quantity,
+            purchase=locked,
+            purchase_item=item,
+            supplier=locked.supplier,
+            user=user,
+            notes=f"Recepción de compra #{locked.purchase_number}"
+        ))
+    post_movements(movements)
+    create_inventory_traces(traces)
+
+    locked.recalculate_totals()
+
+    purchase.status = locked.status
+    purchase.received_date = locked.received_date
+    return warehouse, warehouse_created, items
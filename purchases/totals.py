@@ -0,0 +1,82 @@
+"""
+Recálculo diferido de los totales de las compras.
+
+Guardar o eliminar un ``PurchaseItem`` no recalcula la compra en el momento:
+la marca como pendiente con ``schedule_totals`` y los totales se calculan
+después con una sola agregación por compra (``Purchase.recalculate_totals``):
+
+- Dentro de una transacción, las compras afectadas se recalculan una vez
+  cuando la transacción hace commit (``transaction.on_commit``). Si se
+  revierte, no se recalcula nada.
+- Dentro de ``deferred_totals()`` se recalculan al salir del bloque, aunque
+  este esté dentro de una transacción.
+- Fuera de cualquier transacción o bloque se recalcula de inmediato.
+
+Así, guardar un formset de N líneas cuesta N escrituras más un recálculo,
+en lugar de volver a leer todas las líneas por cada una.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from naturalmede.batching import CommitBatch
+
+_state = threading.local()
+
+
+def _get_state():
+    if not hasattr(_state, 'deferred'):
+        _state.deferred = set()   # Compras pendientes dentro de deferred_totals()
+        _state.depth = 0          # Anidamiento de deferred_totals()
+    return _state
+
+
+def recalculate(purchase_ids):
+    """Recalcula ya los totales de las compras indicadas"""
+    from .models import Purchase
+
+    for purchase in Purchase.objects.filter(pk__in=set(purchase_ids)):
+        purchase.recalculate_totals()
+
+
+# Compras pendientes de la transacción en curso
+_transaction_purchases = CommitBatch(recalculate, factory=set)
+
+
+def schedule_totals(purchase_id):
+    """Marca los totales de la compra para recalcularlos una sola vez"""
+    state = _get_state()
+    if state.depth:
+        state.deferred.add(purchase_id)
+        return
+
+    if transaction.get_connection().in_atomic_block:
+        _transaction_purchases.pending().add(purchase_id)
+        return
+
+    recalculate([purchase_id])
+
+
+@contextmanager
+def deferred_totals():
+    """
+    Recalcula una sola vez, al salir del bloque, las compras cuyos items se
+    guardaron o eliminaron dentro de él.
+
+        with deferred_totals():
+            formset.save()
+    """
+    state = _get_state()
+    state.depth += 1
+    try:
+        yield
+    except Exception:
+        state.depth -= 1
+        if state.depth == 0:
+            state.deferred.clear()
+        raise
+    state.depth -= 1
+    if state.depth == 0:
+        purchase_ids, state.deferred = state.deferred, set()
+        recalculate(purchase_ids)
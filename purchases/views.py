@@ -12,7 +12,9 @@ from decimal import Decimal
 
 from .models import Purchase, PurchaseItem, Supplier, PurchaseReceipt
 from .forms import PurchaseForm, PurchaseItemFormSet, SupplierForm, PurchaseReceiptForm
-from inventory.models import Stock, Warehouse, StockMovement
+from .services import PurchaseReceiveError, receive_purchase
+from .totals import deferred_totals, schedule_totals
+from inventory.models import Stock, Warehouse
 from catalog.models import Product, ProductImage
 
 
@@ -142,11 +144,11 @@ def purchase_create(request):
                     purchase.created_by = request.user
                     purchase.save()
                     
-                    # Guardar items
+                    # Guardar items; los totales se recalculan una vez al final
                     formset.instance = purchase
-                    formset.save()
-
-                    purchase.recalculate_totals()
+                    with deferred_totals():
+                        formset.save()
+                        schedule_totals(purchase.pk)
                     
                     print("COMPRA CREADA EXITOSAMENTE:", purchase.purchase_number)
                     messages.success(request, f'Compra #{purchase.purchase_number} creada exitosamente.')
@@ -194,10 +196,11 @@ def purchase_edit(request, pk):
         formset = PurchaseItemFormSet(request.POST, instance=purchase)
         
         if form.is_valid() and formset.is_valid():
-            purchase = form.save()
-            formset.save()
-
-            purchase.recalculate_totals()
+            # Los totales se recalculan una vez, después de guardar todos los items
+            with deferred_totals():
+                purchase = form.save()
+                formset.save()
+                schedule_totals(purchase.pk)
             
             messages.success(request, f'Compra #{purchase.purchase_number} actualizada exitosamente.')
             return redirect('purchases:purchase_detail', pk=purchase.pk)
@@ -232,60 +235,20 @@ def purchase_receive(request, pk):
         receipt_form = PurchaseReceiptForm(request.POST)
         
         if receipt_form.is_valid():
-            # Crear recibo
-            receipt = receipt_form.save(commit=False)
-            receipt.purchase = purchase
-            receipt.received_by = request.user
-            receipt.save()
-            
-            # Actualizar estado de la compra
-            purchase.status = 'received'
-            purchase.received_date = timezone.now().date()
-            purchase.save()
-            
-            # Actualizar stock en la bodega principal
-            for item in purchase.items.all():
-                try:
-                    # Obtener la bodega principal
-                    warehouse = Warehouse.objects.filter(is_main=True, is_active=True).first()
-                    if not warehouse:
-                        # Si no existe bodega principal, crear una
-                        warehouse = Warehouse.objects.create(
-                            name='Bodega Principal',
-                            code='PRINCIPAL',
-                            address='Ubicación Central',
-                            city='Ciudad Principal',
-                            is_main=True,
-                            is_active=True
-                        )
-                        messages.info(request, 'Se creó automáticamente la Bodega Principal.')
-                    
-                    # Obtener o crear stock en la bodega principal
-                    stock, created = Stock.objects.get_or_create(
-                        product=item.product,
-                        warehouse=warehouse,
-                        defaults={'quantity': 0, 'min_stock': 0}
-                    )
-                    
-                    # Actualizar cantidad
-                    stock.quantity += item.quantity
-                    stock.save()
-                    
-                    # Crear movimiento de stock para auditoría
-                    StockMovement.objects.create(
-                        product=item.product,
-                        warehouse=warehouse,
-                        movement_type='in',
-                        quantity=item.quantity,
-                        reference=f'Compra #{purchase.purchase_number}',
-                        notes=f'Recepción de compra del proveedor {purchase.supplier.name}',
-                        user=request.user
-                    )
-                    
-                    messages.success(request, f'Stock actualizado: {item.product.name} (+{item.quantity} unidades)')
-                    
-                except Exception as e:
-                    messages.error(request, f'Error actualizando stock de {item.product.name}: {str(e)}')
+            # Crear recibo, marcar la compra como recibida y sumar el stock
+            # en la bodega principal en una sola operación
+            try:
+                warehouse, warehouse_created, items = receive_purchase(
+                    purchase, receipt_form.save(commit=False), request.user
+                )
+            except PurchaseReceiveError as e:
+                messages.error(request, e.message)
+                return redirect('purchases:purchase_detail', pk=pk)
+
+            if warehouse_created:
+                messages.info(request, 'Se creó automáticamente la Bodega Principal.')
+            for item in items:
+                messages.success(request, f'Stock actualizado: {item.product.name} (+{item.quantity} unidades)')
             
             messages.success(request, f'Compra #{purchase.purchase_number} recibida exitosamente.')
             return redirect('purchases:purchase_detail', pk=pk)
@@ -526,14 +489,12 @@ def api_products_for_purchase(request):
 @require_http_methods(["GET"])
 def api_products(request):
     """API para obtener productos con información completa"""
-    products = Product.objects.select_related('category', 'brand').prefetch_related('images').all()
+    products = Product.objects.select_related('category', 'brand', 'primary_image').all()
     
     data = []
     for product in products:
         # Obtener imagen principal
-        primary_image = product.images.filter(is_primary=True).first()
-        if not primary_image:
-            primary_image = product.images.first()
+        primary_image = product.get_main_image()
         
         image_url = primary_image.image.url if primary_image else None
         
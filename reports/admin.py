@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ReportTemplate, ReportSchedule
+from .models import ReportTemplate, ReportSchedule, ReportJob, DailySalesFact, DailySalesRefresh, DailySalesTotal
 
 
 @admin.register(ReportTemplate)
@@ -24,14 +24,61 @@ class ReportScheduleAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('template', 'created_by')
 
 
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'report_type', 'status', 'row_count', 'file_size', 'duration', 'requested_by', 'created_at', 'completed_at']
+    list_filter = ['kind', 'report_type', 'status', 'created_at']
+    search_fields = ['report_type', 'params_hash', 'requested_by__username']
+    readonly_fields = [
+        'params_hash', 'artifact', 'file_size', 'row_count', 'duration', 'error_message',
+        'created_at', 'started_at', 'completed_at'
+    ]
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('requested_by', 'schedule')
 
 
+@admin.register(DailySalesFact)
+class DailySalesFactAdmin(admin.ModelAdmin):
+    list_display = ['date', 'channel', 'product', 'category', 'payment_method', 'units', 'revenue', 'iva_amount', 'cost']
+    list_filter = ['channel', 'payment_method', 'date']
+    search_fields = ['product__name', 'product__sku', 'category__name']
+    date_hierarchy = 'date'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'category')
+    
+    def has_add_permission(self, request):
+        # Se calcula automáticamente desde las ventas
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
+@admin.register(DailySalesTotal)
+class DailySalesTotalAdmin(admin.ModelAdmin):
+    list_display = ['date', 'channel', 'payment_method', 'status', 'documents', 'total', 'iva_amount', 'shipping_cost', 'discount_amount']
+    list_filter = ['channel', 'payment_method', 'status', 'date']
+    date_hierarchy = 'date'
+    
+    def has_add_permission(self, request):
+        # Se calcula automáticamente desde las ventas
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
-
-
-
-
-
+@admin.register(DailySalesRefresh)
+class DailySalesRefreshAdmin(admin.ModelAdmin):
+    list_display = ['date', 'channel', 'is_dirty', 'refreshed_at']
+    list_filter = ['channel', 'is_dirty', 'date']
+    date_hierarchy = 'date'
+    
+    def has_add_permission(self, request):
+        # Se actualiza automáticamente al recalcular los hechos
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
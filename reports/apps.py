@@ -5,5 +5,6 @@ class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
 
-
-
+    def ready(self):
+        # Importar señales cuando la app esté lista
+        import reports.signals
@@ -0,0 +1,273 @@
+"""
+Exportación de reportes a CSV y XLSX con memoria constante.
+
+Las vistas entregan un encabezado y un iterable de filas (normalmente un
+generador sobre ``queryset.values_list(...).iterator(chunk_size=...)``);
+el CSV se escribe fila a fila en un ``StreamingHttpResponse`` y el XLSX se
+arma con ``openpyxl`` en modo de solo escritura sobre un archivo temporal.
+
+Los reportes de ``REPORT_EXPORTS`` reciben sus parámetros como un
+diccionario (``request.GET`` o los parámetros de un ``ReportJob``), así que
+la misma definición sirve para la descarga directa y para los trabajos en
+segundo plano, que la escriben con ``write_artifact`` en CSV comprimido.
+"""
+import csv
+import gzip
+import tempfile
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.http import FileResponse, StreamingHttpResponse
+
+from catalog.models import Product
+from customers.models import Customer
+from inventory.models import Stock
+from orders.models import Order
+from .models import PAID_STATUSES
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class ExportFormatError(ValueError):
+    """Formato de exportación no soportado o no disponible"""
+
+
+class Echo:
+    """Pseudo-buffer: ``csv.writer`` devuelve la línea en lugar de guardarla"""
+
+    def write(self, value):
+        return value
+
+
+def choice_labels(model, field_name):
+    """Etiquetas de las opciones de un campo, para filas de ``values_list``"""
+    return dict(model._meta.get_field(field_name).flatchoices)
+
+
+def full_name(first_name, last_name):
+    """Igual que ``User.get_full_name``"""
+    return f'{first_name} {last_name}'.strip()
+
+
+def queryset_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Tuplas de ``fields`` leídas por bloques, sin caché del queryset"""
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def csv_response(filename, headers, rows):
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def xlsx_response(filename, headers, rows):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportFormatError('La exportación a XLSX requiere openpyxl')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(list(row))
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output, as_attachment=True, filename=f'{filename}.xlsx', content_type=XLSX_CONTENT_TYPE
+    )
+
+
+def write_artifact(path, headers, rows):
+    """Escribe ``rows`` como CSV comprimido con gzip y devuelve cuántas filas escribió"""
+    count = 0
+    with gzip.open(path, 'wt', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def export_response(filename, headers, rows, export_format='csv'):
+    """
+    Respuesta de descarga para ``rows`` en ``export_format`` (``csv`` o
+    ``xlsx``). ``rows`` se consume una sola vez.
+    """
+    if export_format == 'csv':
+        return csv_response(filename, headers, rows)
+    if export_format == 'xlsx':
+        return xlsx_response(filename, headers, rows)
+    raise ExportFormatError(f'Formato de exportación no soportado: {export_format}')
+
+
+def _filter_orders(params, orders):
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+
+    if start_date:
+        orders = orders.filter(created_at__date__gte=start_date)
+    if end_date:
+        orders = orders.filter(created_at__date__lte=end_date)
+    return orders
+
+
+def export_sales_report(params):
+    headers = [
+        'Número de Orden', 'Cliente', 'Estado', 'Método de Pago',
+        'Subtotal', 'IVA', 'Costo de Envío', 'Total', 'Fecha'
+    ]
+
+    orders = _filter_orders(params, Order.objects.all())
+    status_filter = params.get('status')
+    if status_filter:
+        orders = orders.filter(status=status_filter)
+
+    statuses = choice_labels(Order, 'status')
+    payment_methods = choice_labels(Order, 'payment_method')
+    rows = (
+        [
+            order_number,
+            full_name(first_name, last_name),
+            statuses.get(status, status),
+            payment_methods.get(payment_method, payment_method),
+            subtotal,
+            iva_amount,
+            shipping_cost,
+            total,
+            created_at.strftime('%Y-%m-%d %H:%M:%S')
+        ]
+        for (order_number, first_name, last_name, status, payment_method,
+             subtotal, iva_amount, shipping_cost, total, created_at) in queryset_rows(
+            orders.order_by('created_at', 'id'), (
+                'order_number', 'customer__user__first_name', 'customer__user__last_name',
+                'status', 'payment_method', 'subtotal', 'iva_amount', 'shipping_cost',
+                'total', 'created_at',
+            )
+        )
+    )
+    return 'sales_report', headers, rows
+
+
+def export_inventory_report(params):
+    headers = [
+        'Producto', 'SKU', 'Bodega', 'Cantidad', 'Stock Mínimo',
+        'Stock Máximo', 'Precio de Costo', 'Valor Total'
+    ]
+
+    stocks = Stock.objects.annotate(
+        total_value=ExpressionWrapper(
+            F('quantity') * F('product__cost_price'), output_field=DecimalField(max_digits=14, decimal_places=2)
+        )
+    ).order_by('warehouse__name', 'product__name')
+
+    rows = queryset_rows(stocks, (
+        'product__name', 'product__sku', 'warehouse__name', 'quantity', 'min_stock',
+        'max_stock', 'product__cost_price', 'total_value',
+    ))
+    return 'inventory_report', headers, rows
+
+
+def export_products_report(params):
+    headers = [
+        'Nombre', 'SKU', 'Categoría', 'Marca', 'Precio',
+        'Precio de Costo', 'IVA %', 'Stock Total', 'Valor Total'
+    ]
+
+    products = Product.objects.filter(is_active=True).with_stock_totals().annotate(
+        total_value=ExpressionWrapper(
+            F('total_stock') * F('cost_price'), output_field=DecimalField(max_digits=14, decimal_places=2)
+        )
+    ).order_by('name')
+
+    rows = queryset_rows(products, (
+        'name', 'sku', 'category__name', 'brand__name', 'price',
+        'cost_price', 'iva_percentage', 'total_stock', 'total_value',
+    ))
+    return 'products_report', headers, rows
+
+
+def export_customers_report(params):
+    headers = [
+        'Nombre', 'Email', 'Teléfono', 'Tipo', 'Ciudad',
+        'Total Órdenes', 'Total Gastado', 'Fecha Registro'
+    ]
+
+    customers = Customer.objects.filter(is_active=True).annotate(
+        total_orders=Count('orders'),
+        total_spent=Sum('orders__total', filter=Q(orders__status='delivered'))
+    ).order_by('id')
+
+    customer_types = choice_labels(Customer, 'customer_type')
+    rows = (
+        [
+            full_name(first_name, last_name),
+            email,
+            phone,
+            customer_types.get(customer_type, customer_type),
+            city,
+            total_orders,
+            total_spent or 0,
+            created_at.strftime('%Y-%m-%d')
+        ]
+        for (first_name, last_name, email, phone, customer_type, city,
+             total_orders, total_spent, created_at) in queryset_rows(customers, (
+            'user__first_name', 'user__last_name', 'user__email', 'phone', 'customer_type',
+            'city', 'total_orders', 'total_spent', 'created_at',
+        ))
+    )
+    return 'customers_report', headers, rows
+
+
+def export_financial_report(params):
+    headers = [
+        'Fecha', 'Número de Orden', 'Cliente', 'Método de Pago',
+        'Subtotal', 'IVA', 'Costo de Envío', 'Total'
+    ]
+
+    orders = _filter_orders(params, Order.objects.filter(status__in=PAID_STATUSES))
+
+    payment_methods = choice_labels(Order, 'payment_method')
+    rows = (
+        [
+            created_at.strftime('%Y-%m-%d'),
+            order_number,
+            full_name(first_name, last_name),
+            payment_methods.get(payment_method, payment_method),
+            subtotal,
+            iva_amount,
+            shipping_cost,
+            total
+        ]
+        for (created_at, order_number, first_name, last_name, payment_method,
+             subtotal, iva_amount, shipping_cost, total) in queryset_rows(
+            orders.order_by('created_at', 'id'), (
+                'created_at', 'order_number', 'customer__user__first_name',
+                'customer__user__last_name', 'payment_method', 'subtotal', 'iva_amount',
+                'shipping_cost', 'total',
+            )
+        )
+    )
+    return 'financial_report', headers, rows
+
+
+REPORT_EXPORTS = {
+    'sales': export_sales_report,
+    'inventory': export_inventory_report,
+    'products': export_products_report,
+    'customers': export_customers_report,
+    'financial': export_financial_report,
+}
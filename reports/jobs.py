@@ -0,0 +1,250 @@
+"""
+Ejecución de reportes en segundo plano.
+
+``submit`` encola un ``ReportJob`` (o devuelve uno reciente con los mismos
+parámetros, cuyo archivo se reutiliza) y ``manage.py report_worker`` lo
+ejecuta con ``run_pending``. El worker también encola las programaciones
+(``ReportSchedule``) vencidas y calcula su siguiente ejecución.
+
+Los trabajos se toman con un ``UPDATE`` condicional sobre el estado, así
+que varios workers pueden compartir la cola sin ejecutar dos veces el mismo
+trabajo. Un trabajo que quede en ``running`` porque el worker se detuvo no
+se reintenta solo.
+"""
+import calendar
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db.models import Q
+from django.utils import timezone
+
+from .exports import REPORT_EXPORTS, write_artifact
+from .models import ReportJob, ReportSchedule
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SECONDS = 900
+
+ARTIFACT_DIR = 'report_jobs'
+
+FREQUENCY_MONTHS = {
+    'monthly': 1,
+    'quarterly': 3,
+    'yearly': 12,
+}
+
+
+def get_cache_seconds():
+    return getattr(settings, 'REPORT_JOB_CACHE_SECONDS', DEFAULT_CACHE_SECONDS)
+
+
+def add_months(moment, months):
+    month = moment.month - 1 + months
+    year = moment.year + month // 12
+    month = month % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+
+def next_run_after(frequency, moment):
+    """Siguiente ejecución de una programación después de ``moment``"""
+    if frequency == 'daily':
+        return moment + timedelta(days=1)
+    if frequency == 'weekly':
+        return moment + timedelta(days=7)
+    return add_months(moment, FREQUENCY_MONTHS[frequency])
+
+
+def find_cached(kind, report_type, params_hash):
+    """Trabajo completado reciente con los mismos parámetros y archivo aún presente"""
+    since = timezone.now() - timedelta(seconds=get_cache_seconds())
+    job = ReportJob.objects.filter(
+        kind=kind, report_type=report_type, params_hash=params_hash,
+        status='completed', completed_at__gte=since,
+    ).exclude(artifact='').order_by('-completed_at').first()
+    if job is not None and job.artifact.storage.exists(job.artifact.name):
+        return job
+    return None
+
+
+def submit(kind, report_type, parameters, requested_by=None, audit_report=None,
+           schedule=None, use_cache=True):
+    """
+    Encola un reporte. Si hay un archivo reciente con los mismos parámetros
+    se devuelve ese trabajo ya completado; si el mismo reporte está en cola
+    se devuelve el trabajo pendiente.
+    """
+    parameters = ReportJob.clean_parameters(parameters)
+    params_hash = ReportJob.compute_hash(kind, report_type, parameters)
+
+    if use_cache:
+        cached = find_cached(kind, report_type, params_hash)
+        if cached is not None:
+            if audit_report is not None:
+                finish_audit_report(cached, audit_report)
+            return cached
+
+        if audit_report is None and schedule is None:
+            queued = ReportJob.objects.filter(
+                kind=kind, report_type=report_type, params_hash=params_hash,
+                status__in=['pending', 'running'], audit_report__isnull=True,
+            ).order_by('created_at').first()
+            if queued is not None:
+                return queued
+
+    return ReportJob.objects.create(
+        kind=kind,
+        report_type=report_type,
+        parameters=parameters,
+        params_hash=params_hash,
+        requested_by=requested_by,
+        audit_report=audit_report,
+        schedule=schedule,
+    )
+
+
+def build_rows(job):
+    """Encabezado y filas del reporte de un trabajo"""
+    if job.kind == 'audit':
+        from audit.utils import audit_report_rows
+
+        return audit_report_rows(job.parameters)
+
+    if job.report_type not in REPORT_EXPORTS:
+        raise ValueError(f'Tipo de reporte no válido: {job.report_type}')
+    _, headers, rows = REPORT_EXPORTS[job.report_type](job.parameters)
+    return headers, rows
+
+
+def finish_audit_report(job, report):
+    """Refleja el resultado de un trabajo en su ``AuditReport``"""
+    if job.status == 'completed':
+        report.status = 'COMPLETED'
+        report.file_path = job.artifact.path
+        report.file_size = job.file_size
+        report.error_message = None
+    else:
+        report.status = 'FAILED'
+        report.error_message = job.error_message
+    report.completed_at = job.completed_at
+    report.save(update_fields=['status', 'file_path', 'file_size', 'error_message', 'completed_at'])
+
+
+def send_schedule_email(job):
+    schedule = job.schedule
+    recipients = [
+        email.strip() for email in schedule.email_recipients.replace('\n', ',').split(',')
+        if email.strip()
+    ]
+    if not recipients:
+        return
+
+    message = EmailMessage(
+        subject=f'Reporte programado: {schedule.name}',
+        body=(
+            f'Se adjunta el reporte "{schedule.template.name}" generado el '
+            f'{timezone.localtime(job.completed_at).strftime("%Y-%m-%d %H:%M")} '
+            f'({job.row_count} filas).'
+        ),
+        to=recipients,
+    )
+    message.attach_file(job.artifact.path, 'application/gzip')
+    message.send()
+
+
+def run_job(job):
+    """
+    Ejecuta un trabajo pendiente. Devuelve ``False`` si otro worker ya lo
+    había tomado.
+    """
+    started_at = timezone.now()
+    claimed = ReportJob.objects.filter(pk=job.pk, status='pending').update(
+        status='running', started_at=started_at
+    )
+    if not claimed:
+        return False
+    job.status, job.started_at = 'running', started_at
+
+    if job.audit_report_id:
+        job.audit_report.status = 'GENERATING'
+        job.audit_report.save(update_fields=['status'])
+
+    started = time.monotonic()
+    try:
+        headers, rows = build_rows(job)
+
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, ARTIFACT_DIR), exist_ok=True)
+        name = f'{ARTIFACT_DIR}/{job.kind}_{job.report_type}_{job.pk}_{job.params_hash[:12]}.csv.gz'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        job.row_count = write_artifact(path, headers, rows)
+        job.artifact.name = name
+        job.file_size = os.path.getsize(path)
+        job.status = 'completed'
+        job.completed_at = timezone.now()
+
+        if job.schedule_id:
+            send_schedule_email(job)
+    except Exception as e:
+        logger.exception('Error generando el reporte del trabajo %s', job.pk)
+        job.status = 'failed'
+        job.error_message = str(e)
+        job.completed_at = timezone.now()
+
+    job.duration = time.monotonic() - started
+    job.save()
+
+    if job.audit_report_id:
+        finish_audit_report(job, job.audit_report)
+    return True
+
+
+def run_pending(limit=None):
+    """Ejecuta los trabajos pendientes en orden de llegada; devuelve cuántos ejecutó"""
+    processed = 0
+    while limit is None or processed < limit:
+        job = ReportJob.objects.filter(status='pending').select_related(
+            'schedule__template', 'audit_report'
+        ).order_by('created_at', 'pk').first()
+        if job is None:
+            break
+        if run_job(job):
+            processed += 1
+    return processed
+
+
+def enqueue_due_schedules(now=None):
+    """Encola las programaciones vencidas y avanza su siguiente ejecución"""
+    now = now or timezone.now()
+    due = ReportSchedule.objects.filter(
+        Q(next_run__isnull=True) | Q(next_run__lte=now),
+        is_active=True,
+        template__is_active=True,
+    ).select_related('template')
+
+    jobs = []
+    for schedule in due:
+        next_run = schedule.next_run or now
+        while next_run <= now:
+            next_run = next_run_after(schedule.frequency, next_run)
+
+        # Solo un worker avanza la programación y encola su trabajo
+        claimed = ReportSchedule.objects.filter(
+            pk=schedule.pk, next_run=schedule.next_run
+        ).update(last_run=now, next_run=next_run)
+        if not claimed:
+            continue
+
+        parameters = schedule.template.template_data
+        jobs.append(submit(
+            'report',
+            schedule.template.report_type,
+            parameters if isinstance(parameters, dict) else {},
+            requested_by=schedule.created_by,
+            schedule=schedule,
+            use_cache=False,
+        ))
+    return jobs
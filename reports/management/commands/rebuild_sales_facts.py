@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import TruncDate
+
+from orders.models import Order
+from pos.models import POSSale
+from reports.models import DailySalesFact, DailySalesRefresh, DailySalesTotal
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los hechos de ventas diarias (DailySalesFact) desde las órdenes y ventas POS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='Fecha inicial (YYYY-MM-DD); por defecto la primera venta',
+        )
+        parser.add_argument(
+            '--end',
+            help='Fecha final (YYYY-MM-DD); por defecto la última venta',
+        )
+        parser.add_argument(
+            '--dirty',
+            action='store_true',
+            help='Recalcula solo los días cuyo recálculo automático falló',
+        )
+
+    def parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {value} (formato YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start = self.parse_date(options['start']) if options['start'] else None
+        end = self.parse_date(options['end']) if options['end'] else None
+
+        if options['dirty']:
+            pending = DailySalesRefresh.objects.filter(is_dirty=True)
+            if start:
+                pending = pending.filter(date__gte=start)
+            if end:
+                pending = pending.filter(date__lte=end)
+            pending = list(pending.order_by('date', 'channel').values_list('channel', 'date'))
+            for channel, day in pending:
+                DailySalesFact.refresh(channel, day)
+            self.stdout.write(self.style.SUCCESS(f'✓ Días pendientes recalculados ({len(pending)})'))
+            return
+
+        sources = [('web', Order.objects.all()), ('pos', POSSale.objects.all())]
+        refreshed = 0
+        for channel, queryset in sources:
+            if start:
+                queryset = queryset.filter(created_at__date__gte=start)
+            if end:
+                queryset = queryset.filter(created_at__date__lte=end)
+            days = queryset.annotate(day=TruncDate('created_at')).order_by('day').values_list('day', flat=True).distinct()
+
+            # Días sin ventas que aún tengan hechos (ventas eliminadas)
+            days = set(days)
+            for model in (DailySalesFact, DailySalesTotal):
+                stale = model.objects.filter(channel=channel)
+                if start:
+                    stale = stale.filter(date__gte=start)
+                if end:
+                    stale = stale.filter(date__lte=end)
+                days.update(stale.order_by().values_list('date', flat=True).distinct())
+            days = sorted(days)
+
+            for day in days:
+                DailySalesFact.refresh(channel, day)
+            refreshed += len(days)
+            self.stdout.write(f'{channel}: {len(days)} días recalculados')
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Hechos de ventas recalculados ({refreshed} días)'))
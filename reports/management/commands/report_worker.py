@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from reports import jobs
+from reports.models import ReportJob
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los trabajos de reportes en cola y las programaciones vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Segundos de espera cuando la cola está vacía (por defecto 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Ejecutar los trabajos pendientes una vez y terminar',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Mostrar los trabajos por estado y terminar',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.show_stats()
+            return
+
+        total = 0
+        try:
+            while True:
+                scheduled = jobs.enqueue_due_schedules()
+                if scheduled:
+                    self.stdout.write(f'{len(scheduled)} reportes programados encolados')
+
+                processed = jobs.run_pending()
+                total += processed
+                if processed:
+                    self.stdout.write(self.style.SUCCESS(f'✓ {processed} trabajos ejecutados'))
+
+                if options['once']:
+                    break
+                if not processed:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('\nDetenido por el usuario')
+
+        self.stdout.write(f'Total: {total} trabajos ejecutados')
+
+    def show_stats(self):
+        counts = dict(
+            ReportJob.objects.order_by().values_list('status').annotate(count=Count('id'))
+        )
+        self.stdout.write('--- Trabajos de Reportes ---')
+        for status, label in ReportJob.STATUS_CHOICES:
+            self.stdout.write(f'{label}: {counts.get(status, 0)}')
@@ -0,0 +1,136 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+# Copia de reports.models.PAID_STATUSES al crear la migración
+PAID_STATUSES = ['paid', 'shipped', 'delivered']
+
+
+def populate_sales_facts(apps, schema_editor):
+    """
+    Carga los hechos de todo el historial con la misma agregación que
+    ``rebuild_sales_facts`` (``DailySalesFact.aggregate``), agrupando por día
+    """
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    POSSale = apps.get_model('pos', 'POSSale')
+    POSSaleItem = apps.get_model('pos', 'POSSaleItem')
+    DailySalesFact = apps.get_model('reports', 'DailySalesFact')
+    DailySalesTotal = apps.get_model('reports', 'DailySalesTotal')
+
+    cost = ExpressionWrapper(
+        F('quantity') * F('product__cost_price'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    sources = [
+        ('web', 'order__', OrderItem.objects.filter(order__status__in=PAID_STATUSES),
+         Order.objects.values('payment_method', 'status', day=TruncDate('created_at')),
+         {'shipping': Sum('shipping_cost')}),
+        ('pos', 'sale__', POSSaleItem.objects.all(),
+         POSSale.objects.values('payment_method', day=TruncDate('created_at')),
+         {'discount': Sum('discount_amount')}),
+    ]
+    for channel, prefix, items, documents, extra in sources:
+        items = items.values(
+            'product_id', 'product__category_id',
+            payment_method=F(prefix + 'payment_method'), day=TruncDate(prefix + 'created_at'),
+        ).order_by().annotate(
+            total_units=Sum('quantity'),
+            total_revenue=Sum('total'),
+            total_iva=Sum('iva_amount'),
+            total_cost=Sum(cost),
+        )
+        documents = documents.order_by().annotate(
+            count=Count('id'),
+            total_amount=Sum('total'),
+            total_iva=Sum('iva_amount'),
+            **extra,
+        )
+        DailySalesFact.objects.bulk_create([
+            DailySalesFact(
+                date=row['day'],
+                channel=channel,
+                product_id=row['product_id'],
+                category_id=row['product__category_id'],
+                payment_method=row['payment_method'],
+                units=row['total_units'] or 0,
+                revenue=row['total_revenue'] or 0,
+                iva_amount=row['total_iva'] or 0,
+                cost=row['total_cost'] or 0,
+            )
+            for row in items
+        ], batch_size=1000)
+        DailySalesTotal.objects.bulk_create([
+            DailySalesTotal(
+                date=row['day'],
+                channel=channel,
+                payment_method=row['payment_method'],
+                # Las ventas POS siempre están pagadas
+                status=row.get('status', 'paid'),
+                documents=row['count'],
+                total=row['total_amount'] or 0,
+                iva_amount=row['total_iva'] or 0,
+                shipping_cost=row.get('shipping') or 0,
+                discount_amount=row.get('discount') or 0,
+            )
+            for row in documents
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+        ('orders', '0001_initial'),
+        ('pos', '0001_initial'),
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('channel', models.CharField(choices=[('web', 'Web'), ('pos', 'POS')], max_length=10, verbose_name='Canal')),
+                ('payment_method', models.CharField(max_length=20, verbose_name='Método de pago')),
+                ('status', models.CharField(max_length=20, verbose_name='Estado')),
+                ('documents', models.PositiveIntegerField(default=0, verbose_name='Documentos')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total')),
+                ('iva_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='IVA')),
+                ('shipping_cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Envío')),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Descuento')),
+            ],
+            options={
+                'verbose_name': 'Total de ventas diarias',
+                'verbose_name_plural': 'Totales de ventas diarias',
+                'indexes': [models.Index(fields=['date', 'channel'], name='reports_dai_date_531903_idx')],
+                'unique_together': {('date', 'channel', 'payment_method', 'status')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('channel', models.CharField(choices=[('web', 'Web'), ('pos', 'POS')], max_length=10, verbose_name='Canal')),
+                ('payment_method', models.CharField(max_length=20, verbose_name='Método de pago')),
+                ('units', models.IntegerField(default=0, verbose_name='Unidades')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Ingresos')),
+                ('iva_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='IVA')),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Costo')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.category', verbose_name='Categoría')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Hecho de venta diaria',
+                'verbose_name_plural': 'Hechos de ventas diarias',
+                'indexes': [models.Index(fields=['date', 'channel'], name='reports_dai_date_dbab82_idx')],
+                'unique_together': {('date', 'channel', 'product', 'category', 'payment_method')},
+            },
+        ),
+        migrations.RunPython(populate_sales_facts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('audit', '0003_alter_auditreport_report_type_inventorytrace'),
+        ('reports', '0002_dailysalestotal_dailysalesfact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('report', 'Reporte'), ('audit', 'Reporte de auditoría')], default='report', max_length=10, verbose_name='Tipo de trabajo')),
+                ('report_type', models.CharField(max_length=50, verbose_name='Tipo de reporte')),
+                ('parameters', models.JSONField(blank=True, default=dict, verbose_name='Parámetros')),
+                ('params_hash', models.CharField(db_index=True, max_length=64, verbose_name='Huella de parámetros')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'En ejecución'), ('completed', 'Completado'), ('failed', 'Fallido')], default='pending', max_length=20, verbose_name='Estado')),
+                ('artifact', models.FileField(blank=True, upload_to='report_jobs/', verbose_name='Archivo')),
+                ('file_size', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Tamaño del archivo')),
+                ('row_count', models.PositiveIntegerField(blank=True, null=True, verbose_name='Filas')),
+                ('duration', models.FloatField(blank=True, null=True, verbose_name='Duración (segundos)')),
+                ('error_message', models.TextField(blank=True, verbose_name='Mensaje de error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creado en')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado en')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='Completado en')),
+                ('audit_report', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='audit.auditreport', verbose_name='Reporte de auditoría')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Solicitado por')),
+                ('schedule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='reports.reportschedule', verbose_name='Programación')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de reporte',
+                'verbose_name_plural': 'Trabajos de reportes',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='reports_rep_status_051565_idx')],
+            },
+        ),
+    ]
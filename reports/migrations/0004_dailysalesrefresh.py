@@ -0,0 +1,29 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('channel', models.CharField(choices=[('web', 'Web'), ('pos', 'POS')], max_length=10, verbose_name='Canal')),
+                ('is_dirty', models.BooleanField(default=False, verbose_name='Pendiente')),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True, verbose_name='Recalculado en')),
+            ],
+            options={
+                'verbose_name': 'Recálculo de ventas diarias',
+                'verbose_name_plural': 'Recálculos de ventas diarias',
+                'indexes': [models.Index(fields=['is_dirty'], name='reports_dai_is_dirt_d92cb9_idx')],
+                'unique_together': {('date', 'channel')},
+            },
+        ),
+    ]
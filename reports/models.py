@@ -1,5 +1,39 @@
-from django.db import models
+import hashlib
+import json
+
+from django.db import models, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+# Estados de orden web que cuentan como venta
+PAID_STATUSES = ['paid', 'shipped', 'delivered']
+
+# Claves y medidas de DailySalesFact y DailySalesTotal (ver DailySalesFact.aggregate)
+FACT_KEY = ('date', 'product_id', 'category_id', 'payment_method')
+FACT_MEASURES = ('units', 'revenue', 'iva_amount', 'cost')
+TOTAL_KEY = ('date', 'payment_method', 'status')
+TOTAL_MEASURES = ('documents', 'total', 'iva_amount', 'shipping_cost', 'discount_amount')
+
+
+def _apply_delta(model, channel, key_fields, key, measures, values):
+    """
+    Suma ``values`` a la fila ``key`` de ``model``, o la crea si falta y la
+    diferencia es un alta. La primera medida (unidades o documentos) decide
+    si la fila sigue existiendo. Devuelve ``False`` si no hay fila sobre la
+    que restar.
+    """
+    rows = model.objects.filter(channel=channel, **dict(zip(key_fields, key)))
+    changes = {measure: F(measure) + value for measure, value in zip(measures, values)}
+    if rows.update(**changes):
+        if values[0] < 0:
+            rows.filter(**{measures[0]: 0}).delete()
+        return True
+    if values[0] > 0:
+        model.objects.create(channel=channel, **dict(zip(key_fields + measures, key + values)))
+        return True
+    return False
 
 
 class ReportTemplate(models.Model):
@@ -57,14 +91,303 @@ class ReportSchedule(models.Model):
         return self.name
 
 
+class ReportJob(models.Model):
+    """
+    Trabajo de generación de reportes fuera de la petición. La tabla es la
+    cola: ``manage.py report_worker`` toma los trabajos pendientes, escribe
+    el resultado comprimido en ``MEDIA_ROOT/report_jobs/`` y registra la
+    duración y el número de filas. ``params_hash`` identifica el reporte
+    pedido, para servir peticiones repetidas desde el archivo ya generado.
+    """
+    KINDS = [
+        ('report', 'Reporte'),
+        ('audit', 'Reporte de auditoría'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('running', 'En ejecución'),
+        ('completed', 'Completado'),
+        ('failed', 'Fallido'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KINDS, default='report', verbose_name="Tipo de trabajo")
+    report_type = models.CharField(max_length=50, verbose_name="Tipo de reporte")
+    parameters = models.JSONField(default=dict, blank=True, verbose_name="Parámetros")
+    params_hash = models.CharField(max_length=64, db_index=True, verbose_name="Huella de parámetros")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Estado")
+    schedule = models.ForeignKey(
+        ReportSchedule, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='jobs', verbose_name="Programación"
+    )
+    audit_report = models.ForeignKey(
+        'audit.AuditReport', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='jobs', verbose_name="Reporte de auditoría"
+    )
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Solicitado por"
+    )
+    artifact = models.FileField(upload_to='report_jobs/', blank=True, verbose_name="Archivo")
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Tamaño del archivo")
+    row_count = models.PositiveIntegerField(null=True, blank=True, verbose_name="Filas")
+    duration = models.FloatField(null=True, blank=True, verbose_name="Duración (segundos)")
+    error_message = models.TextField(blank=True, verbose_name="Mensaje de error")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Creado en")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Iniciado en")
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="Completado en")
+
+    class Meta:
+        verbose_name = "Trabajo de reporte"
+        verbose_name_plural = "Trabajos de reportes"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.report_type} #{self.pk} - {self.get_status_display()}"
+
+    @staticmethod
+    def clean_parameters(parameters):
+        """Parámetros sin valores vacíos, para que peticiones equivalentes coincidan"""
+        return {
+            key: value for key, value in (parameters or {}).items()
+            if value not in (None, '') and key != 'format'
+        }
+
+    @staticmethod
+    def compute_hash(kind, report_type, parameters):
+        payload = json.dumps([kind, report_type, parameters], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @property
+    def is_completed(self):
+        return self.status == 'completed'
+
+
+class DailySalesFact(models.Model):
+    """
+    Ventas pre-agregadas por día, canal, producto, categoría y método de
+    pago. Solo incluye ventas efectivas (órdenes web pagadas y ventas POS).
+    Al confirmar una venta se le suma la diferencia que aportan los
+    documentos modificados (``apply``), de modo que ni los reportes ni las
+    escrituras dependen del tamaño del historial o del día. ``refresh``
+    reconstruye un día completo (``rebuild_sales_facts``).
+    """
+    CHANNELS = [
+        ('web', 'Web'),
+        ('pos', 'POS'),
+    ]
+
+    date = models.DateField(verbose_name="Fecha")
+    channel = models.CharField(max_length=10, choices=CHANNELS, verbose_name="Canal")
+    product = models.ForeignKey('catalog.Product', on_delete=models.CASCADE, verbose_name="Producto")
+    category = models.ForeignKey('catalog.Category', on_delete=models.CASCADE, verbose_name="Categoría")
+    payment_method = models.CharField(max_length=20, verbose_name="Método de pago")
+    units = models.IntegerField(default=0, verbose_name="Unidades")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Ingresos")
+    iva_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="IVA")
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Costo")
+
+    class Meta:
+        verbose_name = "Hecho de venta diaria"
+        verbose_name_plural = "Hechos de ventas diarias"
+        unique_together = ['date', 'channel', 'product', 'category', 'payment_method']
+        indexes = [
+            models.Index(fields=['date', 'channel']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.channel} - {self.product_id}: {self.units}"
+
+    @classmethod
+    def aggregate(cls, channel, **lookups):
+        """
+        Agrega las ventas de ``channel`` cuyos documentos (``Order`` o
+        ``POSSale``) cumplen ``lookups``, p. ej. ``created_at__date=day`` o
+        ``pk__in=ids``.
+
+        Devuelve ``(hechos, totales)``, dos diccionarios ``{clave: medidas}``
+        con las claves y medidas de ``FACT_KEY``/``FACT_MEASURES`` y
+        ``TOTAL_KEY``/``TOTAL_MEASURES``.
+        """
+        from orders.models import Order, OrderItem
+        from pos.models import POSSale, POSSaleItem
+
+        if channel == 'web':
+            prefix = 'order__'
+            items = OrderItem.objects.filter(order__status__in=PAID_STATUSES)
+            documents = Order.objects.filter(**lookups).values(
+                'payment_method', 'status', day=TruncDate('created_at')
+            )
+            extra = {'shipping': Sum('shipping_cost')}
+        else:
+            prefix = 'sale__'
+            items = POSSaleItem.objects.all()
+            documents = POSSale.objects.filter(**lookups).values(
+                'payment_method', day=TruncDate('created_at')
+            )
+            extra = {'discount': Sum('discount_amount')}
+
+        cost = ExpressionWrapper(
+            F('quantity') * F('product__cost_price'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+        items = items.filter(
+            **{prefix + lookup: value for lookup, value in lookups.items()}
+        ).values(
+            'product_id', 'product__category_id',
+            payment_method=F(prefix + 'payment_method'), day=TruncDate(prefix + 'created_at'),
+        ).order_by().annotate(
+            total_units=Sum('quantity'),
+            total_revenue=Sum('total'),
+            total_iva=Sum('iva_amount'),
+            total_cost=Sum(cost),
+        )
+        documents = documents.order_by().annotate(
+            count=Count('id'),
+            total_amount=Sum('total'),
+            total_iva=Sum('iva_amount'),
+            **extra,
+        )
 
+        facts = {
+            (row['day'], row['product_id'], row['product__category_id'], row['payment_method']): (
+                row['total_units'] or 0,
+                row['total_revenue'] or 0,
+                row['total_iva'] or 0,
+                row['total_cost'] or 0,
+            )
+            for row in items
+        }
+        totals = {
+            # Las ventas POS siempre están pagadas
+            (row['day'], row['payment_method'], row.get('status', 'paid')): (
+                row['count'],
+                row['total_amount'] or 0,
+                row['total_iva'] or 0,
+                row.get('shipping') or 0,
+                row.get('discount') or 0,
+            )
+            for row in documents
+        }
+        return facts, totals
 
+    @classmethod
+    def refresh(cls, channel, day):
+        """
+        Recalcula los hechos (por producto y por documento) de un día y canal
+        a partir de las ventas de ese día.
 
+        Bloquea primero la fila ``DailySalesRefresh`` del día y canal: un
+        recálculo o una aplicación de diferencias concurrentes esperan a que
+        este termine, en lugar de chocar con el ``unique_together`` al
+        insertar los mismos hechos.
+        """
+        with transaction.atomic():
+            state = DailySalesRefresh.lock(channel, day)
+            # Las ventas se leen con el bloqueo tomado
+            facts, totals = cls.aggregate(channel, created_at__date=day)
 
+            cls.objects.filter(date=day, channel=channel).delete()
+            DailySalesTotal.objects.filter(date=day, channel=channel).delete()
+            cls.objects.bulk_create(
+                cls(channel=channel, **dict(zip(FACT_KEY + FACT_MEASURES, key + values)))
+                for key, values in facts.items()
+            )
+            DailySalesTotal.objects.bulk_create(
+                DailySalesTotal(channel=channel, **dict(zip(TOTAL_KEY + TOTAL_MEASURES, key + values)))
+                for key, values in totals.items()
+            )
+            DailySalesRefresh.objects.filter(pk=state.pk).update(is_dirty=False, refreshed_at=timezone.now())
 
+    @classmethod
+    def apply(cls, channel, facts, totals):
+        """
+        Suma a los hechos de ``channel`` las diferencias ``facts`` y
+        ``totals`` (con las claves y medidas de ``aggregate``) con
+        incrementos ``F()``, sin volver a leer las ventas del día.
 
+        Cada día se aplica con el bloqueo de su ``DailySalesRefresh`` para no
+        mezclarse con un ``refresh`` concurrente. Las filas que quedan sin
+        unidades o sin documentos se eliminan. Si una diferencia no tiene fila
+        sobre la que aplicarse (p. ej. hechos borrados a mano), el día se
+        marca como pendiente para que ``rebuild_sales_facts --dirty`` lo
+        reconstruya.
+        """
+        days = sorted({key[0] for key in facts} | {key[0] for key in totals})
+        for day in days:
+            with transaction.atomic():
+                state = DailySalesRefresh.lock(channel, day)
+                applied = [
+                    _apply_delta(cls, channel, FACT_KEY, key, FACT_MEASURES, values)
+                    for key, values in facts.items() if key[0] == day
+                ] + [
+                    _apply_delta(DailySalesTotal, channel, TOTAL_KEY, key, TOTAL_MEASURES, values)
+                    for key, values in totals.items() if key[0] == day
+                ]
+                if not all(applied):
+                    DailySalesRefresh.objects.filter(pk=state.pk).update(is_dirty=True)
 
 
+class DailySalesTotal(models.Model):
+    """
+    Totales de documentos (órdenes web y ventas POS) por día, canal, método
+    de pago y estado. Complementa ``DailySalesFact`` con lo que no se puede
+    obtener de las líneas: número de documentos, envío y descuentos.
+    """
+    date = models.DateField(verbose_name="Fecha")
+    channel = models.CharField(max_length=10, choices=DailySalesFact.CHANNELS, verbose_name="Canal")
+    payment_method = models.CharField(max_length=20, verbose_name="Método de pago")
+    status = models.CharField(max_length=20, verbose_name="Estado")
+    documents = models.PositiveIntegerField(default=0, verbose_name="Documentos")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total")
+    iva_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="IVA")
+    shipping_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Envío")
+    discount_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Descuento")
 
+    class Meta:
+        verbose_name = "Total de ventas diarias"
+        verbose_name_plural = "Totales de ventas diarias"
+        unique_together = ['date', 'channel', 'payment_method', 'status']
+        indexes = [
+            models.Index(fields=['date', 'channel']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.channel} {self.status}: {self.total}"
+
+
+class DailySalesRefresh(models.Model):
+    """
+    Estado del recálculo de los hechos de un día y canal. Su fila es el
+    bloqueo que serializa ``DailySalesFact.refresh`` y ``DailySalesFact.apply``
+    y queda marcada como pendiente (``is_dirty``) si una actualización falla,
+    para que ``rebuild_sales_facts --dirty`` reconstruya el día.
+    """
+    date = models.DateField(verbose_name="Fecha")
+    channel = models.CharField(max_length=10, choices=DailySalesFact.CHANNELS, verbose_name="Canal")
+    is_dirty = models.BooleanField(default=False, verbose_name="Pendiente")
+    refreshed_at = models.DateTimeField(null=True, blank=True, verbose_name="Recalculado en")
+
+    class Meta:
+        verbose_name = "Recálculo de ventas diarias"
+        verbose_name_plural = "Recálculos de ventas diarias"
+        unique_together = ['date', 'channel']
+        indexes = [
+            models.Index(fields=['is_dirty']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.channel}{' (pendiente)' if self.is_dirty else ''}"
 
+    @classmethod
+    def lock(cls, channel, day):
+        """Crea si falta y bloquea (``select_for_update``) la fila del día y canal"""
+        cls.objects.bulk_create([cls(date=day, channel=channel)], ignore_conflicts=True)
+        return cls.objects.select_for_update().get(date=day, channel=channel)
 
+    @classmethod
+    def mark_dirty(cls, channel, day):
+        """Marca el día y canal para volver a recalcularlos"""
+        cls.objects.update_or_create(date=day, channel=channel, defaults={'is_dirty': True})
@@ -0,0 +1,327 @@
+"""
+Métricas de ventas para los dashboards.
+
+``DashboardMetrics`` lee los hechos pre-agregados (``DailySalesTotal`` y
+``DailySalesFact``): los totales de todos los periodos (hoy, semana, mes,
+mes calendario) salen de una sola consulta de agregación condicional, y las
+estadísticas de productos y categorías se combinan con diccionarios en lugar
+de recorrer catálogos completos.
+
+``SalesDocumentFeed`` lista órdenes web y ventas POS juntas con un
+``UNION ALL`` ordenado y paginado por cursor en la base de datos.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db.models import CharField, Q, Sum, Value
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from catalog.models import Category, Product
+from .models import PAID_STATUSES, DailySalesFact, DailySalesTotal
+
+CHANNELS = ('web', 'pos')
+
+
+class DashboardMetrics:
+    """
+    Métricas de ventas web + POS relativas a ``today``. Cada consulta se
+    ejecuta una sola vez por instancia.
+    """
+
+    def __init__(self, today=None):
+        self.today = today or timezone.localdate()
+        self.periods = {
+            'today': self.today,
+            'week': self.today - timedelta(days=7),
+            'month': self.today - timedelta(days=30),
+            'calendar_month': self.today.replace(day=1),
+        }
+
+    @cached_property
+    def _totals(self):
+        """Conteos y montos por canal y periodo (una consulta)"""
+        aggregates = {}
+        for channel in CHANNELS:
+            in_channel = Q(channel=channel)
+            paid = in_channel & Q(status__in=PAID_STATUSES)
+            aggregates[f'{channel}_total_count'] = Sum('documents', filter=in_channel)
+            for name, start in self.periods.items():
+                period = Q(date__gte=start)
+                aggregates[f'{channel}_{name}_count'] = Sum('documents', filter=in_channel & period)
+                aggregates[f'{channel}_{name}_paid_count'] = Sum('documents', filter=paid & period)
+                aggregates[f'{channel}_{name}_amount'] = Sum('total', filter=paid & period)
+
+        totals = DailySalesTotal.objects.aggregate(**aggregates)
+        return {
+            key: value if value is not None else (Decimal('0') if key.endswith('_amount') else 0)
+            for key, value in totals.items()
+        }
+
+    def _channel_totals(self, channel):
+        prefix = f'{channel}_'
+        return {
+            key[len(prefix):]: value
+            for key, value in self._totals.items()
+            if key.startswith(prefix)
+        }
+
+    @property
+    def web_totals(self):
+        """Conteos y montos de órdenes web por periodo"""
+        return self._channel_totals('web')
+
+    @property
+    def pos_totals(self):
+        """Conteos y montos de ventas POS por periodo"""
+        return self._channel_totals('pos')
+
+    @cached_property
+    def period_totals(self):
+        """
+        Totales combinados por periodo::
+
+            {'today': {'orders', 'sales', 'web_orders', 'web_sales',
+                       'pos_orders', 'pos_sales'}, 'week': {...}, ...}
+        """
+        web, pos = self.web_totals, self.pos_totals
+        totals = {}
+        for name in self.periods:
+            totals[name] = {
+                'web_orders': web[f'{name}_count'],
+                'web_paid_orders': web[f'{name}_paid_count'],
+                'web_sales': web[f'{name}_amount'],
+                'pos_orders': pos[f'{name}_count'],
+                'pos_sales': pos[f'{name}_amount'],
+            }
+            totals[name]['orders'] = totals[name]['web_orders'] + totals[name]['pos_orders']
+            totals[name]['sales'] = totals[name]['web_sales'] + totals[name]['pos_sales']
+        return totals
+
+    @property
+    def total_orders(self):
+        """Órdenes web + ventas POS de todos los tiempos"""
+        return self.web_totals['total_count'] + self.pos_totals['total_count']
+
+    def daily_sales(self, days=7):
+        """
+        Ventas web + POS por día de los últimos ``days`` días, del más
+        antiguo al más reciente: ``[(fecha, total), ...]``
+        """
+        start = self.today - timedelta(days=days - 1)
+        totals = dict(
+            DailySalesTotal.objects.filter(
+                date__gte=start, status__in=PAID_STATUSES
+            ).order_by().values('date').annotate(amount=Sum('total')).values_list('date', 'amount')
+        )
+        return [
+            (day, totals.get(day) or Decimal('0'))
+            for day in (start + timedelta(days=i) for i in range(days))
+        ]
+
+    def _item_totals(self, group_by):
+        """Suma los hechos web y POS del último mes agrupados por ``group_by``"""
+        rows = DailySalesFact.objects.filter(
+            date__gte=self.periods['month']
+        ).order_by().values(group_by, 'channel').annotate(
+            sold=Sum('units'), revenue=Sum('revenue')
+        )
+
+        totals = {}
+        for row in rows:
+            entry = totals.setdefault(row[group_by], {
+                'web_sold': 0, 'pos_sold': 0,
+                'web_revenue': Decimal('0'), 'pos_revenue': Decimal('0'),
+            })
+            entry[f"{row['channel']}_sold"] += row['sold'] or 0
+            entry[f"{row['channel']}_revenue"] += row['revenue'] or Decimal('0')
+        return totals
+
+    def top_products(self, limit=10):
+        """Productos más vendidos (web + POS) del último mes"""
+        totals = self._item_totals('product_id')
+        ranking = sorted(
+            ((product_id, entry['web_sold'] + entry['pos_sold'],
+              entry['web_revenue'] + entry['pos_revenue'])
+             for product_id, entry in totals.items()),
+            key=lambda row: row[1],
+            reverse=True,
+        )
+        ranking = [row for row in ranking if row[1] > 0][:limit]
+        products = Product.objects.in_bulk([row[0] for row in ranking])
+        return [
+            {'product': products[product_id], 'total_sold': sold, 'total_revenue': revenue}
+            for product_id, sold, revenue in ranking
+            if product_id in products
+        ]
+
+    def category_distribution(self, limit=5):
+        """Ventas por categoría (web + POS) del último mes"""
+        totals = self._item_totals('category_id')
+        ranking = sorted(
+            ((category_id, entry['web_revenue'], entry['pos_revenue'])
+             for category_id, entry in totals.items()),
+            key=lambda row: row[1] + row[2],
+            reverse=True,
+        )
+        ranking = [row for row in ranking if row[1] + row[2] > 0][:limit]
+        categories = Category.objects.in_bulk([row[0] for row in ranking])
+        return [
+            {
+                'category': categories[category_id],
+                'total_sales': web_sales + pos_sales,
+                'web_sales': web_sales,
+                'pos_sales': pos_sales,
+            }
+            for category_id, web_sales, pos_sales in ranking
+            if category_id in categories
+        ]
+
+    def orders_by_status(self):
+        """Órdenes web por estado; las ventas POS cuentan como pagadas"""
+        orders_by_status = [
+            {'status': row['status'], 'count': row['count']}
+            for row in DailySalesTotal.objects.filter(channel='web').order_by('status').values(
+                'status'
+            ).annotate(count=Sum('documents'))
+        ]
+        pos_count = self.pos_totals['total_count']
+        if pos_count:
+            for status_data in orders_by_status:
+                if status_data['status'] == 'paid':
+                    status_data['count'] += pos_count
+                    break
+            else:
+                orders_by_status.append({'status': 'paid', 'count': pos_count})
+        return orders_by_status
+
+
+class SalesDocumentPage:
+    """Una página del feed: documentos ``(tipo, objeto)`` y cursores vecinos"""
+
+    def __init__(self, documents, next_cursor=None, previous_cursor=None):
+        self.documents = documents
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class SalesDocumentFeed:
+    """
+    Órdenes web y ventas POS en una sola lista, de la más reciente a la más
+    antigua. Recibe los querysets ya filtrados (``None`` excluye la fuente).
+
+    El orden ``(created_at, tipo, id)`` es total, así que la página se pide
+    con un cursor en lugar de un offset: la base de datos solo lee las filas
+    de la página, sin importar cuánto historial haya antes.
+    """
+
+    def __init__(self, web_orders=None, pos_sales=None):
+        self.sources = {}
+        if web_orders is not None:
+            self.sources['web'] = web_orders
+        if pos_sales is not None:
+            self.sources['pos'] = pos_sales
+
+    @staticmethod
+    def encode_cursor(kind, created_at, pk):
+        return f'{created_at.isoformat()}|{kind}|{pk}'
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """``None`` si el cursor no es válido (se vuelve a la primera página)"""
+        try:
+            created_at, kind, pk = cursor.split('|')
+            return datetime.fromisoformat(created_at), kind, int(pk)
+        except (AttributeError, ValueError):
+            return None
+
+    def _keyset(self, kind, cursor, newer):
+        """Filas de ``kind`` antes (o después) del cursor en el orden del feed"""
+        created_at, cursor_kind, pk = cursor
+        lookup = 'gt' if newer else 'lt'
+        beyond = Q(**{f'created_at__{lookup}': created_at})
+        if kind == cursor_kind:
+            return beyond | Q(created_at=created_at, **{f'id__{lookup}': pk})
+        if (kind > cursor_kind) == newer:
+            return beyond | Q(created_at=created_at)
+        return beyond
+
+    def _rows(self, limit, cursor=None, newer=False):
+        queries = []
+        for kind, queryset in self.sources.items():
+            if cursor is not None:
+                queryset = queryset.filter(self._keyset(kind, cursor, newer))
+            queries.append(
+                queryset.order_by().annotate(
+                    kind=Value(kind, output_field=CharField())
+                ).values_list('created_at', 'kind', 'id')
+            )
+        if not queries:
+            return []
+
+        feed = queries[0].union(*queries[1:], all=True) if len(queries) > 1 else queries[0]
+        ordering = ('created_at', 'kind', 'id') if newer else ('-created_at', '-kind', '-id')
+        return list(feed.order_by(*ordering)[:limit])
+
+    def _load(self, rows):
+        ids = {kind: [] for kind in self.sources}
+        for _, kind, pk in rows:
+            ids[kind].append(pk)
+        objects = {
+            kind: self.sources[kind].order_by().in_bulk(pks) for kind, pks in ids.items() if pks
+        }
+        return [(kind, objects[kind][pk]) for _, kind, pk in rows if pk in objects[kind]]
+
+    def page(self, after=None, before=None, size=20):
+        """
+        Página de ``size`` documentos. ``after`` continúa hacia documentos más
+        antiguos y ``before`` vuelve hacia los más recientes.
+        """
+        before_cursor, after_cursor = before, after
+        before = self.decode_cursor(before) if before else None
+        after = self.decode_cursor(after) if after and not before else None
+
+        if before is not None:
+            rows = self._rows(size + 1, before, newer=True)
+            has_more = len(rows) > size
+            rows = rows[:size][::-1]
+            has_newer, has_older = has_more, True
+        else:
+            rows = self._rows(size + 1, after)
+            has_older = len(rows) > size
+            rows = rows[:size]
+            has_newer = after is not None
+
+        if not rows:
+            # Página vacía (p. ej. se borraron documentos): el cursor recibido
+            # permite volver en la dirección contraria
+            return SalesDocumentPage(
+                [],
+                next_cursor=before_cursor if before is not None else None,
+                previous_cursor=after_cursor if after is not None else None,
+            )
+
+        first, last = rows[0], rows[-1]
+        return SalesDocumentPage(
+            self._load(rows),
+            next_cursor=self.encode_cursor(last[1], last[0], last[2]) if has_older else None,
+            previous_cursor=self.encode_cursor(first[1], first[0], first[2]) if has_newer else None,
+        )
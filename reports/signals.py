@@ -0,0 +1,150 @@
+"""
+Mantiene ``DailySalesFact`` al día sin recalcular días completos.
+
+Antes del primer cambio de un documento (``Order`` o ``POSSale``, o de una
+de sus líneas) en una transacción se guarda lo que aportaba a los hechos
+(``DailySalesFact.aggregate`` filtrado por ese documento). Al hacer commit se
+vuelve a agregar solo los documentos modificados y la diferencia se suma a
+los hechos con incrementos ``F()`` (``DailySalesFact.apply``). El costo de
+una escritura depende del tamaño del documento, no de las ventas del día.
+
+Si la actualización falla, la venta ya está confirmada: el error se
+registra en el log y los días afectados quedan marcados como pendientes
+(``DailySalesRefresh``) para que ``rebuild_sales_facts --dirty`` los
+reconstruya.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from naturalmede.batching import CommitBatch
+
+from .models import DailySalesFact, DailySalesRefresh
+
+logger = logging.getLogger(__name__)
+
+# Aporte de un documento que no existía: sin hechos ni totales
+NO_CONTRIBUTION = ({}, {})
+
+
+def _accumulate(target, rows, sign=1):
+    for key, values in rows.items():
+        current = target.get(key, (0,) * len(values))
+        target[key] = tuple(total + sign * value for total, value in zip(current, values))
+
+
+def apply_documents(pending):
+    """
+    Suma a los hechos la diferencia entre el aporte actual de los documentos
+    y el guardado en ``pending`` (``{(canal, pk): (hechos, totales)}``)
+    """
+    channels = defaultdict(dict)
+    for (channel, pk), contribution in pending.items():
+        channels[channel][pk] = contribution
+
+    for channel, documents in sorted(channels.items()):
+        facts, totals = {}, {}
+        try:
+            for old_facts, old_totals in documents.values():
+                _accumulate(facts, old_facts, -1)
+                _accumulate(totals, old_totals, -1)
+            new_facts, new_totals = DailySalesFact.aggregate(channel, pk__in=list(documents))
+            _accumulate(facts, new_facts)
+            _accumulate(totals, new_totals)
+            DailySalesFact.apply(
+                channel,
+                {key: values for key, values in facts.items() if any(values)},
+                {key: values for key, values in totals.items() if any(values)},
+            )
+        except Exception:
+            logger.exception('Error actualizando los hechos de ventas %s', channel)
+            # Los documentos nuevos aún no tienen aporte conocido: son de hoy
+            days = {key[0] for key in facts} | {key[0] for key in totals} | {timezone.localdate()}
+            for day in sorted(days):
+                DailySalesRefresh.mark_dirty(channel, day)
+
+
+# Aporte previo de los documentos modificados en la transacción en curso
+_transaction_documents = CommitBatch(apply_documents, factory=dict)
+
+
+def _is_tracked(key):
+    return any(key in pending for pending in _transaction_documents.live())
+
+
+def before_change(instance, channel, document_id):
+    """Guarda el aporte del documento antes de su primer cambio"""
+    if document_id is None:
+        # Documento nuevo: no aportaba nada
+        return
+    key = (channel, document_id)
+    if not transaction.get_connection().in_atomic_block:
+        # Fuera de una transacción el cambio se aplica en post_save
+        instance._sales_contribution = DailySalesFact.aggregate(channel, pk=document_id)
+    elif not _is_tracked(key):
+        _transaction_documents.pending()[key] = DailySalesFact.aggregate(channel, pk=document_id)
+
+
+def after_change(instance, channel, document_id):
+    """Aplica el cambio del documento (al hacer commit si hay transacción)"""
+    key = (channel, document_id)
+    if not transaction.get_connection().in_atomic_block:
+        old = instance.__dict__.pop('_sales_contribution', NO_CONTRIBUTION)
+        apply_documents({key: old})
+    elif not _is_tracked(key):
+        # Documento creado en esta transacción
+        _transaction_documents.pending()[key] = NO_CONTRIBUTION
+
+
+@receiver(pre_save, sender='orders.Order')
+@receiver(pre_delete, sender='orders.Order')
+def capture_order_facts(sender, instance, **kwargs):
+    before_change(instance, 'web', instance.pk)
+
+
+@receiver(post_save, sender='orders.Order')
+@receiver(post_delete, sender='orders.Order')
+def update_order_facts(sender, instance, **kwargs):
+    after_change(instance, 'web', instance.pk)
+
+
+@receiver(pre_save, sender='orders.OrderItem')
+@receiver(pre_delete, sender='orders.OrderItem')
+def capture_order_item_facts(sender, instance, **kwargs):
+    before_change(instance, 'web', instance.order_id)
+
+
+@receiver(post_save, sender='orders.OrderItem')
+@receiver(post_delete, sender='orders.OrderItem')
+def update_order_item_facts(sender, instance, **kwargs):
+    after_change(instance, 'web', instance.order_id)
+
+
+@receiver(pre_save, sender='pos.POSSale')
+@receiver(pre_delete, sender='pos.POSSale')
+def capture_pos_sale_facts(sender, instance, **kwargs):
+    before_change(instance, 'pos', instance.pk)
+
+
+@receiver(post_save, sender='pos.POSSale')
+@receiver(post_delete, sender='pos.POSSale')
+def update_pos_sale_facts(sender, instance, **kwargs):
+    # Los items de la venta se insertan con bulk_create en la misma
+    # transacción; la agregación al commit ya los incluye
+    after_change(instance, 'pos', instance.pk)
+
+
+@receiver(pre_save, sender='pos.POSSaleItem')
+@receiver(pre_delete, sender='pos.POSSaleItem')
+def capture_pos_sale_item_facts(sender, instance, **kwargs):
+    before_change(instance, 'pos', instance.sale_id)
+
+
+@receiver(post_save, sender='pos.POSSaleItem')
+@receiver(post_delete, sender='pos.POSSaleItem')
+def update_pos_sale_item_facts(sender, instance, **kwargs):
+    after_change(instance, 'pos', instance.sale_id)
@@ -11,6 +11,9 @@ urlpatterns = [
     path('customers/', views.CustomersReportView.as_view(), name='customers_report'),
     path('financial/', views.FinancialReportView.as_view(), name='financial_report'),
     path('export/<str:report_type>/', views.ReportExportView.as_view(), name='report_export'),
+    path('jobs/<str:report_type>/', views.ReportJobCreateView.as_view(), name='report_job_create'),
+    path('jobs/<int:pk>/status/', views.ReportJobDetailView.as_view(), name='report_job_detail'),
+    path('jobs/<int:pk>/download/', views.ReportJobDownloadView.as_view(), name='report_job_download'),
 ]
 
 
@@ -1,14 +1,19 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, View
 from django.db.models import Q, Sum, Count, Avg, F
-from django.http import JsonResponse, HttpResponse
+from django.db.models.functions import TruncMonth
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
 from django.utils import timezone
 from datetime import datetime, timedelta
-import csv
 import json
-from .models import ReportTemplate, ReportSchedule
+from .models import ReportTemplate, ReportSchedule, ReportJob, DailySalesFact, DailySalesTotal, PAID_STATUSES
+from . import jobs
+from .exports import REPORT_EXPORTS, ExportFormatError, export_response
+from .services import DashboardMetrics
 from orders.models import Order, OrderItem
 from catalog.models import Product
 from customers.models import Customer
@@ -27,36 +32,29 @@ class ReportsDashboardView(ListView):
         context = super().get_context_data(**kwargs)
         
         # Estadísticas generales
-        today = timezone.now().date()
+        today = timezone.localdate()
         this_month = today.replace(day=1)
         
-        # Ventas del día
-        context['today_sales'] = Order.objects.filter(
-            created_at__date=today,
-            status__in=['paid', 'shipped', 'delivered']
-        ).aggregate(
-            total_orders=Count('id'),
-            total_amount=Sum('total')
-        )
-        
-        # Ventas del mes
-        context['month_sales'] = Order.objects.filter(
-            created_at__date__gte=this_month,
-            status__in=['paid', 'shipped', 'delivered']
-        ).aggregate(
-            total_orders=Count('id'),
-            total_amount=Sum('total')
-        )
+        # Ventas web pagadas del día y del mes (una sola consulta)
+        web_totals = DashboardMetrics(today).web_totals
+        context['today_sales'] = {
+            'total_orders': web_totals['today_paid_count'],
+            'total_amount': web_totals['today_amount'],
+        }
+        context['month_sales'] = {
+            'total_orders': web_totals['calendar_month_paid_count'],
+            'total_amount': web_totals['calendar_month_amount'],
+        }
         
         # Productos más vendidos
-        context['top_products'] = OrderItem.objects.filter(
-            order__created_at__date__gte=this_month,
-            order__status__in=['paid', 'shipped', 'delivered']
+        context['top_products'] = DailySalesFact.objects.filter(
+            channel='web',
+            date__gte=this_month
         ).values(
             'product__name'
         ).annotate(
-            total_quantity=Sum('quantity'),
-            total_sales=Sum('total')
+            total_quantity=Sum('units'),
+            total_sales=Sum('revenue')
         ).order_by('-total_quantity')[:5]
         
         # Clientes más activos
@@ -97,34 +95,56 @@ class SalesReportView(ListView):
         
         return queryset.order_by('-created_at')
 
+    def get_totals_queryset(self):
+        """Los filtros del listado aplicados a los totales diarios pre-agregados"""
+        totals = DailySalesTotal.objects.filter(channel='web')
+        
+        start_date = self.request.GET.get('start_date')
+        end_date = self.request.GET.get('end_date')
+        if start_date:
+            totals = totals.filter(date__gte=start_date)
+        if end_date:
+            totals = totals.filter(date__lte=end_date)
+        
+        status_filter = self.request.GET.get('status')
+        if status_filter:
+            totals = totals.filter(status=status_filter)
+        
+        payment_filter = self.request.GET.get('payment_method')
+        if payment_filter:
+            totals = totals.filter(payment_method=payment_filter)
+        
+        return totals.order_by()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
         # Estadísticas del reporte
-        queryset = self.get_queryset()
-        context['stats'] = queryset.aggregate(
-            total_orders=Count('id'),
-            total_amount=Sum('total'),
-            avg_order_value=Avg('total')
+        totals = self.get_totals_queryset()
+        stats = totals.aggregate(
+            total_orders=Sum('documents'),
+            total_amount=Sum('total')
+        )
+        stats['avg_order_value'] = (
+            stats['total_amount'] / stats['total_orders'] if stats['total_orders'] else None
         )
+        context['stats'] = stats
         
         # Ventas por estado
-        context['sales_by_status'] = queryset.values('status').annotate(
-            count=Count('id'),
+        context['sales_by_status'] = totals.values('status').annotate(
+            count=Sum('documents'),
             total=Sum('total')
         ).order_by('-total')
         
         # Ventas por método de pago
-        context['sales_by_payment'] = queryset.values('payment_method').annotate(
-            count=Count('id'),
+        context['sales_by_payment'] = totals.values('payment_method').annotate(
+            count=Sum('documents'),
             total=Sum('total')
         ).order_by('-total')
         
         # Ventas por día
-        context['sales_by_day'] = queryset.extra(
-            select={'day': 'date(created_at)'}
-        ).values('day').annotate(
-            count=Count('id'),
+        context['sales_by_day'] = totals.values(day=F('date')).annotate(
+            count=Sum('documents'),
             total=Sum('total')
         ).order_by('day')
         
@@ -233,12 +253,12 @@ class ProductsReportView(ListView):
         )
         
         # Productos más vendidos
-        context['top_selling'] = OrderItem.objects.filter(
-            order__created_at__date__gte=timezone.now().date() - timedelta(days=30),
-            order__status__in=['paid', 'shipped', 'delivered']
+        context['top_selling'] = DailySalesFact.objects.filter(
+            channel='web',
+            date__gte=timezone.localdate() - timedelta(days=30)
         ).values('product__name').annotate(
-            total_quantity=Sum('quantity'),
-            total_sales=Sum('total')
+            total_quantity=Sum('units'),
+            total_sales=Sum('revenue')
         ).order_by('-total_quantity')[:10]
         
         # Productos por categoría
@@ -335,44 +355,58 @@ class FinancialReportView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Estadísticas financieras
-        queryset = self.get_queryset()
-        context['stats'] = queryset.aggregate(
+        # Estadísticas financieras (órdenes web pagadas)
+        totals = DailySalesTotal.objects.filter(
+            channel='web',
+            status__in=PAID_STATUSES
+        ).order_by()
+        start_date = self.request.GET.get('start_date')
+        end_date = self.request.GET.get('end_date')
+        if start_date:
+            totals = totals.filter(date__gte=start_date)
+        if end_date:
+            totals = totals.filter(date__lte=end_date)
+        
+        stats = totals.aggregate(
             total_revenue=Sum('total'),
-            total_orders=Count('id'),
-            avg_order_value=Avg('total'),
+            total_orders=Sum('documents'),
             total_iva=Sum('iva_amount'),
             total_shipping=Sum('shipping_cost')
         )
+        stats['avg_order_value'] = (
+            stats['total_revenue'] / stats['total_orders'] if stats['total_orders'] else None
+        )
+        context['stats'] = stats
         
         # Ingresos por método de pago
-        context['revenue_by_payment'] = queryset.values('payment_method').annotate(
-            count=Count('id'),
+        context['revenue_by_payment'] = totals.values('payment_method').annotate(
+            count=Sum('documents'),
             total=Sum('total')
         ).order_by('-total')
         
         # Ingresos por mes
-        context['revenue_by_month'] = queryset.extra(
-            select={'month': 'strftime("%Y-%m", created_at)'}
+        context['revenue_by_month'] = totals.annotate(
+            month=TruncMonth('date')
         ).values('month').annotate(
-            count=Count('id'),
+            count=Sum('documents'),
             total=Sum('total')
         ).order_by('month')
         
         # Comparación con mes anterior
-        if queryset.exists():
-            current_month = timezone.now().date().replace(day=1)
+        if stats['total_orders']:
+            current_month = timezone.localdate().replace(day=1)
             last_month = (current_month - timedelta(days=1)).replace(day=1)
             
-            current_revenue = queryset.filter(
-                created_at__date__gte=current_month
-            ).aggregate(total=Sum('total'))['total'] or 0
-            
-            last_revenue = Order.objects.filter(
-                created_at__date__gte=last_month,
-                created_at__date__lt=current_month,
-                status__in=['paid', 'shipped', 'delivered']
+            revenue = totals.aggregate(
+                current=Sum('total', filter=Q(date__gte=current_month)),
+            )
+            last_revenue = DailySalesTotal.objects.filter(
+                channel='web',
+                status__in=PAID_STATUSES,
+                date__gte=last_month,
+                date__lt=current_month
             ).aggregate(total=Sum('total'))['total'] or 0
+            current_revenue = revenue['current'] or 0
             
             if last_revenue > 0:
                 growth = ((current_revenue - last_revenue) / last_revenue) * 100
@@ -385,177 +419,55 @@ class FinancialReportView(ListView):
 
 class ReportExportView(View):
     def get(self, request, report_type):
-        if report_type == 'sales':
-            return self.export_sales_report(request)
-        elif report_type == 'inventory':
-            return self.export_inventory_report(request)
-        elif report_type == 'products':
-            return self.export_products_report(request)
-        elif report_type == 'customers':
-            return self.export_customers_report(request)
-        elif report_type == 'financial':
-            return self.export_financial_report(request)
-        else:
+        if report_type not in REPORT_EXPORTS:
             return JsonResponse({'error': 'Tipo de reporte no válido'}, status=400)
 
-    def export_sales_report(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="sales_report.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Número de Orden', 'Cliente', 'Estado', 'Método de Pago',
-            'Subtotal', 'IVA', 'Costo de Envío', 'Total', 'Fecha'
-        ])
-        
-        orders = Order.objects.select_related('customer__user').all()
-        
-        # Aplicar filtros
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        status_filter = request.GET.get('status')
-        
-        if start_date:
-            orders = orders.filter(created_at__date__gte=start_date)
-        if end_date:
-            orders = orders.filter(created_at__date__lte=end_date)
-        if status_filter:
-            orders = orders.filter(status=status_filter)
-        
-        for order in orders:
-            writer.writerow([
-                order.order_number,
-                order.customer.full_name,
-                order.get_status_display(),
-                order.get_payment_method_display(),
-                order.subtotal,
-                order.iva_amount,
-                order.shipping_cost,
-                order.total,
-                order.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        return response
-
-    def export_inventory_report(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="inventory_report.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Producto', 'SKU', 'Bodega', 'Cantidad', 'Stock Mínimo',
-            'Stock Máximo', 'Precio de Costo', 'Valor Total'
-        ])
-        
-        stocks = Stock.objects.select_related('product', 'warehouse').all()
-        
-        for stock in stocks:
-            writer.writerow([
-                stock.product.name,
-                stock.product.sku,
-                stock.warehouse.name,
-                stock.quantity,
-                stock.min_stock,
-                stock.max_stock,
-                stock.product.cost_price,
-                stock.quantity * stock.product.cost_price
-            ])
-        
-        return response
-
-    def export_products_report(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="products_report.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Nombre', 'SKU', 'Categoría', 'Marca', 'Precio',
-            'Precio de Costo', 'IVA %', 'Stock Total', 'Valor Total'
-        ])
-        
-        products = Product.objects.filter(is_active=True).select_related('category', 'brand')
-        
-        for product in products:
-            total_stock = Stock.objects.filter(product=product).aggregate(
-                total=Sum('quantity')
-            )['total'] or 0
-            
-            writer.writerow([
-                product.name,
-                product.sku,
-                product.category.name,
-                product.brand.name,
-                product.price,
-                product.cost_price,
-                product.iva_percentage,
-                total_stock,
-                total_stock * product.cost_price
-            ])
-        
-        return response
-
-    def export_customers_report(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="customers_report.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Nombre', 'Email', 'Teléfono', 'Tipo', 'Ciudad',
-            'Total Órdenes', 'Total Gastado', 'Fecha Registro'
-        ])
-        
-        customers = Customer.objects.filter(is_active=True).select_related('user').annotate(
-            total_orders=Count('orders'),
-            total_spent=Sum('orders__total', filter=Q(orders__status='delivered'))
+        filename, headers, rows = REPORT_EXPORTS[report_type](request.GET)
+        try:
+            return export_response(filename, headers, rows, request.GET.get('format', 'csv'))
+        except ExportFormatError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+
+def report_job_data(job):
+    data = {
+        'job_id': job.pk,
+        'status': job.status,
+        'report_type': job.report_type,
+        'row_count': job.row_count,
+        'duration': job.duration,
+        'error': job.error_message or None,
+    }
+    if job.is_completed:
+        data['download_url'] = reverse('reports:report_job_download', args=[job.pk])
+    return data
+
+
+class ReportJobCreateView(LoginRequiredMixin, View):
+    """Encola un reporte para generarlo con ``manage.py report_worker``"""
+
+    def post(self, request, report_type):
+        if report_type not in REPORT_EXPORTS:
+            return JsonResponse({'error': 'Tipo de reporte no válido'}, status=400)
+
+        job = jobs.submit('report', report_type, request.POST.dict(), requested_by=request.user)
+        return JsonResponse(report_job_data(job), status=200 if job.is_completed else 202)
+
+
+class ReportJobDetailView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk, kind='report')
+        return JsonResponse(report_job_data(job))
+
+
+class ReportJobDownloadView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk, kind='report', status='completed')
+        if not job.artifact or not job.artifact.storage.exists(job.artifact.name):
+            raise Http404('El archivo del reporte ya no existe')
+        return FileResponse(
+            job.artifact.open('rb'),
+            as_attachment=True,
+            filename=f'{job.report_type}_report.csv.gz',
+            content_type='application/gzip',
         )
-        
-        for customer in customers:
-            writer.writerow([
-                customer.full_name,
-                customer.email,
-                customer.phone,
-                customer.get_customer_type_display(),
-                customer.city,
-                customer.total_orders,
-                customer.total_spent or 0,
-                customer.created_at.strftime('%Y-%m-%d')
-            ])
-        
-        return response
-
-    def export_financial_report(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="financial_report.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Fecha', 'Número de Orden', 'Cliente', 'Método de Pago',
-            'Subtotal', 'IVA', 'Costo de Envío', 'Total'
-        ])
-        
-        orders = Order.objects.filter(
-            status__in=['paid', 'shipped', 'delivered']
-        ).select_related('customer__user')
-        
-        # Aplicar filtros de fecha
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        
-        if start_date:
-            orders = orders.filter(created_at__date__gte=start_date)
-        if end_date:
-            orders = orders.filter(created_at__date__lte=end_date)
-        
-        for order in orders:
-            writer.writerow([
-                order.created_at.strftime('%Y-%m-%d'),
-                order.order_number,
-                order.customer.full_name,
-                order.get_payment_method_display(),
-                order.subtotal,
-                order.iva_amount,
-                order.shipping_cost,
-                order.total
-            ])
-        
-        return response
@@ -0,0 +1,275 @@
+"""
+Pruebas para el sistema de auditoría
+"""
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from audit import spool
+from audit.buffer import audit_buffer
+from audit.models import AuditLog, AuditConfiguration, InventoryTrace
+from audit.registry import registry
+from audit.utils import create_inventory_traces, is_audit_enabled_for_model
+from catalog.models import Category
+from inventory.models import Stock
+from tests.test_catalog import CatalogTestMixin
+
+
+@override_settings(AUDIT_DISABLE_SIGNALS=False)
+class AuditBufferTests(TestCase):
+    """Pruebas para la escritura en lote de registros de auditoría"""
+
+    def test_logs_are_written_on_commit(self):
+        """Los registros de una transacción se escriben al hacer commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Category.objects.create(name="Cat A", slug="cat-a")
+                Category.objects.create(name="Cat B", slug="cat-b")
+                assert AuditLog.objects.filter(model_name='category').count() == 0
+
+        assert AuditLog.objects.filter(model_name='category', action='CREATE').count() == 2
+
+    def test_single_insert_for_buffered_block(self):
+        """Todos los registros del bloque se escriben en un solo INSERT"""
+        with CaptureQueriesContext(connection) as ctx:
+            with audit_buffer():
+                with self.captureOnCommitCallbacks(execute=True):
+                    with transaction.atomic():
+                        for i in range(5):
+                            Category.objects.create(name=f"Cat {i}", slug=f"cat-{i}")
+                assert AuditLog.objects.filter(model_name='category').count() == 0
+
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "audit_auditlog"')]
+        assert len(inserts) == 1
+        assert AuditLog.objects.filter(model_name='category').count() == 5
+
+    def test_rolled_back_logs_are_discarded(self):
+        """Los registros de una transacción revertida no se escriben"""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Category.objects.create(name="Cat X", slug="cat-x")
+                    raise ValueError("rollback")
+            except ValueError:
+                pass
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Category.objects.create(name="Cat Y", slug="cat-y")
+
+        reprs = list(AuditLog.objects.filter(model_name='category').values_list('object_repr', flat=True))
+        assert reprs == ["Cat Y"]
+
+    def test_rolled_back_savepoint_logs_are_discarded(self):
+        """Los registros de un savepoint revertido no se escriben con la transacción"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Category.objects.create(name="Cat A", slug="cat-a")
+                try:
+                    with transaction.atomic():
+                        Category.objects.create(name="Cat X", slug="cat-x")
+                        raise ValueError("rollback")
+                except ValueError:
+                    pass
+                with transaction.atomic():
+                    Category.objects.create(name="Cat B", slug="cat-b")
+
+        reprs = set(AuditLog.objects.filter(model_name='category').values_list('object_repr', flat=True))
+        assert reprs == {"Cat A", "Cat B"}
+
+    @override_settings(AUDIT_BUFFER_SIZE=2)
+    def test_size_based_flush(self):
+        """El buffer se vacía al alcanzar AUDIT_BUFFER_SIZE"""
+        with audit_buffer():
+            Category.objects.create(name="Cat 1", slug="cat-1")
+            assert AuditLog.objects.filter(model_name='category').count() == 0
+            Category.objects.create(name="Cat 2", slug="cat-2")
+            assert AuditLog.objects.filter(model_name='category').count() == 2
+
+
+class InventoryTraceAuditTests(CatalogTestMixin, TestCase):
+    """Pruebas para el log de auditoría de la trazabilidad de inventario"""
+
+    def test_stock_adjustment_log_is_buffered(self):
+        """El log del ajuste de stock se encola y se escribe al hacer commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            # El catálogo también encola registros en la misma transacción
+            self.create_catalog(count=1)
+            stock = Stock.objects.get(product=self.products[0], warehouse=self.warehouse)
+            stock.quantity = 4
+            stock.save()
+            assert not AuditLog.objects.filter(action='STOCK_MOVEMENT').exists()
+
+        trace = InventoryTrace.objects.get(movement_type='STOCK_ADJUSTMENT')
+        assert (trace.stock_before, trace.quantity, trace.stock_after) == (10, -6, 4)
+        assert AuditLog.objects.filter(action='STOCK_MOVEMENT', object_id=str(trace.pk)).exists()
+
+    def test_failed_batch_is_logged(self):
+        """Un error al guardar el lote se registra en el log y no interrumpe la operación"""
+        self.create_catalog(count=1)
+        trace = InventoryTrace(
+            movement_type='STOCK_ADJUSTMENT', product=self.products[0], warehouse=None,
+            quantity=1, stock_before=10, stock_after=11,
+        )
+
+        with self.assertLogs('audit.utils', level='ERROR'):
+            assert create_inventory_traces([trace]) == []
+        assert not InventoryTrace.objects.exists()
+
+
+@override_settings(AUDIT_DISABLE_SIGNALS=False)
+class AuditSnapshotTests(TestCase):
+    """Pruebas para el cálculo de cambios en memoria"""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name="Original", slug="original")
+
+    def test_update_does_not_refetch_instance(self):
+        """Actualizar no vuelve a consultar la instancia antes de guardar"""
+        category = Category.objects.get(pk=self.category.pk)
+        category.name = "Cambiado"
+        with CaptureQueriesContext(connection) as ctx:
+            category.save()
+
+        selects = [
+            q for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and '"catalog_category"' in q['sql']
+        ]
+        assert selects == []
+
+    def test_only_changed_fields_are_logged(self):
+        """Solo los campos modificados quedan en old_values/new_values"""
+        category = Category.objects.get(pk=self.category.pk)
+        category.name = "Cambiado"
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+
+        log = AuditLog.objects.filter(model_name='category', action='UPDATE').get()
+        assert log.old_values == {'name': 'Original'}
+        assert log.new_values == {'name': 'Cambiado'}
+
+    def test_consecutive_saves_diff_against_last_save(self):
+        """Cada guardado se compara contra el estado persistido anterior"""
+        category = Category.objects.get(pk=self.category.pk)
+        category.name = "Primero"
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+        category.name = "Segundo"
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+
+        log = AuditLog.objects.filter(model_name='category', action='UPDATE').order_by('-id').first()
+        assert log.old_values == {'name': 'Primero'}
+        assert log.new_values == {'name': 'Segundo'}
+
+
+@override_settings(AUDIT_DISABLE_SIGNALS=False)
+class AuditConfigRegistryTests(TestCase):
+    """Pruebas para el registro en memoria de configuraciones"""
+
+    def setUp(self):
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.content_type = ContentType.objects.get_for_model(Category)
+
+    def test_saves_do_not_query_configuration(self):
+        """Después de la primera carga no se consulta AuditConfiguration"""
+        AuditConfiguration.objects.create(content_type=self.content_type)
+        Category.objects.create(name="Cat 1", slug="cat-1")
+
+        with CaptureQueriesContext(connection) as ctx:
+            Category.objects.create(name="Cat 2", slug="cat-2")
+
+        assert not any('audit_auditconfiguration' in q['sql'] for q in ctx.captured_queries)
+
+    def test_configuration_change_invalidates_registry(self):
+        """Deshabilitar la configuración se aplica de inmediato"""
+        config = AuditConfiguration.objects.create(content_type=self.content_type)
+        assert registry.get(Category).is_enabled
+
+        config.is_enabled = False
+        config.save()
+
+        assert registry.get(Category).is_enabled is False
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Cat 1", slug="cat-1")
+        assert not AuditLog.objects.filter(model_name='category').exists()
+
+    def test_missing_configuration_uses_defaults(self):
+        """Sin configuración la auditoría queda habilitada"""
+        assert registry.get(Category) is None
+        assert is_audit_enabled_for_model(Category)
+
+
+@override_settings(AUDIT_DISABLE_SIGNALS=False, AUDIT_ASYNC=True)
+class AuditSpoolTests(TestCase):
+    """Pruebas para el modo asíncrono con cola local"""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        settings_override = override_settings(
+            AUDIT_SPOOL_PATH=os.path.join(tmpdir.name, 'spool.sqlite3')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_events_are_spooled_and_drained(self):
+        """Los registros van al spool y el worker los inserta"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Cat 1", slug="cat-1")
+            Category.objects.create(name="Cat 2", slug="cat-2")
+
+        assert not AuditLog.objects.filter(model_name='category').exists()
+        assert spool.get_stats()['pending'] == 2
+
+        call_command('audit_worker', once=True, stdout=StringIO())
+
+        assert AuditLog.objects.filter(model_name='category').count() == 2
+        assert spool.get_stats()['pending'] == 0
+
+    def test_invalid_event_goes_to_dead_letters(self):
+        """Un evento que no se puede insertar no bloquea el resto del lote"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Cat 1", slug="cat-1")
+        spool._get_connection().execute(
+            'INSERT INTO audit_events (payload, enqueued_at) VALUES (?, ?)', ('{"bogus": 1}', 0)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Cat 2", slug="cat-2")
+
+        assert spool.drain() == 3
+
+        assert AuditLog.objects.filter(model_name='category').count() == 2
+        stats = spool.get_stats()
+        assert (stats['pending'], stats['dead_letters']) == (0, 1)
+        payload, error = spool._get_connection().execute(
+            'SELECT payload, error FROM audit_dead_letters'
+        ).fetchone()
+        assert payload == '{"bogus": 1}' and 'bogus' in error
+
+    def test_backpressure_falls_back_to_database(self):
+        """Con el spool saturado se escribe directamente en la base de datos"""
+        with override_settings(AUDIT_SPOOL_MAX_PENDING=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                Category.objects.create(name="Cat 1", slug="cat-1")
+
+        assert AuditLog.objects.filter(model_name='category').count() == 1
+        assert spool.get_stats()['pending'] == 0
+
+    @override_settings(AUDIT_BUFFER_SIZE=2)
+    def test_long_transaction_flushes_full_chunks(self):
+        """En una transacción larga cada lote completo se escribe sin esperar al commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                Category.objects.create(name=f"Cat {i}", slug=f"cat-{i}")
+            assert AuditLog.objects.filter(model_name='category').count() == 4
+
+        assert spool.get_stats()['pending'] == 1
@@ -0,0 +1,602 @@
+"""
+Pruebas para el catálogo y sus APIs
+"""
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image as PILImage
+
+from catalog import facets, images
+from catalog.cart import SESSION_KEY
+from catalog.context_processors import cart as cart_context
+from catalog.models import (
+    Product, Category, Brand, Cart, CartItem, ImageDerivative, ProductFacetCount, ProductImage, ProductSearchTerm,
+)
+from catalog.search import search_products
+from inventory.models import ProductStockSummary, Stock, StockMovement, Warehouse
+
+
+class CatalogTestMixin:
+    """Datos base para las pruebas del catálogo"""
+
+    def create_catalog(self, count=3):
+        self.category = Category.objects.create(name="Suplementos", slug="suplementos")
+        self.brand = Brand.objects.create(name="Natural", slug="natural")
+        self.warehouse = Warehouse.objects.create(
+            name="Principal", code="PRI", address="Calle 1", city="Medellín", is_main=True
+        )
+        self.other_warehouse = Warehouse.objects.create(
+            name="Sucursal", code="SUC", address="Calle 2", city="Medellín"
+        )
+        self.products = []
+        for i in range(count):
+            product = Product.objects.create(
+                name=f"Producto {i}",
+                description="Descripción",
+                sku=f"SKU{i:03d}",
+                price=10000,
+                cost_price=6000,
+                category=self.category,
+                brand=self.brand,
+            )
+            Stock.objects.create(product=product, warehouse=self.warehouse, quantity=10 + i)
+            Stock.objects.create(product=product, warehouse=self.other_warehouse, quantity=5)
+            self.products.append(product)
+
+
+class ProductStockTotalsTests(CatalogTestMixin, TestCase):
+    """Pruebas para Product.objects.with_stock_totals()"""
+
+    def setUp(self):
+        self.create_catalog()
+        self.user = User.objects.create_user(username='pos', password='testpass123', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_annotates_total_and_warehouse_stock(self):
+        """El stock total y por bodega se obtienen en una sola consulta"""
+        with self.assertNumQueries(1):
+            products = list(
+                Product.objects.with_stock_totals(warehouse=self.warehouse).order_by('sku')
+            )
+
+        assert [p.total_stock for p in products] == [15, 16, 17]
+        assert [p.warehouse_stock for p in products] == [10, 11, 12]
+        assert products[0].main_image_url is None
+
+    def test_product_list_api_query_count_is_constant(self):
+        """La API del POS no hace consultas por producto"""
+        url = reverse('catalog:api_products')
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url)
+        assert response.status_code == 200
+        assert {item['stock'] for item in response.json()} == {15, 16, 17}
+
+        for i in range(3, 10):
+            product = Product.objects.create(
+                name=f"Producto {i}", description="Descripción", sku=f"SKU{i:03d}",
+                price=10000, cost_price=6000, category=self.category, brand=self.brand,
+            )
+            Stock.objects.create(product=product, warehouse=self.warehouse, quantity=1)
+
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        assert len(response.json()) == 10
+        assert len(large.captured_queries) == len(small.captured_queries)
+
+
+class ProductStockSummaryTests(CatalogTestMixin, TestCase):
+    """Pruebas para el resumen de stock desnormalizado"""
+
+    def setUp(self):
+        self.create_catalog(count=1)
+        self.product = self.products[0]
+        self.user = User.objects.create_user(username='bodega', password='testpass123')
+
+    def test_summary_follows_stock_changes(self):
+        """El resumen se actualiza al crear, modificar y eliminar stock"""
+        summary = ProductStockSummary.objects.get(product=self.product)
+        assert summary.total_quantity == 15
+        assert summary.warehouses_with_stock == 2
+
+        stock = Stock.objects.get(product=self.product, warehouse=self.other_warehouse)
+        stock.quantity = 0
+        stock.save()
+        summary.refresh_from_db()
+        assert summary.total_quantity == 10
+        assert summary.warehouses_with_stock == 1
+        assert summary.is_low_stock
+
+        stock.delete()
+        summary.refresh_from_db()
+        assert summary.total_quantity == 10
+        assert not summary.is_low_stock
+
+    def test_summary_follows_stock_movements(self):
+        """Los movimientos de stock actualizan el resumen"""
+        StockMovement.objects.create(
+            product=self.product, warehouse=self.warehouse, movement_type='out',
+            quantity=-4, user=self.user,
+        )
+        assert Product.objects.with_stock_totals().get(pk=self.product.pk).total_stock == 11
+
+    def test_rebuild_command(self):
+        """rebuild_stock_summary recalcula resúmenes borrados"""
+        ProductStockSummary.objects.all().delete()
+        call_command('rebuild_stock_summary', stdout=StringIO())
+        assert ProductStockSummary.objects.get(product=self.product).total_quantity == 15
+
+    def test_deleting_product_removes_summary(self):
+        """Eliminar un producto elimina su resumen sin recrearlo"""
+        self.product.delete()
+        assert not ProductStockSummary.objects.exists()
+
+
+class ProductSearchTests(CatalogTestMixin, TestCase):
+    """Pruebas para el índice de búsqueda de productos"""
+
+    def setUp(self):
+        self.create_catalog(count=1)
+        self.protein = Product.objects.create(
+            name="Proteína Vegetal", description="Polvo de arveja", sku="PRT-100",
+            barcode="7701234567890", price=50000, cost_price=30000,
+            category=self.category, brand=self.brand,
+        )
+        self.bar = Product.objects.create(
+            name="Barra energética", description="Con proteína de suero", sku="BAR-200",
+            price=5000, cost_price=3000, category=self.category, brand=self.brand,
+        )
+
+    def search(self, query):
+        return list(search_products(Product.objects.all(), query).order_by('-search_rank', 'name'))
+
+    def test_accents_plurals_and_prefixes(self):
+        """La búsqueda ignora tildes y plurales y acepta prefijos"""
+        assert self.search('proteinas') == [self.protein, self.bar]
+        assert self.search('PROTEÍ') == [self.protein, self.bar]
+        assert self.search('prot veg') == [self.protein]
+        assert self.search('de la') == []
+
+    def test_overlapping_terms(self):
+        """Un término que es prefijo de otro de la consulta no descarta el producto"""
+        assert self.search('prot proteina') == [self.protein, self.bar]
+        assert self.search('vegetal veg prot') == [self.protein]
+
+    def test_codes_match_whole_and_by_parts(self):
+        """El SKU y el código de barras se encuentran completos o por partes"""
+        assert self.search('prt-100') == [self.protein]
+        assert self.search('7701234567890') == [self.protein]
+        assert self.search('200') == [self.bar]
+
+    def test_index_follows_product_and_brand_changes(self):
+        """El índice se actualiza al guardar el producto y su marca"""
+        self.bar.name = "Barra de avena"
+        self.bar.save()
+        assert self.search('avena') == [self.bar]
+        assert self.search('energetica') == []
+
+        self.brand.name = "Orgánicos"
+        self.brand.save()
+        assert self.bar in self.search('organico')
+
+    def test_rebuild_command(self):
+        """rebuild_search_index recrea los términos borrados"""
+        ProductSearchTerm.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        assert self.search('vegetal') == [self.protein]
+
+    def test_views_use_search_service(self):
+        """Las vistas y APIs de búsqueda usan el índice"""
+        response = self.client.get(reverse('catalog:product_search'), {'q': 'proteinas'})
+        assert list(response.context['products']) == [self.protein, self.bar]
+
+        response = self.client.get(reverse('catalog:api_products'), {'search': 'vegetal'})
+        assert [item['id'] for item in response.json()] == [self.protein.id]
+
+
+class CartServiceTests(CatalogTestMixin, TestCase):
+    """Pruebas para catalog.cart.CartService y el contador del encabezado"""
+
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+
+    def add(self, product, quantity=1):
+        return self.client.post(
+            reverse('catalog:cart_add', args=[product.pk]),
+            {'quantity': quantity},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+
+    def context_for_client(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = self.client.session
+        request.session.get(SESSION_KEY)
+        return request
+
+    def test_pages_do_not_create_carts(self):
+        """Visitar páginas no crea carritos para sesiones anónimas"""
+        self.client.get(reverse('catalog:cart'))
+        self.client.get(reverse('catalog:cart'), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        assert Cart.objects.count() == 0
+
+    def test_add_updates_cached_summary(self):
+        """Agregar productos devuelve y cachea la cantidad y el total"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add(self.products[0], 2)
+            response = self.add(self.products[1])
+
+        data = response.json()
+        assert data['cart_items_count'] == 3
+        assert data['cart_total'] == 30000.0
+        assert Cart.objects.count() == 1
+
+        request = self.context_for_client()
+        with self.assertNumQueries(0):
+            context = cart_context(request)
+            assert context['cart_items_count'] == 3
+            assert context['cart_total'] == Decimal('30000.00')
+
+    def test_summary_follows_item_and_price_changes(self):
+        """Los cambios fuera del servicio invalidan el resumen en caché"""
+        self.add(self.products[0], 2)
+        cart = Cart.objects.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].price = 12000
+            self.products[0].save()
+        assert cart.total_amount == Decimal('24000.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.filter(cart=cart).delete()
+        assert cart.total_items == 0
+
+    def test_cannot_modify_items_of_other_carts(self):
+        """Las vistas solo modifican items del carrito del visitante"""
+        other = Cart.objects.create(session_key='otra')
+        item = CartItem.objects.create(cart=other, product=self.products[0], quantity=1)
+
+        response = self.client.post(reverse('catalog:cart_remove', args=[item.pk]))
+
+        assert response.status_code == 404
+        assert CartItem.objects.filter(pk=item.pk).exists()
+
+    def test_login_merges_session_cart(self):
+        """Al iniciar sesión el carrito anónimo se suma al del usuario"""
+        user = User.objects.create_user(username='cliente', password='testpass123')
+        user_cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=user_cart, product=self.products[0], quantity=1)
+        self.add(self.products[0], 2)
+        self.add(self.products[1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('catalog:login'), {'username': 'cliente', 'password': 'testpass123'}
+            )
+
+        assert list(Cart.objects.values_list('pk', flat=True)) == [user_cart.pk]
+        quantities = dict(user_cart.items.values_list('product_id', 'quantity'))
+        assert quantities == {self.products[0].pk: 3, self.products[1].pk: 1}
+        response = self.client.get(reverse('catalog:cart'), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        assert response.json()['cart_items_count'] == 4
+
+
+class CatalogFragmentCacheTests(CatalogTestMixin, TestCase):
+    """Pruebas para la caché de fragmentos del catálogo (catalog.fragments)"""
+
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+
+    def catalog_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        assert response.status_code == 200
+        return [
+            query['sql'] for query in queries.captured_queries
+            if 'catalog_product' in query['sql'] or 'catalog_category' in query['sql']
+        ]
+
+    def test_repeated_pages_are_served_from_cache(self):
+        """La segunda visita al home y al detalle no consulta el catálogo"""
+        urls = [
+            reverse('catalog:home'),
+            reverse('catalog:product_detail', args=[self.products[0].slug]),
+        ]
+        for url in urls:
+            assert self.catalog_queries(url)
+            assert self.catalog_queries(url) == []
+
+    def test_product_list_sidebar_is_cached(self):
+        """En el listado solo se consulta la página de productos"""
+        url = reverse('catalog:product_list')
+        first = self.catalog_queries(url)
+        second = self.catalog_queries(url)
+
+        assert len(second) < len(first)
+        assert not any('FROM "catalog_category"' in sql or 'MIN(' in sql for sql in second)
+
+    def test_catalog_changes_invalidate_fragments(self):
+        """Guardar un producto descarta los fragmentos en caché"""
+        url = reverse('catalog:product_detail', args=[self.products[0].slug])
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].name = "Producto renombrado"
+            self.products[0].save()
+
+        response = self.client.get(url)
+        assert response.context['product'].name == "Producto renombrado"
+
+    def test_missing_product_is_not_cached(self):
+        """Un slug inexistente responde 404 sin guardar nada en caché"""
+        response = self.client.get(reverse('catalog:product_detail', args=['no-existe']))
+        assert response.status_code == 404
+
+
+@override_settings(CATALOG_PRICE_BUCKETS=(8000, 50000))
+class ProductFacetCountTests(CatalogTestMixin, TestCase):
+    """Pruebas para los conteos de filtros (catalog.facets)"""
+
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.other_brand = Brand.objects.create(name="Otra", slug="otra")
+        self.cheap = Product.objects.create(
+            name="Barato", description="Descripción", sku="BAR001", price=5000,
+            cost_price=2000, category=self.category, brand=self.other_brand,
+        )
+
+    def cells(self):
+        return {
+            (category_id, brand_id, bucket): count
+            for category_id, brand_id, bucket, count in ProductFacetCount.objects.filter(
+                product_count__gt=0
+            ).values_list('category_id', 'brand_id', 'price_bucket', 'product_count')
+        }
+
+    def test_counts_follow_product_changes(self):
+        """Guardar, desactivar y eliminar productos mueve los conteos"""
+        mid = facets.price_bucket(10000)
+        low = facets.price_bucket(5000)
+        assert self.cells() == {
+            (self.category.pk, self.brand.pk, mid): 3,
+            (self.category.pk, self.other_brand.pk, low): 1,
+        }
+
+        self.products[0].price = 5000
+        self.products[0].save()
+        self.products[1].is_active = False
+        self.products[1].save()
+        self.products[2].delete()
+
+        assert self.cells() == {(self.category.pk, self.other_brand.pk, low): 1, (self.category.pk, self.brand.pk, low): 1}
+
+        facets.rebuild()
+        assert self.cells() == {(self.category.pk, self.other_brand.pk, low): 1, (self.category.pk, self.brand.pk, low): 1}
+
+    def test_consecutive_saves_use_loaded_values(self):
+        """La celda anterior sale de los valores cargados o del último guardado"""
+        mid = facets.price_bucket(10000)
+        low = facets.price_bucket(5000)
+        product = Product.objects.get(pk=self.products[0].pk)
+        assert product._facet_values == (self.category.pk, self.brand.pk, product.price, True)
+
+        product.price = 5000
+        product.save()
+        product.brand = self.other_brand
+        product.save()
+        deferred = Product.objects.only('pk', 'name').get(pk=self.products[1].pk)
+        deferred.is_active = False
+        deferred.save()
+
+        assert self.cells() == {
+            (self.category.pk, self.brand.pk, mid): 1,
+            (self.category.pk, self.other_brand.pk, low): 2,
+        }
+
+    def test_counts_ignore_own_facet_filter(self):
+        """Cada faceta se cuenta con los filtros de las demás"""
+        counts = facets.facet_counts(brand_id=self.brand.pk)
+
+        assert counts['total'] == 3
+        assert counts['brands'] == {self.brand.pk: 3, self.other_brand.pk: 1}
+        assert counts['categories'] == {self.category.pk: 3}
+        assert counts['price_buckets'] == {facets.price_bucket(10000): 3}
+
+    def test_product_list_shows_counts_without_counting_queries(self):
+        """El listado muestra los conteos y filtra por rango de precio"""
+        low = facets.price_bucket(5000)
+        url = reverse('catalog:product_list')
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'price_bucket': low})
+
+        assert [product.pk for product in response.context['products']] == [self.cheap.pk]
+        brand_counts = {facet['brand'].pk: facet['count'] for facet in response.context['brand_facets']}
+        assert brand_counts == {self.brand.pk: 0, self.other_brand.pk: 1}
+        assert not any('catalog_productfacetcount' in query['sql'] for query in queries.captured_queries)
+
+
+class ImageDerivativeTests(CatalogTestMixin, TestCase):
+    """Pruebas para las miniaturas de imágenes (catalog.images)"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.create_catalog(count=1)
+
+    def upload(self, name='foto.png', size=(800, 600), content=None):
+        if content is None:
+            buffer = BytesIO()
+            PILImage.new('RGBA', size, (200, 50, 50, 128)).save(buffer, 'PNG')
+            content = buffer.getvalue()
+        with self.captureOnCommitCallbacks(execute=True):
+            return ProductImage.objects.create(
+                product=self.products[0], image=SimpleUploadedFile(name, content), is_primary=True
+            )
+
+    def test_upload_is_queued_and_worker_generates_sizes(self):
+        """Al subir una imagen se encola y el worker genera WebP y JPEG"""
+        product_image = self.upload()
+        source = product_image.image.name
+        assert ImageDerivative.objects.get(source=source).status == 'pending'
+        assert images.image_set(source)['srcset_webp'] == ''
+
+        call_command('image_worker', '--once', stdout=StringIO())
+
+        record = ImageDerivative.objects.get(source=source)
+        assert record.status == 'completed'
+        assert record.original_width == 800
+        assert record.widths == [160, 320, 640]
+        for width in record.widths:
+            for extension in ('webp', 'jpg'):
+                name = images.derivative_name(source, width, extension)
+                assert default_storage.exists(name)
+        with default_storage.open(images.derivative_name(source, 320, 'jpg')) as file:
+            assert PILImage.open(file).size == (320, 240)
+
+        variants = images.image_set(source)
+        assert variants['thumbnail'].endswith('/derivatives/foto/320w.webp')
+        assert variants['srcset_webp'].count('w,') == 3
+        assert variants['srcset_jpeg'].endswith(f'{product_image.image.url} 800w')
+
+    def test_invalid_image_is_marked_failed(self):
+        """Un archivo que no es imagen queda fallido sin detener el worker"""
+        product_image = self.upload(name='roto.png', content=b'no es una imagen')
+        assert images.run_pending() == 1
+
+        record = ImageDerivative.objects.get(source=product_image.image.name)
+        assert record.status == 'failed'
+        assert record.error_message
+        assert images.image_set(product_image.image.name)['thumbnail'] == product_image.image.url
+
+    def test_backfill_and_api_thumbnails(self):
+        """El comando de backfill encola imágenes existentes y la API expone la miniatura"""
+        product_image = self.upload()
+        ImageDerivative.objects.all().delete()
+
+        call_command('generate_image_derivatives', '--run', stdout=StringIO())
+
+        assert ImageDerivative.objects.get(source=product_image.image.name).status == 'completed'
+        response = self.client.get(reverse('catalog:api_products'))
+        data = response.json()
+        assert data[0]['thumbnail'].endswith('/derivatives/foto/320w.webp')
+        assert data[0]['image'] == product_image.image.url
+
+
+class ProductPrimaryImageTests(CatalogTestMixin, TestCase):
+    """Pruebas para el puntero desnormalizado Product.primary_image"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.create_catalog()
+        self.user = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.client.force_login(self.user)
+
+    def add_image(self, product, name, **kwargs):
+        return ProductImage.objects.create(
+            product=product, image=SimpleUploadedFile(name, b'imagen'), **kwargs
+        )
+
+    def test_pointer_follows_image_changes(self):
+        """Agregar, marcar como principal y eliminar imágenes actualiza el puntero"""
+        product = self.products[0]
+        first = self.add_image(product, 'a.jpg', order=1)
+        product.refresh_from_db()
+        assert product.primary_image_id == first.pk
+
+        second = self.add_image(product, 'b.jpg', order=2, is_primary=True)
+        product.refresh_from_db()
+        assert product.primary_image_id == second.pk
+
+        # Guardar una instancia cargada antes no pisa el puntero
+        stale = Product.objects.get(pk=product.pk)
+        second.delete()
+        with CaptureQueriesContext(connection) as ctx:
+            stale.save()
+        # El puntero se corrige con un UPDATE, sin leer las imágenes
+        assert not any(
+            query['sql'].startswith('SELECT') and 'catalog_productimage' in query['sql']
+            for query in ctx.captured_queries
+        )
+        product.refresh_from_db()
+        assert product.primary_image_id == first.pk
+        stale.save(update_fields=['name', 'primary_image'])
+        product.refresh_from_db()
+        assert product.primary_image_id == first.pk
+
+        first.delete()
+        product.refresh_from_db()
+        assert product.primary_image_id is None
+
+    def test_deferred_save_does_not_load_fields(self):
+        """Guardar un producto con campos diferidos solo escribe los cargados"""
+        product = Product.objects.only('pk', 'name').get(pk=self.products[0].pk)
+        product.name = "Renombrado"
+        with CaptureQueriesContext(connection) as ctx:
+            product.save()
+
+        updates = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('UPDATE "catalog_product"')]
+        assert len(updates) == 1
+        assert '"name"' in updates[0] and '"description"' not in updates[0]
+        assert Product.objects.get(pk=product.pk).name == "Renombrado"
+
+    def test_main_image_without_extra_queries(self):
+        """La imagen principal sale del prefetch o del puntero sin consultas por producto"""
+        for i, product in enumerate(self.products):
+            self.add_image(product, f'p{i}a.jpg', order=1)
+            self.add_image(product, f'p{i}b.jpg', order=2, is_primary=True)
+
+        products = list(Product.objects.select_related('primary_image'))
+        prefetched = list(Product.objects.prefetch_related('images'))
+        with self.assertNumQueries(0):
+            assert {p.get_main_image().image.name for p in products} == {
+                p.get_main_image().image.name for p in prefetched
+            }
+            assert all(p.get_main_image().is_primary for p in products)
+
+    def test_products_with_stock_api_query_count_is_constant(self):
+        """La API de productos por bodega no consulta imágenes ni stock por producto"""
+        for i, product in enumerate(self.products):
+            self.add_image(product, f'p{i}.jpg')
+        url = reverse('custom_admin:api_products_with_stock')
+
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url, {'warehouse': self.warehouse.pk})
+        data = response.json()['products']
+        assert sorted(item['stock'] for item in data) == [10, 11, 12]
+        assert all(item['image'] for item in data)
+
+        for i in range(3, 8):
+            product = Product.objects.create(
+                name=f"Producto {i}", description="Descripción", sku=f"SKU{i:03d}",
+                price=10000, cost_price=6000, category=self.category, brand=self.brand,
+            )
+            Stock.objects.create(product=product, warehouse=self.warehouse, quantity=1)
+            self.add_image(product, f'p{i}.jpg')
+
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url, {'warehouse': self.warehouse.pk})
+        assert len(response.json()['products']) == 8
+        assert len(large.captured_queries) == len(small.captured_queries)
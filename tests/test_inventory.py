@@ -0,0 +1,351 @@
+"""
+Pruebas para el registro de movimientos de inventario
+"""
+from datetime import datetime, time, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from audit.models import InventoryTrace
+from catalog.models import Product
+from inventory.ledger import InsufficientStockError, post_movements
+from inventory.models import (
+    ProductStockSummary, Stock, StockMovement, StockSnapshot, StockTransfer, StockTransferItem, Warehouse,
+)
+from inventory.snapshots import stock_as_of, stocks_as_of, take_snapshot
+from inventory.transfers import TransferError, complete_transfer
+from pos.models import POSSession
+from pos.services import create_sale
+from tests.test_catalog import CatalogTestMixin
+
+
+class PostMovementsTests(CatalogTestMixin, TestCase):
+    """Pruebas para inventory.ledger.post_movements"""
+
+    def setUp(self):
+        self.create_catalog()
+        self.user = User.objects.create_user(username='bodega', password='testpass123', is_staff=True)
+
+    def movement(self, product, warehouse, quantity, movement_type='adjustment'):
+        return StockMovement(
+            product=product, warehouse=warehouse, movement_type=movement_type,
+            quantity=quantity, reference='Prueba', user=self.user,
+        )
+
+    def quantity(self, product, warehouse):
+        return Stock.objects.get(product=product, warehouse=warehouse).quantity
+
+    def test_posts_ledger_rows_and_net_deltas(self):
+        """Se guardan todos los movimientos y el stock recibe el neto por bodega"""
+        product = self.products[0]
+        post_movements([
+            self.movement(product, self.warehouse, 4, 'in'),
+            self.movement(product, self.warehouse, -6, 'out'),
+            self.movement(product, self.other_warehouse, 3, 'in'),
+        ])
+
+        assert StockMovement.objects.count() == 3
+        assert self.quantity(product, self.warehouse) == 8
+        assert self.quantity(product, self.other_warehouse) == 8
+        assert ProductStockSummary.objects.get(product=product).total_quantity == 16
+
+    def test_creates_missing_stock_rows(self):
+        """Una entrada en una bodega sin stock crea la fila"""
+        warehouse = Warehouse.objects.create(name="Nueva", code="NUE", address="Calle 3", city="Cali")
+        post_movements([self.movement(self.products[0], warehouse, 7, 'in')])
+
+        assert self.quantity(self.products[0], warehouse) == 7
+
+    def test_insufficient_stock_writes_nothing(self):
+        """Si una salida deja stock negativo no se aplica ningún movimiento"""
+        with self.assertRaises(InsufficientStockError) as ctx:
+            post_movements([
+                self.movement(self.products[0], self.warehouse, -5, 'out'),
+                self.movement(self.products[1], self.other_warehouse, -6, 'out'),
+            ])
+
+        assert ctx.exception.failed_items == [{
+            'product_id': self.products[1].pk,
+            'warehouse_id': self.other_warehouse.pk,
+            'requested': 6,
+            'available': 5,
+        }]
+        assert not StockMovement.objects.exists()
+        assert self.quantity(self.products[0], self.warehouse) == 10
+
+    def test_insufficient_stock_does_not_depend_on_timestamps(self):
+        """Una fila sin aplicar se detecta aunque ya lleve la misma marca de tiempo"""
+        now = timezone.now()
+        Stock.objects.update(updated_at=now)
+        with mock.patch('inventory.ledger.timezone.now', return_value=now):
+            with self.assertRaises(InsufficientStockError) as ctx:
+                post_movements([
+                    self.movement(self.products[0], self.warehouse, -5, 'out'),
+                    self.movement(self.products[1], self.other_warehouse, -6, 'out'),
+                ])
+
+        assert [item['product_id'] for item in ctx.exception.failed_items] == [self.products[1].pk]
+        assert self.quantity(self.products[0], self.warehouse) == 10
+
+    def test_query_count_does_not_depend_on_lines(self):
+        """Un documento se registra con el mismo número de consultas sin importar sus líneas"""
+        with CaptureQueriesContext(connection) as small:
+            post_movements([self.movement(self.products[0], self.warehouse, 1, 'in')])
+
+        with CaptureQueriesContext(connection) as large:
+            post_movements([
+                self.movement(product, warehouse, 1, 'in')
+                for product in self.products
+                for warehouse in (self.warehouse, self.other_warehouse)
+            ])
+
+        assert len(large.captured_queries) == len(small.captured_queries)
+        assert self.quantity(self.products[2], self.other_warehouse) == 6
+
+    def test_saving_a_movement_posts_it(self):
+        """StockMovement.save pasa por el mismo registro"""
+        movement = StockMovement.objects.create(
+            product=self.products[0], warehouse=self.warehouse, movement_type='out',
+            quantity=-3, user=self.user,
+        )
+
+        assert movement.pk is not None
+        assert self.quantity(self.products[0], self.warehouse) == 7
+
+    def test_saving_a_movement_sends_signals(self):
+        """StockMovement.save guarda la fila con sus señales y se deshace si no hay stock"""
+        saved = []
+
+        def receiver(sender, instance, created, **kwargs):
+            saved.append((instance.pk, created))
+
+        post_save.connect(receiver, sender=StockMovement)
+        try:
+            movement = StockMovement.objects.create(
+                product=self.products[0], warehouse=self.warehouse, movement_type='in',
+                quantity=2, user=self.user,
+            )
+            with self.assertRaises(InsufficientStockError):
+                StockMovement.objects.create(
+                    product=self.products[0], warehouse=self.warehouse, movement_type='out',
+                    quantity=-50, user=self.user,
+                )
+        finally:
+            post_save.disconnect(receiver, sender=StockMovement)
+
+        assert saved[0] == (movement.pk, True)
+        assert list(StockMovement.objects.values_list('pk', flat=True)) == [movement.pk]
+        assert self.quantity(self.products[0], self.warehouse) == 12
+
+    def test_complete_transfer_moves_stock(self):
+        """Completar una transferencia descuenta el origen y suma al destino una sola vez"""
+        transfer = StockTransfer.objects.create(
+            from_warehouse=self.warehouse, to_warehouse=self.other_warehouse,
+            reference='TR-1', created_by=self.user,
+        )
+        StockTransferItem.objects.create(transfer=transfer, product=self.products[0], quantity=4)
+        self.client.force_login(self.user)
+
+        self.client.get(reverse('custom_admin:admin_complete_transfer', args=[transfer.pk]))
+
+        transfer.refresh_from_db()
+        assert transfer.status == 'completed'
+        assert self.quantity(self.products[0], self.warehouse) == 6
+        assert self.quantity(self.products[0], self.other_warehouse) == 9
+        assert StockMovement.objects.filter(reference='Transferencia TR-1').count() == 2
+
+    def test_complete_transfer_without_stock_stays_pending(self):
+        """Sin stock suficiente la transferencia queda pendiente y sin movimientos"""
+        transfer = StockTransfer.objects.create(
+            from_warehouse=self.other_warehouse, to_warehouse=self.warehouse,
+            reference='TR-2', created_by=self.user,
+        )
+        StockTransferItem.objects.create(transfer=transfer, product=self.products[0], quantity=50)
+        self.client.force_login(self.user)
+
+        self.client.get(reverse('custom_admin:admin_complete_transfer', args=[transfer.pk]))
+
+        transfer.refresh_from_db()
+        assert transfer.status == 'pending'
+        assert self.quantity(self.products[0], self.other_warehouse) == 5
+        assert not StockMovement.objects.exists()
+
+
+class CompleteTransferTests(CatalogTestMixin, TestCase):
+    """Pruebas para inventory.transfers.complete_transfer"""
+
+    def setUp(self):
+        self.create_catalog()
+        self.user = User.objects.create_user(username='bodega', password='testpass123')
+
+    def create_transfer(self, quantities, reference='TR-1'):
+        transfer = StockTransfer.objects.create(
+            from_warehouse=self.warehouse, to_warehouse=self.other_warehouse,
+            reference=reference, created_by=self.user,
+        )
+        StockTransferItem.objects.bulk_create([
+            StockTransferItem(transfer=transfer, product=product, quantity=quantity)
+            for product, quantity in quantities
+        ])
+        return StockTransfer.objects.select_related('from_warehouse', 'to_warehouse').get(pk=transfer.pk)
+
+    def add_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                name=f"Extra {i}", description="Descripción", sku=f"EXT{i:03d}",
+                price=10000, cost_price=6000, category=self.category, brand=self.brand,
+            )
+            Stock.objects.create(product=product, warehouse=self.warehouse, quantity=3)
+            self.products.append(product)
+
+    def test_moves_stock_and_records_traces(self):
+        """Cada línea descuenta el origen, suma al destino y deja su trazabilidad"""
+        transfer = complete_transfer(self.create_transfer([(self.products[0], 4)]), self.user)
+
+        assert transfer.status == 'completed'
+        assert StockTransfer.objects.get(pk=transfer.pk).status == 'completed'
+        assert Stock.objects.get(product=self.products[0], warehouse=self.warehouse).quantity == 6
+        assert Stock.objects.get(product=self.products[0], warehouse=self.other_warehouse).quantity == 9
+
+        traces = {trace.movement_type: trace for trace in InventoryTrace.objects.filter(stock_transfer=transfer)}
+        assert traces['STOCK_TRANSFER'].quantity == -4
+        assert (traces['STOCK_TRANSFER'].stock_before, traces['STOCK_TRANSFER'].stock_after) == (10, 6)
+        assert (traces['STOCK_TRANSFER_RECEIVE'].stock_before, traces['STOCK_TRANSFER_RECEIVE'].stock_after) == (5, 9)
+
+    def test_reports_every_failed_line(self):
+        """Las líneas sin stock se informan juntas y no se mueve nada"""
+        transfer = self.create_transfer([(self.products[0], 4), (self.products[1], 50), (self.products[2], 60)])
+
+        with self.assertRaises(TransferError) as ctx:
+            complete_transfer(transfer, self.user)
+
+        assert [failure['product_id'] for failure in ctx.exception.failed_items] == [
+            self.products[1].pk, self.products[2].pk,
+        ]
+        assert StockTransfer.objects.get(pk=transfer.pk).status == 'pending'
+        assert not StockMovement.objects.exists()
+        assert not InventoryTrace.objects.exists()
+
+    def test_traces_chain_balances_of_the_same_stock_row(self):
+        """Los movimientos sobre la misma fila de stock encadenan sus saldos"""
+        transfer = StockTransfer.objects.create(
+            from_warehouse=self.warehouse, to_warehouse=self.warehouse,
+            reference='TR-1', created_by=self.user,
+        )
+        StockTransferItem.objects.create(transfer=transfer, product=self.products[0], quantity=4)
+
+        complete_transfer(transfer, self.user)
+
+        traces = InventoryTrace.objects.filter(stock_transfer=transfer).order_by('pk')
+        assert [(trace.stock_before, trace.stock_after) for trace in traces] == [(10, 6), (6, 10)]
+        assert Stock.objects.get(product=self.products[0], warehouse=self.warehouse).quantity == 10
+
+    def test_cannot_complete_twice(self):
+        """Una transferencia ya completada no vuelve a mover stock"""
+        transfer = self.create_transfer([(self.products[0], 4)])
+        complete_transfer(transfer, self.user)
+
+        with self.assertRaises(TransferError):
+            complete_transfer(transfer, self.user)
+        assert Stock.objects.get(product=self.products[0], warehouse=self.warehouse).quantity == 6
+
+    def test_query_count_does_not_depend_on_lines(self):
+        """Completar una transferencia usa las mismas consultas sin importar sus líneas"""
+        small = self.create_transfer([(self.products[0], 1)], reference='TR-1')
+        self.add_products(10)
+        large = self.create_transfer([(product, 1) for product in self.products], reference='TR-2')
+
+        with CaptureQueriesContext(connection) as small_queries:
+            complete_transfer(small, self.user)
+        with CaptureQueriesContext(connection) as large_queries:
+            complete_transfer(large, self.user)
+
+        assert len(large_queries.captured_queries) == len(small_queries.captured_queries)
+        assert InventoryTrace.objects.filter(stock_transfer=large).count() == 26
+
+
+class StockSnapshotTests(CatalogTestMixin, TestCase):
+    """Pruebas para los saldos de stock y stock_as_of"""
+
+    def setUp(self):
+        self.create_catalog(count=1)
+        self.product = self.products[0]
+        self.user = User.objects.create_user(username='bodega', password='testpass123')
+        today = timezone.localdate()
+        self.day1 = today - timedelta(days=3)
+        self.day2 = today - timedelta(days=2)
+        self.day3 = today - timedelta(days=1)
+        # Stock inicial 10; +5 el día 1, -3 el día 2 y +2 el día 3: stock actual 14
+        for day, quantity in ((self.day1, 5), (self.day2, -3), (self.day3, 2)):
+            movement = StockMovement.objects.create(
+                product=self.product, warehouse=self.warehouse, movement_type='adjustment',
+                quantity=quantity, user=self.user,
+            )
+            StockMovement.objects.filter(pk=movement.pk).update(created_at=self.at(day, 10))
+
+    def at(self, day, hour):
+        return timezone.make_aware(datetime.combine(day, time(hour)))
+
+    def test_snapshot_stores_closing_balance(self):
+        """El saldo de cierre descuenta los movimientos posteriores al día"""
+        assert take_snapshot(self.day1) == 2
+
+        snapshot = StockSnapshot.objects.get(product=self.product, warehouse=self.warehouse, date=self.day1)
+        assert snapshot.quantity == 15
+        assert StockSnapshot.objects.get(warehouse=self.other_warehouse).quantity == 5
+
+    def test_stock_as_of_with_and_without_snapshots(self):
+        """El resultado es el mismo partiendo de un saldo o del stock actual"""
+        expected = {
+            self.at(self.day1, 9): 10,
+            self.at(self.day1, 12): 15,
+            self.at(self.day2, 12): 12,
+            self.at(self.day3, 12): 14,
+        }
+        for when, quantity in expected.items():
+            assert stock_as_of(self.product, self.warehouse, when) == quantity
+
+        take_snapshot(self.day1)
+        for when, quantity in expected.items():
+            assert stock_as_of(self.product, self.warehouse, when) == quantity
+            assert stocks_as_of(when, warehouse=self.warehouse) == {(self.product.pk, self.warehouse.pk): quantity}
+
+    def test_stock_as_of_reads_only_recent_movements(self):
+        """Con un saldo no se suman los movimientos anteriores a su cierre"""
+        take_snapshot(self.day2)
+        StockSnapshot.objects.filter(date=self.day2, warehouse=self.warehouse).update(quantity=100)
+
+        assert stock_as_of(self.product, self.warehouse, self.at(self.day3, 12)) == 102
+        with self.assertNumQueries(2):
+            stock_as_of(self.product.pk, self.warehouse.pk, self.at(self.day3, 12))
+
+    def test_command_snapshots_range(self):
+        """snapshot_stock guarda un saldo por día y par producto-bodega"""
+        call_command('snapshot_stock', date=str(self.day3), days=3, stdout=StringIO())
+
+        saved = dict(StockSnapshot.objects.filter(warehouse=self.warehouse).values_list('date', 'quantity'))
+        assert saved == {self.day1: 15, self.day2: 12, self.day3: 14}
+
+    def test_replays_pos_sales(self):
+        """Las ventas POS quedan en el registro y se reconstruyen hacia atrás"""
+        sale = create_sale(
+            POSSession.objects.create(user=self.user, warehouse=self.warehouse),
+            [{'product_id': self.product.pk, 'quantity': 4}],
+        )
+        StockMovement.objects.filter(reference=f'Venta POS {sale.sale_number}').update(
+            created_at=self.at(self.day3, 15)
+        )
+
+        assert stock_as_of(self.product, self.warehouse, self.at(self.day3, 12)) == 14
+        assert stock_as_of(self.product, self.warehouse, self.at(self.day3, 16)) == 10
+        take_snapshot(self.day2)
+        assert stock_as_of(self.product, self.warehouse, self.at(self.day3, 12)) == 14
+        assert stock_as_of(self.product, self.warehouse, self.at(self.day3, 16)) == 10
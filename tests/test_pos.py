@@ -0,0 +1,264 @@
+"""
+Pruebas para las ventas del POS
+"""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from audit.models import InventoryTrace
+from catalog.models import Product
+from inventory.models import DocumentSequence, ProductStockSummary, Stock, StockMovement
+from pos.models import POSSale, POSSaleItem, POSSession
+from pos.scanner import code_index
+from pos.services import SaleValidationError, create_sale
+from tests.test_catalog import CatalogTestMixin
+
+
+class POSSaleCreateTests(CatalogTestMixin, TestCase):
+    """Pruebas para la creación de ventas en lote"""
+
+    url = '/api/pos/sales/create/'
+
+    def setUp(self):
+        self.create_catalog(count=3)
+        self.user = User.objects.create_user(username='cajero', password='testpass123', is_staff=True)
+        self.client.force_login(self.user)
+        self.session = POSSession.objects.create(user=self.user, warehouse=self.warehouse)
+
+    def test_creates_sale_and_decrements_stock(self):
+        """La venta crea sus items, descuenta stock y actualiza la sesión"""
+        response = self.client.post(self.url, {
+            'order_type': 'principal',
+            'payment_method': 'cash',
+            'items': [
+                {'product_id': self.products[0].id, 'quantity': 2, 'unit_price': '1000'},
+                {'product_id': self.products[1].id, 'quantity': 3, 'unit_price': '2000'},
+            ],
+        }, content_type='application/json')
+
+        assert response.status_code == 201
+        data = response.json()
+        assert len(data['items']) == 2
+        assert Decimal(data['subtotal']) == Decimal('8000.00')
+        assert Decimal(data['total']) == Decimal('9520.00')
+
+        quantities = dict(
+            Stock.objects.filter(warehouse=self.warehouse).values_list('product_id', 'quantity')
+        )
+        assert quantities[self.products[0].id] == 8
+        assert quantities[self.products[1].id] == 8
+        assert quantities[self.products[2].id] == 12
+        assert ProductStockSummary.objects.get(product=self.products[0]).total_quantity == 13
+
+        sale = POSSale.objects.get()
+        movements = StockMovement.objects.filter(reference=f'Venta POS {sale.sale_number}')
+        assert dict(movements.values_list('product_id', 'quantity')) == {
+            self.products[0].id: -2, self.products[1].id: -3,
+        }
+        assert {movement.movement_type for movement in movements} == {'out'}
+
+        traces = {trace.product_id: trace for trace in InventoryTrace.objects.filter(pos_sale=sale)}
+        assert set(traces) == {self.products[0].id, self.products[1].id}
+        trace = traces[self.products[1].id]
+        assert trace.movement_type == 'SALE'
+        assert trace.pos_sale_item.quantity == 3
+        assert (trace.quantity, trace.stock_before, trace.stock_after) == (-3, 11, 8)
+
+        self.session.refresh_from_db()
+        assert self.session.total_transactions == 1
+        assert self.session.total_sales == Decimal('9520.00')
+
+    def test_failed_lines_are_reported_and_nothing_is_written(self):
+        """Si una línea falla se informan las líneas exactas y no se guarda nada"""
+        inactive = self.products[2]
+        Product.objects.filter(pk=inactive.pk).update(is_active=False)
+
+        response = self.client.post(self.url, {
+            'items': [
+                {'product_id': self.products[0].id, 'quantity': 1},
+                {'product_id': self.products[1].id, 'quantity': 50},
+                {'product_id': inactive.id, 'quantity': 1},
+            ],
+        }, content_type='application/json')
+
+        assert response.status_code == 400
+        failed = response.json()['failed_items']
+        assert [item['index'] for item in failed] == [1, 2]
+        assert failed[0]['requested'] == 50
+        assert failed[0]['available'] == 11
+
+        assert not POSSale.objects.exists()
+        assert Stock.objects.get(product=self.products[0], warehouse=self.warehouse).quantity == 10
+
+    def test_query_count_does_not_grow_with_lines(self):
+        """El número de consultas no depende del número de líneas"""
+        # La primera venta del día inicializa el consecutivo
+        create_sale(self.session, [{'product_id': self.products[0].id, 'quantity': 1}])
+
+        with CaptureQueriesContext(connection) as small:
+            create_sale(self.session, [{'product_id': self.products[0].id, 'quantity': 1}])
+
+        with CaptureQueriesContext(connection) as large:
+            create_sale(self.session, [
+                {'product_id': product.id, 'quantity': 1} for product in self.products
+            ])
+
+        assert len(large.captured_queries) == len(small.captured_queries)
+
+    def test_repeated_products_are_merged(self):
+        """Las líneas repetidas del mismo producto se agrupan en un item"""
+        sale = create_sale(self.session, [
+            {'product_id': self.products[0].id, 'quantity': 4},
+            {'product_id': self.products[0].id, 'quantity': 6},
+        ])
+
+        item = POSSaleItem.objects.get(sale=sale)
+        assert item.quantity == 10
+        assert Stock.objects.get(product=self.products[0], warehouse=self.warehouse).quantity == 0
+
+        with self.assertRaises(SaleValidationError) as ctx:
+            create_sale(self.session, [{'product_id': self.products[0].id, 'quantity': 1}])
+        assert ctx.exception.failed_items[0]['available'] == 0
+
+
+class DocumentNumberTests(CatalogTestMixin, TestCase):
+    """Pruebas para la numeración de ventas con DocumentSequence"""
+
+    def setUp(self):
+        self.create_catalog(count=1)
+        self.user = User.objects.create_user(username='cajero', password='testpass123')
+        self.session = POSSession.objects.create(user=self.user, warehouse=self.warehouse)
+
+    def create_sale(self, session=None, order_type='principal'):
+        return POSSale.objects.create(
+            session=session or self.session, order_type=order_type, payment_method='cash'
+        )
+
+    def test_numbers_are_consecutive_per_type(self):
+        """Cada tipo de orden tiene su propio consecutivo diario"""
+        first = self.create_sale()
+        second = self.create_sale()
+        auxiliar = self.create_sale(order_type='auxiliar')
+
+        assert first.sale_number.startswith('PR') and first.sale_number.endswith('0001')
+        assert second.sale_number.endswith('0002')
+        assert auxiliar.sale_number.startswith('AU') and auxiliar.sale_number.endswith('0001')
+
+    def test_sequence_continues_existing_numbers(self):
+        """El primer número del periodo continúa después de los existentes"""
+        sale = self.create_sale()
+        DocumentSequence.objects.all().delete()
+
+        assert self.create_sale().sale_number == sale.sale_number[:-4] + '0002'
+
+    def test_allocation_does_not_scan_sales(self):
+        """Generar un número no consulta la tabla de ventas"""
+        self.create_sale()
+        with CaptureQueriesContext(connection) as ctx:
+            self.create_sale()
+        assert not any(
+            'SELECT' in query['sql'] and '"pos_possale"' in query['sql']
+            for query in ctx.captured_queries
+        )
+
+    @override_settings(POS_NUMBER_BLOCK_SIZE=5)
+    def test_sessions_reserve_number_blocks(self):
+        """Con bloques, cada sesión numera desde su propio rango"""
+        other_user = User.objects.create_user(username='cajero2', password='testpass123')
+        other_session = POSSession.objects.create(user=other_user, warehouse=self.warehouse)
+
+        numbers = [
+            self.create_sale().sale_number,
+            self.create_sale(session=other_session).sale_number,
+            self.create_sale().sale_number,
+        ]
+
+        assert [number[-4:] for number in numbers] == ['0001', '0006', '0002']
+        assert DocumentSequence.objects.get(prefix='POS-PR').last_value == 10
+
+
+class ProductCodeIndexTests(CatalogTestMixin, TestCase):
+    """Pruebas para la resolución de códigos del escáner"""
+
+    def setUp(self):
+        cache.clear()
+        self.create_catalog(count=2)
+        Product.objects.filter(pk=self.products[0].pk).update(barcode='7701234567890')
+        self.user = User.objects.create_user(username='cajero', password='testpass123', is_staff=True)
+        self.client.force_login(self.user)
+        code_index.warm()
+
+    def test_resolves_barcode_and_sku_without_queries(self):
+        """Con el índice cargado y el stock en caché, un escaneo no consulta la base de datos"""
+        code_index.resolve_many(['7701234567890', 'SKU001'])
+        with self.assertNumQueries(0):
+            product = code_index.resolve(' 7701234567890 ')
+            by_sku = code_index.resolve('sku001')
+
+        assert product['stock'] == 10
+        assert product['stock_by_warehouse'] == {self.warehouse.id: 10, self.other_warehouse.id: 5}
+        assert by_sku['id'] == self.products[1].id
+        assert code_index.resolve('NOEXISTE') is None
+
+    def test_stock_changes_invalidate_cached_stock(self):
+        """Un cambio de stock confirmado se refleja en el siguiente escaneo"""
+        assert code_index.resolve('SKU000')['stock'] == 10
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.filter(product=self.products[0], warehouse=self.warehouse).update(quantity=3)
+            ProductStockSummary.refresh([self.products[0].id])
+
+        assert code_index.resolve('SKU000')['stock'] == 3
+
+    def test_invalidation_during_read_is_not_overwritten(self):
+        """El stock leído antes de una invalidación no vuelve a la caché"""
+        set_many = cache.set_many
+
+        def racing_set_many(data, timeout=None):
+            if any(key.startswith('pos:code_index:stock:') for key in data):
+                # Otra venta confirma entre la lectura y la escritura en caché
+                Stock.objects.filter(product=self.products[0], warehouse=self.warehouse).update(quantity=3)
+                code_index.invalidate_stock([self.products[0].id])
+            return set_many(data, timeout)
+
+        with mock.patch.object(cache, 'set_many', side_effect=racing_set_many):
+            assert code_index.resolve('SKU000')['stock'] == 10
+
+        assert code_index.resolve('SKU000')['stock'] == 3
+
+    @override_settings(POS_CODE_INDEX_CHECK_SECONDS=0)
+    def test_product_changes_reload_index(self):
+        """Un producto nuevo o desactivado se refleja tras confirmar"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[1].barcode = '123'
+            self.products[1].save()
+            Product.objects.filter(pk=self.products[0].pk).update(is_active=False)
+            self.products[0].refresh_from_db()
+            self.products[0].save()
+
+        assert code_index.resolve('123')['id'] == self.products[1].id
+        assert code_index.resolve('7701234567890') is None
+
+    def test_batch_scan_api(self):
+        """El API de lote resuelve varios códigos en orden"""
+        response = self.client.post('/api/pos/scan/', {
+            'codes': ['SKU001', 'NOEXISTE', '7701234567890'],
+            'warehouse_id': self.other_warehouse.id,
+        }, content_type='application/json')
+
+        assert response.status_code == 200
+        results = response.json()['results']
+        assert [result['found'] for result in results] == [True, False, True]
+        assert results[0]['product']['stock'] == 5
+        assert results[2]['product']['id'] == self.products[0].id
+
+    def test_barcode_view_uses_main_warehouse(self):
+        """La vista de escaneo informa el stock de la bodega principal"""
+        response = self.client.post(reverse('pos:barcode_scan'), {'barcode': '7701234567890'})
+        assert response.json()['product']['stock'] == 10
@@ -0,0 +1,152 @@
+"""
+Pruebas para la recepción de compras
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from audit.models import InventoryTrace
+from catalog.models import Product
+from inventory.models import Stock, StockMovement
+from purchases.models import Purchase, PurchaseItem, PurchaseReceipt, Supplier
+from purchases.services import PurchaseReceiveError, receive_purchase
+from purchases.totals import deferred_totals
+from tests.test_catalog import CatalogTestMixin
+
+
+class ReceivePurchaseTests(CatalogTestMixin, TestCase):
+    """Pruebas para purchases.services.receive_purchase"""
+
+    def setUp(self):
+        self.create_catalog()
+        self.user = User.objects.create_user(username='compras', password='testpass123')
+        self.supplier = Supplier.objects.create(name="Proveedor")
+
+    def create_purchase(self, products, quantity=2):
+        purchase = Purchase.objects.create(
+            supplier=self.supplier, order_date=date.today(), status='pending', created_by=self.user,
+        )
+        for product in products:
+            PurchaseItem.objects.create(
+                purchase=purchase, product=product, quantity=quantity, unit_cost=Decimal('1000.00'),
+            )
+        return purchase
+
+    def receive(self, purchase, number='R-1'):
+        return receive_purchase(purchase, PurchaseReceipt(receipt_number=number), self.user)
+
+    def test_adds_stock_and_records_traces(self):
+        """La recepción suma al stock de la bodega principal y deja una trazabilidad por línea"""
+        purchase = self.create_purchase(self.products[:2])
+
+        warehouse, created, items = self.receive(purchase)
+
+        assert warehouse == self.warehouse and not created
+        assert len(items) == 2
+        purchase.refresh_from_db()
+        assert purchase.status == 'received'
+        assert purchase.subtotal == Decimal('4000.00')
+        assert Stock.objects.get(product=self.products[0], warehouse=self.warehouse).quantity == 12
+        assert StockMovement.objects.filter(reference=f'Compra #{purchase.purchase_number}').count() == 2
+
+        trace = InventoryTrace.objects.get(purchase=purchase, product=self.products[1])
+        assert trace.movement_type == 'PURCHASE_RECEIPT'
+        assert (trace.stock_before, trace.stock_after) == (11, 13)
+        assert InventoryTrace.objects.filter(purchase=purchase).count() == 2
+
+    def test_cannot_receive_twice(self):
+        """Una compra recibida no vuelve a sumar stock"""
+        purchase = self.create_purchase(self.products[:1])
+        self.receive(purchase)
+
+        with self.assertRaises(PurchaseReceiveError):
+            self.receive(purchase, number='R-2')
+        assert Stock.objects.get(product=self.products[0], warehouse=self.warehouse).quantity == 12
+
+    def test_query_count_does_not_depend_on_lines(self):
+        """Recibir una compra usa las mismas consultas sin importar sus líneas"""
+        small = self.create_purchase(self.products[:1])
+        for i in range(20):
+            self.products.append(Product.objects.create(
+                name=f"Extra {i}", description="Descripción", sku=f"EXT{i:03d}",
+                price=10000, cost_price=6000, category=self.category, brand=self.brand,
+            ))
+        large = self.create_purchase(self.products)
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.receive(small, number='R-1')
+        with CaptureQueriesContext(connection) as large_queries:
+            self.receive(large, number='R-2')
+
+        assert len(large_queries.captured_queries) == len(small_queries.captured_queries)
+        assert Stock.objects.get(product=self.products[-1], warehouse=self.warehouse).quantity == 2
+
+    def test_receive_view(self):
+        """La vista de recepción usa el servicio"""
+        purchase = self.create_purchase(self.products[:1])
+        self.client.force_login(self.user)
+
+        response = self.client.post(
+            reverse('purchases:purchase_receive', args=[purchase.pk]), {'receipt_number': 'R-1', 'notes': ''}
+        )
+
+        assert response.status_code == 302
+        assert Stock.objects.get(product=self.products[0], warehouse=self.warehouse).quantity == 12
+        assert InventoryTrace.objects.filter(purchase=purchase).count() == 1
+
+
+class DeferredPurchaseTotalsTests(CatalogTestMixin, TestCase):
+    """Pruebas para el recálculo diferido de los totales de compras"""
+
+    def setUp(self):
+        self.create_catalog()
+        self.user = User.objects.create_user(username='compras', password='testpass123')
+        self.purchase = Purchase.objects.create(
+            supplier=Supplier.objects.create(name="Proveedor"), order_date=date.today(),
+            shipping_cost=Decimal('500.00'), created_by=self.user,
+        )
+
+    def add_items(self):
+        for product in self.products:
+            PurchaseItem.objects.create(
+                purchase=self.purchase, product=product, quantity=2, unit_cost=Decimal('1000.00'),
+                tax_percentage=Decimal('10.00'),
+            )
+
+    def test_items_do_not_recalculate_per_line(self):
+        """Dentro del bloque los items no leen la compra; al salir se recalcula una vez"""
+        with CaptureQueriesContext(connection) as ctx:
+            with deferred_totals():
+                self.add_items()
+                assert not any('SUM(' in query['sql'] for query in ctx.captured_queries)
+
+        assert sum('SUM(' in query['sql'] for query in ctx.captured_queries) == 1
+        self.purchase.refresh_from_db()
+        assert self.purchase.subtotal == Decimal('6000.00')
+        assert self.purchase.tax_amount == Decimal('600.00')
+        assert self.purchase.total == Decimal('7100.00')
+
+    def test_transaction_recalculates_on_commit(self):
+        """En una transacción los totales se calculan al hacer commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_items()
+            self.purchase.refresh_from_db()
+            assert self.purchase.subtotal == 0
+
+        self.purchase.refresh_from_db()
+        assert self.purchase.subtotal == Decimal('6000.00')
+
+    def test_deleting_items_updates_totals(self):
+        """Eliminar items recalcula la compra"""
+        with deferred_totals():
+            self.add_items()
+        with deferred_totals():
+            self.purchase.items.filter(product=self.products[0]).delete()
+
+        self.purchase.refresh_from_db()
+        assert self.purchase.subtotal == Decimal('4000.00')
@@ -0,0 +1,476 @@
+"""
+Pruebas para las métricas y reportes de ventas
+"""
+import gzip
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from audit.models import AuditReport
+from customers.models import Customer
+from orders.models import Order, OrderItem
+from pos.models import POSSale, POSSaleItem, POSSession
+from reports import jobs
+from reports.models import (
+    DailySalesFact, DailySalesRefresh, DailySalesTotal, ReportJob, ReportSchedule, ReportTemplate,
+)
+from reports.services import DashboardMetrics, SalesDocumentFeed
+from tests.test_catalog import CatalogTestMixin
+
+
+class SalesTestMixin(CatalogTestMixin):
+    """Órdenes web y ventas POS de prueba"""
+
+    def create_sales_data(self):
+        self.create_catalog(count=2)
+        self.user = User.objects.create_user(username='ventas', password='testpass123', is_staff=True)
+        self.customer = Customer.objects.create(
+            user=self.user,
+            document_type='CC',
+            document_number='111222333',
+            phone='+573001112233',
+            address='Calle 1 # 2-3',
+            city='Medellín',
+        )
+        self.session = POSSession.objects.create(user=self.user, warehouse=self.warehouse)
+
+    def create_order(self, total, status='paid', days_ago=0, product=None, quantity=1):
+        order = Order.objects.create(
+            customer=self.customer,
+            status=status,
+            payment_method='wompi',
+            subtotal=total,
+            total=total,
+            shipping_address='Calle 1 # 2-3',
+            shipping_city='Medellín',
+            shipping_phone='+573001112233',
+        )
+        if product is not None:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=quantity,
+                unit_price=Decimal(total) / quantity, iva_percentage=0,
+            )
+        self.backdate(order, days_ago)
+        return order
+
+    def create_pos_sale(self, total, days_ago=0, product=None, quantity=1):
+        sale = POSSale.objects.create(
+            session=self.session, order_type='auxiliar', payment_method='cash',
+            subtotal=total, total=total,
+        )
+        if product is not None:
+            POSSaleItem.objects.bulk_create([POSSaleItem(
+                sale=sale, product=product, quantity=quantity, unit_price=Decimal(total) / quantity,
+                iva_percentage=0, subtotal=total, iva_amount=0, discount_amount=0, total=total,
+            )])
+        self.backdate(sale, days_ago)
+        return sale
+
+    def backdate(self, instance, days_ago):
+        if days_ago:
+            created_at = timezone.now() - timedelta(days=days_ago)
+            type(instance).objects.filter(pk=instance.pk).update(created_at=created_at)
+            instance.created_at = created_at
+
+
+class DashboardMetricsTests(SalesTestMixin, TestCase):
+    """Pruebas para reports.services.DashboardMetrics"""
+
+    def setUp(self):
+        self.create_sales_data()
+        self.create_order(100, product=self.products[0], quantity=2)
+        self.create_order(50, status='new')
+        self.create_order(200, days_ago=3, product=self.products[1])
+        self.create_order(400, days_ago=20)
+        self.create_pos_sale(30, product=self.products[1], quantity=3)
+        self.create_pos_sale(70, days_ago=10)
+        call_command('rebuild_sales_facts', stdout=StringIO())
+
+    def test_period_totals_use_one_query(self):
+        """Los totales de todos los periodos salen de una sola consulta"""
+        metrics = DashboardMetrics()
+        with self.assertNumQueries(1):
+            periods = metrics.period_totals
+            total_orders = metrics.total_orders
+
+        assert periods['today']['orders'] == 3
+        assert periods['today']['sales'] == Decimal('130')
+        assert periods['week']['web_sales'] == Decimal('300')
+        assert periods['month']['sales'] == Decimal('800')
+        assert periods['month']['pos_sales'] == Decimal('100')
+        assert total_orders == 6
+
+    def test_daily_sales_fill_missing_days(self):
+        """La serie diaria tiene un valor por día, incluso sin ventas"""
+        daily = DashboardMetrics().daily_sales(days=7)
+
+        assert len(daily) == 7
+        assert daily[-1] == (timezone.localdate(), Decimal('130'))
+        assert daily[-4][1] == Decimal('200')
+        assert sum(total for _, total in daily) == Decimal('330')
+
+    def test_top_products_and_categories_combine_sources(self):
+        """Los productos y categorías suman ventas web y POS"""
+        metrics = DashboardMetrics()
+
+        top = metrics.top_products()
+        assert [(row['product'], row['total_sold']) for row in top] == [
+            (self.products[1], 4), (self.products[0], 2),
+        ]
+
+        categories = metrics.category_distribution()
+        assert categories[0]['category'] == self.category
+        assert categories[0]['web_sales'] == Decimal('300')
+        assert categories[0]['pos_sales'] == Decimal('30')
+
+    def test_orders_by_status_counts_pos_as_paid(self):
+        """Las ventas POS se suman a las órdenes pagadas"""
+        statuses = {row['status']: row['count'] for row in DashboardMetrics().orders_by_status()}
+        assert statuses == {'new': 1, 'paid': 5}
+
+    def test_admin_dashboard_renders(self):
+        """El dashboard del admin usa las métricas"""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('custom_admin:admin_dashboard'))
+
+        assert response.status_code == 200
+        assert response.context['today_orders'] == 3
+        assert response.context['top_products'][0]['product'] == self.products[1]
+
+    def test_admin_reports_render(self):
+        """Los reportes del admin leen los hechos diarios"""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('custom_admin:admin_reports'))
+
+        assert response.status_code == 200
+        assert response.context['sales_report']['total_sales'] == Decimal('800')
+        assert response.context['order_stats']['paid'] == 5
+        assert response.context['top_products'][0]['product'] == self.products[1]
+
+
+class DailySalesFactTests(SalesTestMixin, TestCase):
+    """Pruebas para la tabla de hechos de ventas diarias"""
+
+    def setUp(self):
+        self.create_sales_data()
+
+    def test_facts_update_on_commit(self):
+        """Al confirmar una venta se actualizan los hechos del día y canal afectados"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_order(100, product=self.products[0], quantity=2)
+            self.create_order(50, status='new')
+
+        fact = DailySalesFact.objects.get(channel='web')
+        assert fact.product == self.products[0]
+        assert fact.units == 2
+        assert fact.revenue == Decimal('100')
+
+        totals = dict(DailySalesTotal.objects.values_list('status', 'documents'))
+        assert totals == {'paid': 1, 'new': 1}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.filter(status='new').delete()
+        assert not DailySalesTotal.objects.filter(status='new').exists()
+
+    def assert_facts_match_rebuild(self):
+        facts = set(DailySalesFact.objects.values_list(
+            'date', 'channel', 'product', 'payment_method', 'units', 'revenue', 'cost'))
+        totals = set(DailySalesTotal.objects.values_list(
+            'date', 'channel', 'payment_method', 'status', 'documents', 'total'))
+        call_command('rebuild_sales_facts', stdout=StringIO())
+        assert facts == set(DailySalesFact.objects.values_list(
+            'date', 'channel', 'product', 'payment_method', 'units', 'revenue', 'cost'))
+        assert totals == set(DailySalesTotal.objects.values_list(
+            'date', 'channel', 'payment_method', 'status', 'documents', 'total'))
+
+    def test_document_changes_apply_deltas(self):
+        """Editar, pagar y borrar documentos deja los mismos hechos que reconstruirlos"""
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.create_order(100, status='new', product=self.products[0], quantity=2)
+            self.create_pos_sale(30, product=self.products[1], quantity=3)
+        assert not DailySalesFact.objects.filter(channel='web').exists()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'paid'
+            order.save()
+        assert DailySalesFact.objects.get(channel='web').units == 2
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item = order.items.get()
+            item.quantity = 5
+            item.save()
+            OrderItem.objects.create(order=order, product=self.products[1], quantity=1,
+                                     unit_price=Decimal('10'), iva_percentage=0)
+        self.assert_facts_match_rebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.items.filter(product=self.products[1]).delete()
+            POSSale.objects.all().delete()
+        assert not DailySalesFact.objects.filter(channel='pos').exists()
+        assert not DailySalesTotal.objects.filter(channel='pos').exists()
+        self.assert_facts_match_rebuild()
+
+    def test_write_cost_does_not_depend_on_day_volume(self):
+        """Confirmar una venta no vuelve a leer las ventas del día"""
+        def checkout_queries():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_order(100, product=self.products[0])
+            with CaptureQueriesContext(connection) as ctx:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.create_order(100, product=self.products[0])
+            return len(ctx.captured_queries)
+
+        first = checkout_queries()
+        for _ in range(5):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_order(100, product=self.products[1])
+        assert checkout_queries() == first
+        assert DailySalesFact.objects.get(product=self.products[0]).units == 4
+
+    def test_rebuild_command_backfills_history(self):
+        """El comando reconstruye los hechos de días anteriores"""
+        self.create_order(200, days_ago=3, product=self.products[1])
+        self.create_pos_sale(30, days_ago=1, product=self.products[1], quantity=3)
+        DailySalesFact.objects.all().delete()
+        DailySalesTotal.objects.all().delete()
+
+        call_command('rebuild_sales_facts', stdout=StringIO())
+
+        assert DailySalesFact.objects.filter(channel='web', units=1).count() == 1
+        assert DailySalesFact.objects.get(channel='pos').units == 3
+        assert DailySalesTotal.objects.get(channel='pos').total == Decimal('30')
+
+    def test_failed_refresh_marks_day_dirty(self):
+        """Una actualización fallida se registra, marca el día y el comando lo repite"""
+        DailySalesFact.objects.all().delete()
+        with mock.patch.object(DailySalesFact, 'apply', side_effect=RuntimeError('sin conexión')):
+            with self.assertLogs('reports.signals', level='ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.create_order(100, product=self.products[0], quantity=2)
+
+        state = DailySalesRefresh.objects.get(channel='web')
+        assert state.is_dirty
+        assert not DailySalesFact.objects.exists()
+
+        call_command('rebuild_sales_facts', dirty=True, stdout=StringIO())
+
+        state.refresh_from_db()
+        assert not state.is_dirty and state.refreshed_at is not None
+        assert DailySalesFact.objects.get(channel='web').units == 2
+
+
+class SalesDocumentFeedTests(SalesTestMixin, TestCase):
+    """Pruebas para el feed unificado de órdenes web y ventas POS"""
+
+    def setUp(self):
+        self.create_sales_data()
+        self.documents = []
+        for days_ago in range(7, 0, -1):
+            if days_ago % 2:
+                self.documents.append(('web', self.create_order(10, days_ago=days_ago)))
+            else:
+                self.documents.append(('pos', self.create_pos_sale(10, days_ago=days_ago)))
+        self.documents.reverse()
+
+    def feed(self):
+        return SalesDocumentFeed(web_orders=Order.objects.all(), pos_sales=POSSale.objects.all())
+
+    def test_pages_follow_cursors_in_both_directions(self):
+        """Los cursores recorren el feed sin repetir ni saltar documentos"""
+        first = self.feed().page(size=3)
+        second = self.feed().page(after=first.next_cursor, size=3)
+        last = self.feed().page(after=second.next_cursor, size=3)
+
+        assert list(first) + list(second) + list(last) == self.documents
+        assert not first.has_previous and not last.has_next
+
+        back = self.feed().page(before=second.previous_cursor, size=3)
+        assert list(back) == list(first)
+        assert not back.has_previous
+
+    def test_empty_page_keeps_cursor_to_go_back(self):
+        """Una página vacía conserva el cursor para volver a la anterior"""
+        first = self.feed().page(size=3)
+        second = self.feed().page(after=first.next_cursor, size=3)
+        self.documents[-1][1].delete()
+
+        empty = self.feed().page(after=second.next_cursor, size=3)
+
+        assert list(empty) == [] and not empty.has_next
+        assert empty.previous_cursor == second.next_cursor
+        back = self.feed().page(before=empty.previous_cursor, size=3)
+        assert list(back) == self.documents[2:5] and back.has_next
+
+    def test_same_timestamp_documents_are_not_lost(self):
+        """Documentos con la misma fecha se ordenan por tipo e id"""
+        created_at = timezone.now()
+        Order.objects.update(created_at=created_at)
+        POSSale.objects.update(created_at=created_at)
+
+        seen = []
+        page = self.feed().page(size=2)
+        seen.extend(page)
+        while page.has_next:
+            page = self.feed().page(after=page.next_cursor, size=2)
+            seen.extend(page)
+
+        assert len(seen) == len(set(seen)) == 7
+
+    def test_page_queries_do_not_depend_on_history(self):
+        """Una página es una consulta de unión más una carga por tipo"""
+        with self.assertNumQueries(3):
+            list(self.feed().page(size=3))
+
+    def test_admin_orders_lists_both_sources(self):
+        """La vista de órdenes del admin usa el feed"""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('custom_admin:admin_orders'), {'order_type': 'pos'})
+
+        assert response.status_code == 200
+        assert [order['order_type'] for order in response.context['orders']] == ['pos'] * 3
+
+        response = self.client.get(reverse('custom_admin:admin_customer_orders', args=[self.customer.pk]))
+        assert response.status_code == 200
+        assert len(response.context['orders']) == 4
+
+
+class ReportExportTests(SalesTestMixin, TestCase):
+    """Pruebas para la exportación de reportes en CSV y XLSX"""
+
+    def setUp(self):
+        self.create_sales_data()
+        self.order = self.create_order(100)
+        self.create_order(50, status='new')
+        self.client.force_login(self.user)
+
+    def export(self, report_type, **params):
+        return self.client.get(reverse('reports:report_export', args=[report_type]), params)
+
+    def test_sales_csv_is_streamed(self):
+        """El CSV se entrega por partes y con las etiquetas de las opciones"""
+        response = self.export('sales', status='paid')
+
+        assert response.streaming
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        assert len(lines) == 2
+        assert lines[1].startswith(f'{self.order.order_number},{self.user.get_full_name()},Pagado')
+
+    def test_products_export_uses_one_query(self):
+        """El stock total se lee en la misma consulta de productos"""
+        response = self.export('products')
+        with self.assertNumQueries(1):
+            lines = b''.join(response.streaming_content).decode().splitlines()
+
+        assert len(lines) == 3
+        assert lines[1].split(',')[7] == '15'
+
+    def test_xlsx_export(self):
+        """El XLSX se genera en modo de solo escritura"""
+        openpyxl = pytest.importorskip('openpyxl')
+
+        response = self.export('inventory', format='xlsx')
+        assert response['Content-Type'].startswith('application/vnd.openxmlformats')
+
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+        rows = list(workbook.active.values)
+        assert rows[0][0] == 'Producto'
+        assert len(rows) == 1 + 2 * len(self.products)
+
+    def test_unknown_format_is_rejected(self):
+        """Un formato desconocido responde 400"""
+        assert self.export('sales', format='pdf').status_code == 400
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportJobTests(SalesTestMixin, TestCase):
+    """Pruebas para los reportes generados en segundo plano"""
+
+    def setUp(self):
+        self.create_sales_data()
+        self.create_order(100)
+        self.create_order(50, status='new')
+        self.client.force_login(self.user)
+
+    def read_artifact(self, job):
+        with job.artifact.open('rb') as artifact:
+            return gzip.decompress(artifact.read()).decode().splitlines()
+
+    def test_worker_writes_compressed_artifact(self):
+        """El worker genera el archivo y registra filas y duración"""
+        response = self.client.post(reverse('reports:report_job_create', args=['sales']))
+        assert response.status_code == 202
+        job = ReportJob.objects.get(pk=response.json()['job_id'])
+        assert job.status == 'pending'
+
+        call_command('report_worker', '--once', stdout=StringIO())
+
+        job.refresh_from_db()
+        assert job.status == 'completed'
+        assert job.row_count == 2
+        assert job.duration is not None
+        assert len(self.read_artifact(job)) == 3
+
+        response = self.client.get(reverse('reports:report_job_download', args=[job.pk]))
+        assert response.status_code == 200
+
+    def test_identical_requests_reuse_artifact(self):
+        """Los mismos parámetros se sirven desde el archivo ya generado"""
+        first = jobs.submit('report', 'sales', {'status': 'paid', 'end_date': ''})
+        assert jobs.submit('report', 'sales', {'status': 'paid'}) == first
+
+        jobs.run_pending()
+        cached = jobs.submit('report', 'sales', {'status': 'paid', 'format': 'csv'})
+        assert cached == first
+        assert cached.is_completed
+        assert jobs.submit('report', 'sales', {'status': 'new'}) != first
+
+    def test_due_schedules_are_enqueued_and_advanced(self):
+        """Las programaciones vencidas se ejecutan y avanzan su siguiente fecha"""
+        template = ReportTemplate.objects.create(
+            name='Ventas', report_type='sales', template_data={}, created_by=self.user
+        )
+        now = timezone.now()
+        schedule = ReportSchedule.objects.create(
+            name='Ventas diarias', template=template, frequency='monthly',
+            email_recipients='gerencia@example.com', next_run=now - timedelta(hours=1),
+            created_by=self.user,
+        )
+
+        queued = jobs.enqueue_due_schedules(now)
+        assert jobs.enqueue_due_schedules(now) == []
+        jobs.run_pending()
+
+        schedule.refresh_from_db()
+        assert schedule.last_run == now
+        assert schedule.next_run > now
+        assert ReportJob.objects.get(pk=queued[0].pk).status == 'completed'
+        assert mail.outbox[0].to == ['gerencia@example.com']
+        assert mail.outbox[0].attachments
+
+    def test_audit_report_is_generated_off_request(self):
+        """El reporte de auditoría queda pendiente hasta que corre el worker"""
+        self.user.is_superuser = True
+        self.user.save()
+
+        response = self.client.post(reverse('audit:generate_report'), {'report_type': 'USER_ACTIVITY'})
+        report = AuditReport.objects.get(pk=response.json()['report_id'])
+        assert report.status == 'PENDING'
+
+        jobs.run_pending()
+
+        report.refresh_from_db()
+        assert report.status == 'COMPLETED'
+        assert report.file_path.endswith('.csv.gz')